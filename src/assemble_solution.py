@@ -2,81 +2,360 @@ import json
 import csv
 import os
 import sys
+from datetime import datetime
 import pandas as pd
 
-from ml.final_eval_v1 import ml_stage
+from ml import final_eval_v1
+from ml.final_eval_v1 import PREDICTOR_PATH, PREDICTED, RULE_REJECT, ml_stage, list_json_2_df, prediction_frame, load_predictor
 
 # Add the preprocessing directory to the Python path
 sys.path.append(os.path.join(os.path.dirname(__file__), "preprocessing"))
 
 from main import preprocessing_stage
+from read import iter_client_jsons
+from inconsistency_analysis import STATIC_ANALYSIS_DOCUMENTS, static_analysis, static_analysis_version
+from rules import date_checks_expire
+from manifest import client_digest, code_version, open_manifest
+from pipeline_metrics import stage
 
-def avengers_assemble():
+# Documents the ML features are built from (the label is dropped before predicting)
+FEATURE_DOCUMENTS = ["passport", "client_profile", "account_form", "client_description"]
+# Manifest of the in-memory pipeline, kept in its checkpoint folder
+MANIFEST_FILE_NAME = "manifest.json"
+
+def client_order(client_id):
+    """Sort key of a client ID: client_N sorts by N, the order every stage writes clients in."""
+    return int(client_id.rsplit("_", 1)[1])
+
+
+def iter_preprocessing_scores(output_preprocessing_path, backend="json"):
     """
-    Main function to assemble the solution pipeline.
+    Yields (client_id, preprocessing score, actual label) for every client in numeric client
+    order. The actual label ("Accept"/"Reject") is None for clients without a label document.
+
+    Args:
+        output_preprocessing_path (str): Folder of client JSON files, or the columnar client store.
+        backend (str): "json" for one file per client, "parquet" for a columnar client store.
     """
-    # Define input and output paths
-    input_train_path = os.path.join(os.path.dirname(__file__), "input")
-    output_preprocessing_path = os.path.join(os.path.dirname(__file__), "preprocessing", "all_clients")
-    output_csv_path = os.path.join(os.path.dirname(__file__), "output", "solution.csv")
-    ml_predictions_path = os.path.join(os.path.dirname(__file__), "ml", "intermediate.csv")
+    if backend == "parquet":
+        from client_store import iter_client_store
 
-    # Step 1: Preprocessing stage
-    preprocessing_stage(input_train_path, output_preprocessing_path)
+        # Only the internal_score and label columns are read from the store
+        for client_id, client_data in iter_client_store(output_preprocessing_path, documents=["internal_score", "label"]):
+            yield (client_id, client_data.get("internal_score", {}).get("preprocessing", False),
+                   client_data.get("label", {}).get("label"))
+        return
 
-    # Step 2: ML stage
-    ml_stage()
+    # Iterate through processed client files in numeric order
+    for client_file_name in sorted(os.listdir(output_preprocessing_path), key=lambda x: int(os.path.splitext(x)[0].split('_')[1])):
+        client_file_path = os.path.join(output_preprocessing_path, client_file_name)
+        if client_file_name.endswith('.json'):
+            # Load client data
+            with open(client_file_path, 'r', encoding='utf-8') as client_file:
+                client_data = json.load(client_file)
 
-    # Step 2: Load ML predictions
-    print("Loading ML predictions...")
-    if not os.path.exists(ml_predictions_path):
-        raise FileNotFoundError(f"ML predictions file not found at {ml_predictions_path}")
-    ml_predictions = pd.read_csv(ml_predictions_path)["label"].tolist()
+            client_id = os.path.splitext(client_file_name)[0]  # Remove .json extension
+            yield (client_id, client_data.get("internal_score", {}).get("preprocessing", False),
+                   client_data.get("label", {}).get("label"))
 
-    # Step 3: Write results to CSV and calculate accuracy
-    print("Writing results to CSV and calculating accuracy...")
-    os.makedirs(os.path.dirname(output_csv_path), exist_ok=True)
 
-    total_clients = 0
-    correct_predictions = 0
+def iter_ml_predictions(ml_predictions_path):
+    """
+    Streams (client_id, ML label) from the predictions CSV of ml_stage, in file order. The label
+    is None for the clients ml_stage did not predict (outcome "rule-reject").
+
+    Args:
+        ml_predictions_path (str): CSV with client_id, label and optionally outcome columns.
+    """
+    with open(ml_predictions_path, "r", newline="", encoding="utf-8") as csvfile:
+        reader = csv.DictReader(csvfile)
+        if "client_id" not in (reader.fieldnames or []):
+            raise ValueError(f"{ml_predictions_path} has no client_id column, rerun the ML stage to key the predictions.")
+        for row in reader:
+            if row.get("outcome", PREDICTED) == RULE_REJECT:
+                yield row["client_id"], None
+            else:
+                yield row["client_id"], int(float(row["label"]))
 
-    with open(output_csv_path, 'w', newline='', encoding='utf-8') as csvfile:
-        csv_writer = csv.writer(csvfile, delimiter=';')
 
-        # Iterate through processed client files in numeric order
-        for idx, client_file_name in enumerate(sorted(os.listdir(output_preprocessing_path), key=lambda x: int(os.path.splitext(x)[0].split('_')[1]))):
-            client_file_path = os.path.join(output_preprocessing_path, client_file_name)
-            if client_file_name.endswith('.json'):
-                # Load client data
-                with open(client_file_path, 'r', encoding='utf-8') as client_file:
-                    client_data = json.load(client_file)
+def _in_client_order(rows, source):
+    # The merge join needs both inputs sorted by client_order, each client once
+    previous = None
+    for row in rows:
+        order = client_order(row[0])
+        if previous is not None and order <= previous[0]:
+            raise ValueError(f"{source} is not in client order: {row[0]} after {previous[1]}.")
+        previous = (order, row[0])
+        yield row
 
-                # Extract preprocessing score
-                preprocessing_score = client_data.get("internal_score", {}).get("preprocessing", False)
 
-                # Determine decision
+def merge_join_decisions(preprocessing_scores, ml_predictions, output_csv_path, max_reported=5):
+    """
+    Writes the solution CSV from two client-ordered streams, joined on client_id: a client is
+    accepted if it passed the static analysis and its ML label is 1. Neither input is held in
+    memory, and the CSV is only put in place if every permitted client had a prediction and
+    every prediction a client.
+
+    Args:
+        preprocessing_scores (iterable): (client_id, preprocessing score, actual label or None),
+            see iter_preprocessing_scores.
+        ml_predictions (iterable): (client_id, ML label or None), see iter_ml_predictions.
+            Rejected clients need no prediction.
+        output_csv_path (str): Path of the ;-delimited solution CSV.
+        max_reported (int): Client IDs listed per coverage problem in the error message.
+
+    Returns:
+        dict: clients, accepted, labelled (clients with an actual label), correct (decisions
+        equal to it) and accuracy (None without labels).
+    """
+    stats = {"clients": 0, "accepted": 0, "labelled": 0, "correct": 0}
+    missing = {"count": 0, "ids": []}
+    unmatched = {"count": 0, "ids": []}
+
+    def report(problem, client_id):
+        problem["count"] += 1
+        if len(problem["ids"]) < max_reported:
+            problem["ids"].append(client_id)
+
+    predictions = _in_client_order(ml_predictions, "ML predictions")
+    prediction = next(predictions, None)
+
+    os.makedirs(os.path.dirname(output_csv_path), exist_ok=True)
+    tmp_path = f"{output_csv_path}.tmp"
+    try:
+        with open(tmp_path, "w", newline="", encoding="utf-8") as csvfile:
+            csv_writer = csv.writer(csvfile, delimiter=";")
+            for client_id, preprocessing_score, actual_label in _in_client_order(preprocessing_scores, "Preprocessing scores"):
+                order = client_order(client_id)
+                # Predictions of clients the preprocessing output does not have
+                while prediction is not None and client_order(prediction[0]) < order:
+                    report(unmatched, prediction[0])
+                    prediction = next(predictions, None)
+
+                ml_prediction = None
+                if prediction is not None and client_order(prediction[0]) == order:
+                    ml_prediction = prediction[1]
+                    prediction = next(predictions, None)
+
                 if not preprocessing_score:
                     decision = "Reject"
+                elif ml_prediction is None:
+                    report(missing, client_id)
+                    decision = "Reject"
                 else:
-                    # Use ML prediction if preprocessing score is True
-                    ml_prediction = ml_predictions[idx]
                     decision = "Accept" if ml_prediction == 1 else "Reject"
 
-                # Extract the actual label
-                # actual_label = client_data.get("label", {}).get("label", "")
+                stats["clients"] += 1
+                stats["accepted"] += decision == "Accept"
+                if actual_label is not None:
+                    stats["labelled"] += 1
+                    stats["correct"] += decision == actual_label
+                csv_writer.writerow([client_id, decision])
 
-                # Compare decision with actual label
-                # if decision == actual_label:
-                #     correct_predictions += 1
-                # total_clients += 1
+        while prediction is not None:
+            report(unmatched, prediction[0])
+            prediction = next(predictions, None)
 
-                # Write client ID and decision to the CSV
-                client_id = os.path.splitext(client_file_name)[0]  # Remove .json extension
-                csv_writer.writerow([client_id, decision])
+        if missing["count"] or unmatched["count"]:
+            raise ValueError(
+                f"Predictions do not cover the clients: {missing['count']} permitted clients without a prediction "
+                f"{missing['ids']}, {unmatched['count']} predictions of unknown clients {unmatched['ids']}."
+            )
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, output_csv_path)
+    stats["accuracy"] = stats["correct"] / stats["labelled"] if stats["labelled"] else None
+    return stats
+
+
+def predictor_version(predictor=None):
+    """
+    Version of the predictions (see manifest.code_version): the frame builder, the files of the
+    predictor (the given one, or the one load_predictor loads) and the model it predicts with.
+    """
+    if predictor is None:
+        predictor_path, model = os.getenv("ML_PREDICTOR_PATH", PREDICTOR_PATH), os.getenv("ML_PREDICTOR_MODEL")
+    else:
+        predictor_path, model = getattr(predictor, "path", None) or "", getattr(predictor, "model_best", None)
+    files = [os.path.join(predictor_path, name) for name in ["predictor.pkl", "learner.pkl", "metadata.json"]]
+    return code_version(final_eval_v1.__file__, *files, extra={"model": model})
+
+
+def _incremental(checkpoint_dir, name, stage, version, digests, compute, now=None, expires=None):
+    """
+    Runs one per-client pipeline stage. With a checkpoint_dir, only the clients whose input digest
+    or stage version changed since the last run (see manifest.py) are computed; the rows of the
+    others are reused from checkpoint_dir/name, which is then updated.
+
+    Args:
+        checkpoint_dir (str): Folder of the stage results and the manifest, None to compute all.
+        name (str): File name of the stage result.
+        stage (str): Stage name in the manifest.
+        version (str): Current version of the stage code.
+        digests (dict): Input digest per client_id, in output order.
+        compute (callable): compute(client_ids) -> DataFrame indexed by those client_ids.
+        now (datetime): Time the stage runs at, for results that expire (default the current time).
+        expires (callable): expires(client_id) -> datetime from which the newly computed result of
+            the client is stale, or None; for stages that depend on the date.
+
+    Returns:
+        pd.DataFrame: The stage result of every client of digests.
+    """
+    if checkpoint_dir is None:
+        return compute(list(digests))
+    path = os.path.join(checkpoint_dir, name)
+    manifest = open_manifest(os.path.join(checkpoint_dir, MANIFEST_FILE_NAME), stage, version)
+    previous = pd.read_parquet(path) if os.path.exists(path) else None
+    stale = [
+        client_id for client_id, digest in digests.items()
+        if previous is None or client_id not in previous.index or not manifest.is_current(client_id, digest, now)
+    ]
+    stale_ids = set(stale)
+    kept = [client_id for client_id in digests if client_id not in stale_ids]
+
+    frames = [previous.loc[kept]] if kept else []
+    if stale or not frames:
+        frames.append(compute(stale))
+    result = pd.concat(frames).reindex(list(digests))
+
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    result.to_parquet(path)
+    for client_id in stale:
+        manifest.record(client_id, digests[client_id], expires(client_id) if expires else None)
+    manifest.save()
+    print(f"{stage}: {len(stale)} of {len(digests)} clients computed, {len(kept)} reused from {path}")
+    return result
+
+
+def run_pipeline_in_memory(input_path, output_csv_path, checkpoint_dir=None, predictor=None, num_workers=1):
+    """
+    Runs zip ingest, static analysis, feature build, prediction and the decision on one client
+    table in memory, without the per-client JSON files and ml/intermediate.csv of the staged
+    pipeline. Every stage result is indexed by client_id, and the decision joins on it.
+
+    Args:
+        input_path (str): Path to the folder containing the client zip files.
+        output_csv_path (str): Path of the solution CSV to write.
+        checkpoint_dir (str): Optional folder to keep each stage result in, with a manifest of
+            the client digests and stage versions they were computed from. A rerun reads the
+            zips again and computes each stage only for the clients whose documents or stage
+            code changed (e.g. the new and amended profiles of a daily delta); delete the folder
+            to rerun everything.
+        predictor: Trained predictor with a predict(DataFrame) method, load_predictor() if None.
+        num_workers (int): Number of worker processes used to unpack the client zips.
+
+    Returns:
+        pd.DataFrame: preprocessing, explanation, label (ML prediction, missing for the clients
+        the static analysis rejected), outcome (PREDICTED or RULE_REJECT) and decision per client_id.
+    """
+    # Step 1: Zip ingest, the input every stage's changes are detected on
+    print("Reading client zips...")
+    with stage("zip_ingest"):
+        clients = {f"client_{idx}": client_data for idx, client_data in enumerate(iter_client_jsons(input_path, num_workers=num_workers))}
+
+    # Step 2: Static analysis (scores only, the client dicts stay untouched for the ML features).
+    # Its results depend on the date, and expire when a date check of the client could turn.
+    print("Running static analysis...")
+    now = datetime.now()
+    @stage("static_analysis")
+    def analyse(client_ids):
+        # static_analysis adds internal_score to the (shallow) copy of each client
+        internal_scores = [static_analysis(dict(clients[client_id]), path=client_id, now=now)["internal_score"]
+                           for client_id in client_ids]
+        return pd.DataFrame(internal_scores, index=pd.Index(client_ids, name="client_id"))
+    scores = _incremental(
+        checkpoint_dir, "internal_scores.parquet", "static_analysis", static_analysis_version(),
+        {client_id: client_digest(client_data, STATIC_ANALYSIS_DOCUMENTS) for client_id, client_data in clients.items()},
+        analyse, now=now, expires=lambda client_id: date_checks_expire(clients[client_id], now),
+    )
+
+    # Steps 3 and 4 only run on the clients the static analysis permitted, the decision rejects
+    # the others anyway
+    feature_digests = {
+        client_id: client_digest(clients[client_id], FEATURE_DOCUMENTS)
+        for client_id in scores.index[scores["preprocessing"].astype(bool)]
+    }
+
+    # Step 3: Feature build, the same flattened frame ml_stage predicts on
+    print("Building features...")
+    @stage("ml_frame")
+    def build_features(client_ids):
+        features = list_json_2_df([clients[client_id] for client_id in client_ids]).drop(columns=["label"], errors="ignore")
+        features.index = pd.Index(client_ids, name="client_id")
+        return features
+    features = _incremental(checkpoint_dir, "features.parquet", "features", code_version(final_eval_v1.__file__),
+                            feature_digests, build_features)
+
+    # Step 4: Prediction, the predictor is only loaded if some client needs it
+    print("Predicting...")
+    @stage("predict")
+    def predict(client_ids):
+        index = pd.Index(client_ids, name="client_id")
+        if not client_ids:
+            return pd.DataFrame({"label": pd.Series(dtype="Int64", index=index)})
+        ml_predictor = predictor or load_predictor()
+        y_pred = ml_predictor.predict(prediction_frame(features.loc[client_ids], ml_predictor))
+        return pd.DataFrame({"label": pd.Series(y_pred, index=index)})
+    predictions = _incremental(checkpoint_dir, "predictions.parquet", "prediction", predictor_version(predictor),
+                               feature_digests, predict)
+
+    # Step 5: Decision, joined on client_id
+    result = scores.join(predictions, how="left")
+    result["outcome"] = [PREDICTED if predicted else RULE_REJECT for predicted in result.index.isin(predictions.index)]
+    result["decision"] = (result["preprocessing"].astype(bool) & (result["label"] == 1)).map({True: "Accept", False: "Reject"})
+
+    os.makedirs(os.path.dirname(output_csv_path), exist_ok=True)
+    with stage("csv_assembly"):
+        result["decision"].to_csv(output_csv_path, sep=";", header=False)
+    print(f"Solution written to {output_csv_path}: {(result['decision'] == 'Accept').sum()} / {len(result)} accepted")
+    return result
+
+
+def avengers_assemble(backend="json"):
+    """
+    Main function to assemble the solution pipeline.
+
+    Args:
+        backend (str): "json" to pass clients between stages as one file per client,
+            "parquet" to use the columnar client store (see preprocessing/client_store.py),
+            "memory" to run all stages on one in-memory client table (see run_pipeline_in_memory).
+    """
+    # Define input and output paths
+    input_train_path = os.path.join(os.path.dirname(__file__), "input")
+    if backend == "parquet":
+        output_preprocessing_path = os.path.join(os.path.dirname(__file__), "preprocessing", "client_store")
+    else:
+        output_preprocessing_path = os.path.join(os.path.dirname(__file__), "preprocessing", "all_clients")
+    output_csv_path = os.path.join(os.path.dirname(__file__), "output", "solution.csv")
+    ml_predictions_path = os.path.join(os.path.dirname(__file__), "ml", "intermediate.csv")
+
+    if backend == "memory":
+        run_pipeline_in_memory(input_train_path, output_csv_path)
+        return
+
+    # Step 1: Preprocessing stage
+    preprocessing_stage(input_train_path, output_preprocessing_path, backend=backend)
+
+    # Step 2: ML stage, on the clients the static analysis permitted only
+    ml_stage({client_id: score for client_id, score, _ in iter_preprocessing_scores(output_preprocessing_path, backend)})
+
+    # Step 3: Join the preprocessing scores and the ML predictions on client_id, write the
+    # results to CSV and calculate accuracy in the same pass
+    print("Writing results to CSV and calculating accuracy...")
+    if not os.path.exists(ml_predictions_path):
+        raise FileNotFoundError(f"ML predictions file not found at {ml_predictions_path}")
+
+    with stage("csv_assembly"):
+        stats = merge_join_decisions(iter_preprocessing_scores(output_preprocessing_path, backend),
+                                     iter_ml_predictions(ml_predictions_path), output_csv_path)
 
-    # Calculate and print accuracy
-    accuracy = correct_predictions / total_clients if total_clients > 0 else 0
-    print(f"Accuracy: {accuracy:.2%}")
+    print(f"Solution written to {output_csv_path}: {stats['accepted']} / {stats['clients']} accepted")
+    if stats["accuracy"] is None:
+        print("Accuracy: no labels")
+    else:
+        print(f"Accuracy: {stats['accuracy']:.2%} on {stats['labelled']} labelled clients")
 
 if __name__ == "__main__":
     avengers_assemble()
\ No newline at end of file
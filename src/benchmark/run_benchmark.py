@@ -0,0 +1,166 @@
+import os
+import sys
+import time
+import shutil
+import resource
+import tempfile
+import multiprocessing
+from pathlib import Path
+
+import pandas as pd
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for stage_dir in ["preprocessing", "feature_extraction", "ml"]:
+    sys.path.append(os.path.join(SRC_DIR, stage_dir))
+
+from read import extract_and_merge_jsons
+from inconsistency_analysis import load_process_all
+from llm import ClientFeatures
+from local_features import extract_local_features, estimate_free_text_features
+from extract_features import load_and_format_client_json, process_client, write_numeric_features
+from exchange_rates import get_current_exchange_rates
+from final_eval_v1 import extract_and_merge_jsons_2_list, list_json_2_df, prediction_frame, load_predictor
+from synthetic_clients import INCONSISTENCY_RATE, write_synthetic_zips
+
+BENCHMARK_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+RESULTS_PATH = Path(__file__).resolve().parent / "results.csv"
+
+
+def stub_llm_features(client_json):
+    """
+    Deterministic stand-in for the LLM reply: every ClientFeatures field computed offline from the
+    client (see local_features.py), so benchmark runs need no API key and are reproducible.
+    """
+    features = extract_local_features(client_json)
+    features.update(estimate_free_text_features(client_json))
+    return {name: features[name] for name in ClientFeatures.model_fields}
+
+
+def _reset_peak_rss():
+    # Linux resets the high-water mark of the resident set on "5"; elsewhere the peak stays the
+    # peak of the whole process
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _peak_rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes on Linux
+    return max_rss / 1024 / 1024 if sys.platform == "darwin" else max_rss / 1024
+
+
+def benchmark_size(n_clients, work_dir=None, seed=0, inconsistency_rate=INCONSISTENCY_RATE, predict=True):
+    """
+    Runs the pipeline stages on n_clients synthetic clients and times each of them: zip ingest
+    (extract_and_merge_jsons), static analysis (load_process_all), the LLM stub and the append_*
+    enrichment of process_client, the float32 matrix of the numeric features for comparison
+    (write_numeric_features), and the ml_stage steps (the list_json_2_df frame and the
+    predictor). Run it in a fresh process (see run_benchmarks), so the peak RSS is that of this size.
+
+    Args:
+        n_clients (int): Number of synthetic clients.
+        work_dir (str): Parent folder of the temporary client files, the system temp folder if None.
+        seed (int): Seed of the synthetic clients.
+        inconsistency_rate (float): Share of clients with an injected inconsistency.
+        predict (bool): Whether to time the trained predictor as well (needs AutoGluon).
+
+    Returns:
+        list: One dict per stage with clients, stage, items (clients the stage handled), seconds,
+        clients_per_s and peak_rss_mb (highest resident memory during the stage).
+    """
+    run_dir = tempfile.mkdtemp(prefix=f"benchmark_{n_clients}_", dir=work_dir)
+    input_dir = os.path.join(run_dir, "input")
+    clients_dir = os.path.join(run_dir, "all_clients")
+    features_dir = Path(run_dir) / "extracted_features"
+    features_dir.mkdir()
+    rows = []
+
+    def timed(stage, items, fn):
+        _reset_peak_rss()
+        start = time.perf_counter()
+        result = fn()
+        seconds = time.perf_counter() - start
+        rows.append({
+            "clients": n_clients, "stage": stage, "items": items, "seconds": seconds,
+            "clients_per_s": items / seconds if seconds > 0 else float("nan"), "peak_rss_mb": _peak_rss_mb(),
+        })
+        print(f"[{n_clients}] {stage}: {items} in {seconds:.2f}s ({rows[-1]['clients_per_s']:.0f}/s, peak RSS {rows[-1]['peak_rss_mb']:.0f} MB)")
+        return result
+
+    try:
+        inconsistencies = timed("generate", n_clients, lambda: write_synthetic_zips(
+            input_dir, n_clients, seed=seed, inconsistency_rate=inconsistency_rate))
+        timed("extract_and_merge_jsons", n_clients, lambda: extract_and_merge_jsons(input_dir, clients_dir))
+        timed("static_analysis", n_clients, lambda: load_process_all(clients_dir))
+
+        client_files = sorted(Path(clients_dir).glob("client_*.json"), key=lambda path: int(path.stem.split("_")[1]))
+        clients = [(path.stem, load_and_format_client_json(path)) for path in client_files]
+        permitted = [(name, client_json) for name, client_json in clients
+                     if client_json.get("internal_score", {}).get("preprocessing", False)]
+        missed = sum(1 for (_, client_json), inconsistency in zip(clients, inconsistencies)
+                     if inconsistency is not None and client_json["internal_score"]["preprocessing"])
+        print(f"[{n_clients}] {len(permitted)} clients permitted, {missed} injected inconsistencies missed")
+        del clients
+
+        llm_features = timed("llm_stub", len(permitted), lambda: [stub_llm_features(client_json) for _, client_json in permitted])
+        exchange_rates = get_current_exchange_rates()
+        timed("append_features", len(permitted), lambda: [
+            process_client(name, client_json, exchange_rates, features_dir, features=features)
+            for (name, client_json), features in zip(permitted, llm_features)
+        ])
+        timed("numeric_features", len(permitted), lambda: write_numeric_features(permitted, features_dir / "numeric_features.parquet"))
+        del llm_features, permitted
+
+        frame = timed("ml_frame", n_clients, lambda: list_json_2_df(extract_and_merge_jsons_2_list(input_dir)))
+        if predict:
+            try:
+                predictor = timed("ml_load_predictor", 1, load_predictor)
+            except ImportError as e:
+                print(f"[{n_clients}] Skipping ml_predict: {e}")
+            else:
+                timed("ml_predict", n_clients, lambda: predictor.predict(prediction_frame(frame, predictor)))
+    finally:
+        shutil.rmtree(run_dir, ignore_errors=True)
+    return rows
+
+
+def run_benchmarks(sizes=BENCHMARK_SIZES, results_path=RESULTS_PATH, **kwargs):
+    """
+    Benchmarks every size in its own process and writes the stage timings to results_path.
+
+    Args:
+        sizes (list): Numbers of synthetic clients.
+        results_path (Path): CSV of the results, None to only return them.
+        **kwargs: Passed on to benchmark_size.
+
+    Returns:
+        pd.DataFrame: The rows of benchmark_size for every size.
+    """
+    context = multiprocessing.get_context("spawn")
+    rows = []
+    for n_clients in sizes:
+        with context.Pool(1) as pool:
+            rows.extend(pool.apply(benchmark_size, (n_clients,), kwargs))
+    results = pd.DataFrame(rows)
+    if results_path is not None:
+        results.to_csv(results_path, index=False)
+    return results
+
+
+# Example usage
+if __name__ == "__main__":
+    # 1M clients need tens of GB of disk for the client files and of memory for the ML frame
+    results = run_benchmarks(BENCHMARK_SIZES)
+    print(results.pivot(index="stage", columns="clients", values="clients_per_s").round(0).to_string())
+    print(results.pivot(index="stage", columns="clients", values="peak_rss_mb").round(0).to_string())
+    print(f"Results written to {RESULTS_PATH}")
@@ -0,0 +1,281 @@
+import io
+import os
+import re
+import sys
+import json
+import random
+import zipfile
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+from types import SimpleNamespace
+
+# The generator reuses the rules of the preprocessing stage to pick its templates
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "preprocessing"))
+
+from inconsistency_analysis import static_analysis
+
+SAMPLE_CLIENTS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "preprocessing", "all_clients")
+
+# Share of clients that get one injected inconsistency, and the share of the consistent
+# clients labelled "Accept"
+INCONSISTENCY_RATE = 0.3
+ACCEPT_RATE = 0.5
+# Clients per outer zip, like the parts of the datathon input
+CLIENTS_PER_ZIP = 10_000
+MRZ_LINE_LENGTH = 45
+
+
+def _break_expiry(client, rng, today):
+    expiry = today - timedelta(days=rng.randint(1, 2000))
+    issue = expiry - timedelta(days=3652)
+    for document in ("passport", "client_profile"):
+        client[document]["passport_issue_date"] = issue.isoformat()
+        client[document]["passport_expiry_date"] = expiry.isoformat()
+
+
+def _break_account_name(client, rng, today):
+    client["account_form"]["first_name"] = client["account_form"]["first_name"] + "e"
+
+
+def _break_passport_number(client, rng, today):
+    number = client["account_form"]["passport_number"]
+    client["account_form"]["passport_number"] = number[:-1] + str((int(number[-1]) + 1) % 10)
+
+
+def _break_birth_date(client, rng, today):
+    birth_date = date.fromisoformat(client["client_profile"]["birth_date"])
+    client["client_profile"]["birth_date"] = (birth_date + timedelta(days=rng.choice([-1, 1]))).isoformat()
+
+
+def _break_email(client, rng, today):
+    client["client_profile"]["email_address"] = client["client_profile"]["email_address"].replace("@", ".")
+
+
+def _break_address(client, rng, today):
+    client["account_form"]["address"].pop(rng.choice(["city", "street name", "postal code"]), None)
+
+
+def _break_nationality(client, rng, today):
+    client["client_profile"]["nationality"] = rng.choice(["Atlantean", "Ruritanian", "Freedonian"])
+
+
+def _break_currency(client, rng, today):
+    client["client_profile"]["currency"] = client["account_form"]["currency"] = rng.choice(["JPY", "BRL", "INR"])
+
+
+def _break_phone(client, rng, today):
+    client["account_form"]["phone_number"] = client["account_form"]["phone_number"] + " ext"
+
+
+def _break_mrz(client, rng, today):
+    # Another birth date in line 2 of the MRZ (see mrz.py)
+    line2 = client["passport"]["passport_mrz"][1]
+    year = (int(line2[12:14]) + rng.randint(1, 9)) % 100
+    client["passport"]["passport_mrz"][1] = f"{line2[:12]}{year:02d}{line2[14:]}"
+
+
+# Inconsistency kinds the generator can inject, each one a violation the static analysis reports
+INCONSISTENCIES = {
+    "expired_passport": _break_expiry,
+    "account_name_mismatch": _break_account_name,
+    "passport_number_mismatch": _break_passport_number,
+    "birth_date_mismatch": _break_birth_date,
+    "invalid_email": _break_email,
+    "incomplete_address": _break_address,
+    "nationality_mismatch": _break_nationality,
+    "unaccepted_currency": _break_currency,
+    "invalid_phone": _break_phone,
+    "mrz_mismatch": _break_mrz,
+}
+
+
+def load_templates(sample_clients_path=SAMPLE_CLIENTS_PATH):
+    """
+    Collects what the generator draws from: the sample clients that pass the static analysis (as
+    JSON text, copied per synthetic client), and pools of names, addresses and phone numbers per
+    passport country (first names also per gender).
+
+    Returns:
+        SimpleNamespace: templates (list of (country, JSON text)), first_names, last_names,
+        contacts (address and phone pairs).
+    """
+    templates = []
+    first_names = defaultdict(set)
+    last_names = defaultdict(set)
+    contacts = defaultdict(list)
+    for client_file_name in sorted(os.listdir(sample_clients_path)):
+        if not client_file_name.endswith(".json"):
+            continue
+        with open(os.path.join(sample_clients_path, client_file_name), "r", encoding="utf-8") as client_file:
+            client_data = json.load(client_file)
+        client_data.pop("internal_score", None)
+        client_data.pop("label", None)
+        if not static_analysis(json.loads(json.dumps(client_data)), client_file_name)["internal_score"]["preprocessing"]:
+            continue
+
+        passport = client_data["passport"]
+        country = passport["country"]
+        templates.append((country, json.dumps(client_data, ensure_ascii=False)))
+        for name in (passport["first_name"], passport["middle_name"]):
+            if name:
+                first_names[(country, passport["gender"])].add(name)
+        last_names[country].add(passport["last_name"])
+        contacts[country].append((client_data["client_profile"]["address"], client_data["client_profile"]["phone_number"]))
+
+    if not templates:
+        raise ValueError(f"No consistent sample clients found in {sample_clients_path}.")
+    return SimpleNamespace(
+        templates=templates,
+        first_names={key: sorted(names) for key, names in first_names.items()},
+        last_names={key: sorted(names) for key, names in last_names.items()},
+        contacts=dict(contacts),
+    )
+
+
+def _mrz_name(name):
+    return name.upper().replace(" ", "<").replace("-", "<")
+
+
+def _passport_number(rng, template_number):
+    # Same shape as the template, e.g. two letters and seven digits
+    return "".join(
+        rng.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZ") if char.isalpha() else str(rng.randrange(10)) if char.isdigit() else char
+        for char in template_number
+    )
+
+
+def make_synthetic_client(rng, pools, today, inconsistency=None, accept_rate=ACCEPT_RATE):
+    """
+    Creates one synthetic client from a random template: a new identity (names, birth date,
+    passport number, MRZ, passport dates, address, phone and email) written consistently into
+    the passport, client profile, account form and description, while the education,
+    employment and wealth sections stay those of the template.
+
+    Args:
+        rng (random.Random): Source of randomness.
+        pools (SimpleNamespace): See load_templates.
+        today (date): Reference date of the passport dates.
+        inconsistency (str): Kind from INCONSISTENCIES to inject, None for a consistent client.
+        accept_rate (float): Probability of an "Accept" label for a consistent client.
+
+    Returns:
+        dict: The client data keyed by document name, like read.iter_client_jsons.
+    """
+    country, template_json = rng.choice(pools.templates)
+    client = json.loads(template_json)
+    passport, profile, account = client["passport"], client["client_profile"], client["account_form"]
+    old_full_name, old_first_name = profile["name"], passport["first_name"]
+
+    # Identity
+    first_pool = pools.first_names.get((country, passport["gender"])) or [passport["first_name"]]
+    first_name = rng.choice(first_pool)
+    middle_name = rng.choice(first_pool) if passport["middle_name"] else ""
+    last_name = rng.choice(pools.last_names[country])
+    full_name = " ".join(name for name in (first_name, middle_name, last_name) if name)
+    birth_date = date.fromisoformat(passport["birth_date"]) + timedelta(days=rng.randint(-180, 180))
+    passport_number = _passport_number(rng, passport["passport_number"])
+    validity = date.fromisoformat(passport["passport_expiry_date"]) - date.fromisoformat(passport["passport_issue_date"])
+    issue_date = today - timedelta(days=rng.randint(30, max(31, validity.days - 30)))
+    expiry_date = issue_date + validity
+    address, phone_number = rng.choice(pools.contacts[country])
+    email_address = f"{first_name}.{last_name}@{profile['email_address'].split('@')[-1]}".lower().replace(" ", "")
+
+    passport.update({
+        "first_name": first_name, "middle_name": middle_name, "last_name": last_name,
+        "birth_date": birth_date.isoformat(), "passport_number": passport_number,
+        "passport_issue_date": issue_date.isoformat(), "passport_expiry_date": expiry_date.isoformat(),
+    })
+    passport["passport_mrz"] = [
+        f"P<{passport['country_code']}{_mrz_name(last_name)}<<{_mrz_name(first_name)}<{_mrz_name(middle_name)}".ljust(MRZ_LINE_LENGTH, "<")[:MRZ_LINE_LENGTH],
+        f"{passport_number}{passport['country_code']}{birth_date:%y%m%d}".ljust(MRZ_LINE_LENGTH, "<"),
+    ]
+    profile.update({
+        "name": full_name, "birth_date": birth_date.isoformat(), "passport_number": passport_number,
+        "passport_issue_date": issue_date.isoformat(), "passport_expiry_date": expiry_date.isoformat(),
+        "address": dict(address), "phone_number": phone_number, "email_address": email_address,
+    })
+    account.update({
+        "name": full_name, "first_name": first_name, "middle_name": middle_name, "last_name": last_name,
+        "passport_number": passport_number, "address": dict(address), "phone_number": phone_number,
+        "email_address": email_address,
+    })
+    old_first_name_pattern = re.compile(rf"\b{re.escape(old_first_name)}\b")
+    client["client_description"] = {
+        section: old_first_name_pattern.sub(first_name, text.replace(old_full_name, full_name))
+        for section, text in client["client_description"].items()
+    }
+
+    if inconsistency is not None:
+        INCONSISTENCIES[inconsistency](client, rng, today)
+        client["label"] = {"label": "Reject"}
+    else:
+        client["label"] = {"label": "Accept" if rng.random() < accept_rate else "Reject"}
+    return client
+
+
+def iter_synthetic_clients(n_clients, seed=0, inconsistency_rate=INCONSISTENCY_RATE, inconsistency_weights=None,
+                           accept_rate=ACCEPT_RATE, today=None, pools=None):
+    """
+    Streams synthetic clients. The same seed and today give the same clients.
+
+    Args:
+        n_clients (int): Number of clients.
+        seed (int): Random seed.
+        inconsistency_rate (float): Share of clients with one injected inconsistency.
+        inconsistency_weights (dict): Relative frequency per kind of INCONSISTENCIES, all kinds
+            equally often if None. Kinds left out are never injected.
+        accept_rate (float): Probability of an "Accept" label for a consistent client.
+        today (date): Reference date of the passport dates, date.today() if None.
+        pools (SimpleNamespace): See load_templates, loaded from the sample clients if None.
+
+    Yields:
+        tuple: (client data dict, injected inconsistency kind or None).
+    """
+    rng = random.Random(seed)
+    today = today or date.today()
+    pools = pools or load_templates()
+    weights = inconsistency_weights or {kind: 1 for kind in INCONSISTENCIES}
+    kinds, kind_weights = list(weights), list(weights.values())
+    for _ in range(n_clients):
+        inconsistency = rng.choices(kinds, kind_weights)[0] if rng.random() < inconsistency_rate else None
+        yield make_synthetic_client(rng, pools, today, inconsistency, accept_rate), inconsistency
+
+
+def write_synthetic_zips(output_folder, n_clients, clients_per_zip=CLIENTS_PER_ZIP, **generator_kwargs):
+    """
+    Writes synthetic clients in the layout of the datathon input: outer zips of client zips, each
+    holding passport.json, client_profile.json, account_form.json, client_description.json and
+    label.json (see read.iter_client_jsons).
+
+    Args:
+        output_folder (str): Folder of the outer zips, created if needed.
+        n_clients (int): Number of clients.
+        clients_per_zip (int): Clients per outer zip.
+        **generator_kwargs: Passed on to iter_synthetic_clients.
+
+    Returns:
+        list: The injected inconsistency kind (or None) per client, in client order.
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    inconsistencies = []
+    outer_zip = None
+    for idx, (client_data, inconsistency) in enumerate(iter_synthetic_clients(n_clients, **generator_kwargs)):
+        if idx % clients_per_zip == 0:
+            if outer_zip is not None:
+                outer_zip.close()
+            outer_zip = zipfile.ZipFile(os.path.join(output_folder, f"synthetic_part{idx // clients_per_zip:04d}.zip"), "w")
+        client_buffer = io.BytesIO()
+        with zipfile.ZipFile(client_buffer, "w", zipfile.ZIP_DEFLATED) as client_zip:
+            for document, content in client_data.items():
+                client_zip.writestr(f"client_{idx:07d}/{document}.json", json.dumps(content, ensure_ascii=False))
+        outer_zip.writestr(f"client_{idx:07d}.zip", client_buffer.getvalue())
+        inconsistencies.append(inconsistency)
+    if outer_zip is not None:
+        outer_zip.close()
+    return inconsistencies
+
+
+# Example usage
+if __name__ == "__main__":
+    inconsistencies = write_synthetic_zips("benchmark/synthetic_input", 1000)
+    print(f"Wrote {len(inconsistencies)} synthetic clients: {dict(Counter(inconsistencies))}")
@@ -7,6 +7,17 @@ from pathlib import Path
 # Adjust this path if needed
 directory = Path(__file__).resolve().parent / "extracted_features"
 client_directory = Path(__file__).resolve().parent.parent / "preprocessing" / "all_clients"
+client_store_directory = Path(__file__).resolve().parent.parent / "preprocessing" / "client_store"
+
+# With the columnar client store, read all labels in one projected pass instead of opening every client file
+labels = None
+if client_store_directory.exists():
+    sys.path.append(str(Path(__file__).resolve().parent.parent / "preprocessing"))
+    from client_store import iter_client_store
+    labels = {
+        client_name: client_data.get("label", {})
+        for client_name, client_data in iter_client_store(client_store_directory, documents=["label"])
+    }
 
 # List all feature files
 feature_files = sorted(glob.glob(os.path.join(directory, 'features_client_*.json')))
@@ -16,24 +27,29 @@ for feature_file in tqdm(feature_files, desc="Processing feature files"):
     base_name = os.path.basename(feature_file)
     client_id = base_name.split('_')[-1].replace('.json', '')  # e.g., "0"
 
-    # Build corresponding client file path
-    client_file = os.path.join(client_directory, f'client_{client_id}.json')
+    if labels is not None:
+        if f'client_{client_id}' not in labels:
+            continue
+        label = labels[f'client_{client_id}']
+    else:
+        # Build corresponding client file path
+        client_file = os.path.join(client_directory, f'client_{client_id}.json')
+
+        if not os.path.exists(client_file):
+            #print(f"Warning: {client_file} does not exist. Skipping.")
+            continue
 
-    if not os.path.exists(client_file):
-        #print(f"Warning: {client_file} does not exist. Skipping.")
-        continue
+        with open(client_file, 'r', encoding='utf-8') as f_client:
+            label = json.load(f_client).get("label", {})
 
-    # Load feature and label data
+    # Load feature data
     with open(feature_file, 'r', encoding='utf-8') as f_feat:
         features_data = json.load(f_feat)
 
-    with open(client_file, 'r', encoding='utf-8') as f_client:
-        client_data = json.load(f_client)
-
     # Construct new structure
     updated_data = {
         "features": features_data,
-        "label": client_data.get("label", {})
+        "label": label
     }
 
     # Save back to the same feature file
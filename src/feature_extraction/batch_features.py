@@ -0,0 +1,142 @@
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from exchange_rates import convert_to_eur
+
+# Category orderings of append_one_hot_investment_profile
+RISK_LEVELS = ['Conservative', 'Low', 'Moderate', 'Balanced', 'Considerable', 'High', 'Aggressive']
+EXPERIENCE_LEVELS = ['Inexperienced', 'Experienced', 'Expert']
+MANDATE_TYPES = ['Execution-Only', 'Advisory', 'Hybrid', 'Discretionary']
+
+# Columns in the order append_asset_values, append_salary_stats, append_age and
+# append_one_hot_investment_profile add them
+NUMERIC_FEATURE_COLUMNS = (
+    ["log_savings_eur", "log_inheritance_eur", "log_real_estate_value_eur"]
+    + ["log_last_yearly_salary_eur", "log_average_yearly_salary_eur", "log_total_salary_eur",
+       "total_years_worked", "average_tenure"]
+    + ["age"]
+    + [f"risk_profile_{level.lower()}" for level in RISK_LEVELS]
+    + [f"investment_experience_{level.lower()}" for level in EXPERIENCE_LEVELS]
+    + [f"type_of_mandate_{level.lower().replace('-', '_')}" for level in MANDATE_TYPES]
+)
+
+
+def _numbers(values) -> np.ndarray:
+    # Non-numeric values (None, strings) become NaN instead of failing the whole client
+    return pd.to_numeric(pd.Series(values, dtype=object), errors="coerce").to_numpy(np.float64)
+
+
+def _employment_table(profiles: List[Dict[str, Any]]) -> pd.DataFrame:
+    """One row per employment_history entry: client position, list position, start, end, salary."""
+    rows = [
+        (client_idx, job_idx, job.get("start_year"), job.get("end_year"), job.get("salary", 0))
+        for client_idx, profile in enumerate(profiles)
+        for job_idx, job in enumerate(profile.get("employment_history") or [])
+    ]
+    clients, positions, starts, ends, salaries = zip(*rows) if rows else ([], [], [], [], [])
+    return pd.DataFrame({
+        "client": np.array(clients, dtype=np.int64),
+        "position": np.array(positions, dtype=np.int64),
+        "start_year": _numbers(starts),
+        "end_year": _numbers(ends),
+        "salary": _numbers(salaries),
+    })
+
+
+def build_numeric_features(clients: List[Dict[str, Any]], client_ids: Optional[List[str]] = None,
+                           as_of=None, today: Optional[datetime] = None) -> pd.DataFrame:
+    """
+    Computes the columns of append_asset_values, append_salary_stats, append_age and
+    append_one_hot_investment_profile for many clients at once.
+
+    Amounts are converted with one vectorized call (see exchange_rates.convert_to_eur), the
+    employment histories are exploded into one table and aggregated per client with groupby.
+
+    Args:
+        clients (list): Client data dicts.
+        client_ids (list): Row labels, positions 0..N-1 if None.
+        as_of: Date of the exchange rate table to convert with, the latest one if None.
+        today (datetime): Reference date of the age, datetime.today() if None.
+
+    Returns:
+        pd.DataFrame: float32 feature matrix, one row per client and NUMERIC_FEATURE_COLUMNS as
+        columns. Values the per-client functions would not set (e.g. the age of a client without
+        a birth date) are NaN.
+    """
+    today = today or datetime.today()
+    n_clients = len(clients)
+    profiles = [client_data.get("client_profile", {}) for client_data in clients]
+    currencies = [profile.get("currency", "EUR") for profile in profiles]
+    rates = convert_to_eur(np.ones(n_clients), currencies, as_of=as_of)
+    columns = {}
+
+    # Asset values
+    aums = [profile.get("aum", {}) for profile in profiles]
+    for column, key in [("log_savings_eur", "savings"), ("log_inheritance_eur", "inheritance"),
+                        ("log_real_estate_value_eur", "real_estate_value")]:
+        columns[column] = np.log1p(_numbers([aum.get(key, 0) for aum in aums]) * rates)
+
+    # Salary stats over the positions with a start and an end year (ongoing ones are skipped)
+    jobs = _employment_table(profiles)
+    jobs = jobs[(jobs["start_year"].fillna(0) != 0) & (jobs["end_year"].fillna(0) != 0)]
+    salaries = jobs["salary"].to_numpy() * rates[jobs["client"].to_numpy()]
+    tenures = jobs["end_year"].to_numpy() - jobs["start_year"].to_numpy() + 1
+    per_client = pd.DataFrame({
+        "client": jobs["client"].to_numpy(),
+        "salary": salaries,
+        "total": salaries * tenures,
+        "tenure": tenures,
+    }).groupby("client", sort=False)
+    # Positions are in list order, so the last row of a client is its last listed position
+    stats = per_client.agg(last=("salary", "last"), average=("salary", "mean"), total=("total", "sum"),
+                           years=("tenure", "sum"), tenure=("tenure", "mean"))
+    stats = stats.reindex(np.arange(n_clients))
+    has_jobs = stats["years"].notna().to_numpy()
+    columns["log_last_yearly_salary_eur"] = np.where(has_jobs, np.log1p(stats["last"].to_numpy()), 0)
+    columns["log_average_yearly_salary_eur"] = np.log1p(stats["average"].fillna(0).to_numpy())
+    columns["log_total_salary_eur"] = np.log1p(stats["total"].fillna(0).to_numpy())
+    columns["total_years_worked"] = stats["years"].fillna(0).to_numpy()
+    columns["average_tenure"] = stats["tenure"].fillna(0).to_numpy()
+
+    # Age in completed years
+    birth_dates = pd.to_datetime(pd.Series([profile.get("birth_date") or None for profile in profiles], dtype=object),
+                                 format="%Y-%m-%d", errors="coerce")
+    birthday_ahead = (birth_dates.dt.month * 100 + birth_dates.dt.day) > (today.month * 100 + today.day)
+    columns["age"] = (today.year - birth_dates.dt.year - birthday_ahead.astype(np.float64)).to_numpy(np.float64)
+
+    # Investment profile one-hots
+    for key, levels, prefix in [("investment_risk_profile", RISK_LEVELS, "risk_profile"),
+                                ("investment_experience", EXPERIENCE_LEVELS, "investment_experience"),
+                                ("type_of_mandate", MANDATE_TYPES, "type_of_mandate")]:
+        # Category code per client, -1 for missing or unknown values
+        codes = pd.Index(levels).get_indexer(pd.Index([profile.get(key) for profile in profiles], dtype=object))
+        one_hot = np.zeros((n_clients, len(levels)))
+        known = codes >= 0
+        one_hot[np.flatnonzero(known), codes[known]] = 1
+        for idx, level in enumerate(levels):
+            columns[f"{prefix}_{level.lower().replace('-', '_')}"] = one_hot[:, idx]
+
+    index = pd.Index(client_ids if client_ids is not None else range(n_clients), name="client_id")
+    return pd.DataFrame({column: columns[column] for column in NUMERIC_FEATURE_COLUMNS}, index=index).astype(np.float32)
+
+
+if __name__ == "__main__":
+    import json
+    import time
+    from pathlib import Path
+
+    client_dir = Path(__file__).resolve().parent.parent / "preprocessing" / "all_clients"
+    client_paths = sorted(client_dir.glob("client_*.json"), key=lambda path: int(path.stem.split("_")[1]))
+    clients = []
+    for path in client_paths:
+        with open(path, "r", encoding="utf-8") as f:
+            clients.append(json.load(f))
+
+    start = time.perf_counter()
+    frame = build_numeric_features(clients, client_ids=[path.stem for path in client_paths])
+    print(f"{frame.shape[0]} clients x {frame.shape[1]} features in {time.perf_counter() - start:.3f}s "
+          f"({frame.memory_usage(index=False).sum() / 1024:.0f} KiB float32)")
+    print(frame.head())
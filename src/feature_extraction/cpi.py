@@ -1,25 +1,161 @@
+import os, sys
 import csv
+import json
+import hashlib
+import unicodedata
 from pathlib import Path
+from functools import lru_cache
+from typing import Dict, Any, Optional
+
+# The ISO code tables are shared with the preprocessing stage
+sys.path.append(str(Path(__file__).resolve().parent.parent / "preprocessing"))
+
+# Precomputed index of TI-CPI.csv, so worker processes start without parsing the CSV.
+# Bump the version whenever the index layout changes; a changed CSV is picked up automatically.
+CPI_CSV_PATH = Path(__file__).resolve().parent / "TI-CPI.csv"
+CPI_INDEX_PATH = CPI_CSV_PATH.with_suffix(".index.json")
+CPI_INDEX_VERSION = 1
+CPI_SCORE_INDICATOR = "TI.CPI.Score"
+
+
+def normalize_country_name(name: str) -> str:
+    """Lookup key of a country name: accents removed, casefolded and with single spaces."""
+    decomposed = unicodedata.normalize("NFKD", name)
+    folded = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return " ".join(folded.casefold().split())
+
+
+def _file_digest(path: Path) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
 
-def extract_cpi_scores_2023(csv_path):
-    cpi_scores = {}
 
+def build_cpi_index(csv_path: Path = CPI_CSV_PATH, index_path: Optional[Path] = CPI_INDEX_PATH) -> Dict[str, Any]:
+    """
+    Parses TI-CPI.csv once into a compact index: the CPI score of every country (by ISO alpha-3
+    code) for every year column, and the alpha-3 code of every name or alpha-2 code a country is
+    known by (the TI economy names as well as the ISO names, e.g. both "Slovak Republic" and
+    "Slovakia").
+
+    Args:
+        csv_path (Path): The TI-CPI.csv export.
+        index_path (Path): Where to write the index, None to only build it in memory.
+
+    Returns:
+        dict: The index that was built.
+    """
+    from country_conversion_helper import load_country_table
+
+    scores = {}
+    economy_names = {}
+    aliases = {}
     with open(csv_path, newline='', encoding='utf-8') as csvfile:
         reader = csv.DictReader(csvfile, delimiter=';')
+        years = [column for column in reader.fieldnames if column.isdigit()]
         for row in reader:
-            if row['Indicator ID'] == 'TI.CPI.Score':
-                country = row['Economy Name']
-                score_2023 = row['2023']
-                try:
-                    cpi_scores[country] = int(score_2023)
-                except ValueError:
-                    cpi_scores[country] = None  # or skip if preferred
+            if row['Indicator ID'] != CPI_SCORE_INDICATOR:
+                continue
+            iso3 = row['Economy ISO3'].upper()
+            # Scores are stored in year order; years a country was not rated are null
+            scores[iso3] = [int(row[year]) if row[year].strip().isdigit() else None for year in years]
+            economy_names[iso3] = row['Economy Name']
+            aliases[normalize_country_name(row['Economy Name'])] = iso3
+
+    names, _ = load_country_table()
+    alpha3_by_name = {name: code.upper() for code, name in names.items() if len(code) == 3}
+    for code, name in names.items():
+        iso3 = alpha3_by_name[name]
+        if iso3 in scores:
+            aliases.setdefault(normalize_country_name(name), iso3)
+            aliases[code] = iso3
+
+    index = {
+        "version": CPI_INDEX_VERSION,
+        "source_sha256": _file_digest(csv_path),
+        "years": [int(year) for year in years],
+        "scores": scores,
+        "economy_names": economy_names,
+        "aliases": aliases,
+    }
+    if index_path is not None:
+        with open(index_path, "w", encoding="utf-8") as index_file:
+            json.dump(index, index_file, ensure_ascii=False, separators=(",", ":"), sort_keys=True)
+    return index
+
+
+@lru_cache(maxsize=None)
+def load_cpi_index(csv_path: Path = CPI_CSV_PATH) -> Dict[str, Any]:
+    """
+    Loads the CPI index once per process: from the precomputed index file next to the CSV
+    (<name>.index.json) if it matches the CSV, otherwise rebuilt from the CSV (and written back,
+    if the location is writable).
+
+    Returns:
+        dict: The index, see build_cpi_index. "year_columns" maps each year to its score position.
+    """
+    index_path = Path(csv_path).with_suffix(".index.json")
+    index = None
+    if os.path.exists(index_path):
+        with open(index_path, "r", encoding="utf-8") as index_file:
+            index = json.load(index_file)
+        if index.get("version") != CPI_INDEX_VERSION or index.get("source_sha256") != _file_digest(csv_path):
+            index = None
+    if index is None:
+        try:
+            index = build_cpi_index(csv_path, index_path)
+        except OSError:
+            index = build_cpi_index(csv_path, None)
+    index["year_columns"] = {year: position for position, year in enumerate(index["years"])}
+    return index
+
+
+def country_iso3(country: str) -> Optional[str]:
+    """
+    Resolves a country name (TI or ISO spelling, case- and accent-insensitive) or an alpha-2/alpha-3
+    code to the alpha-3 code of the CPI index.
+
+    Returns:
+        str: The alpha-3 code, None if the country has no CPI entry.
+    """
+    if not country:
+        return None
+    index = load_cpi_index()
+    key = normalize_country_name(country)
+    if key.upper() in index["scores"]:
+        return key.upper()
+    return index["aliases"].get(key)
+
+
+def cpi_score(country: str, year: int = 2023) -> Optional[int]:
+    """
+    Returns the CPI score of a country (any spelling country_iso3 accepts) in a given year, None
+    if the country, the year or the score is not in the index.
+    """
+    index = load_cpi_index()
+    position = index["year_columns"].get(int(year))
+    iso3 = country_iso3(country)
+    if position is None or iso3 is None:
+        return None
+    return index["scores"][iso3][position]
+
+
+def extract_cpi_scores(year: int = 2023, csv_path: Path = CPI_CSV_PATH) -> Dict[str, Optional[int]]:
+    """Returns the CPI score of every country in a given year, keyed by ISO alpha-3 code."""
+    index = load_cpi_index(Path(csv_path))
+    position = index["year_columns"].get(int(year))
+    return {iso3: (None if position is None else scores[position]) for iso3, scores in index["scores"].items()}
+
+
+def extract_cpi_scores_2023(csv_path):
+    """The 2023 CPI scores keyed by TI economy name, as returned before the index existed."""
+    index = load_cpi_index(Path(csv_path))
+    scores = extract_cpi_scores(2023, csv_path)
+    return {name: scores[iso3] for iso3, name in index["economy_names"].items()}
 
-    return cpi_scores
 
 # Example usage
 if __name__ == "__main__":
-    path_to_csv = Path(__file__).resolve().parent / "./TI-CPI.csv"  # Replace with your actual file path
-    scores = extract_cpi_scores_2023(path_to_csv)
-    for country, score in scores.items():
-        print(f"{country}: {score}")
+    index = build_cpi_index()
+    print(f"CPI index written to {CPI_INDEX_PATH} ({len(index['scores'])} countries, years {index['years'][0]}-{index['years'][-1]})")
+    for country in ["Switzerland", "CHE", "Slovakia", "Slovak Republic", "Türkiye", "Turkey", "Germany,Netherlands"]:
+        print(f"{country}: {country_iso3(country)} {cpi_score(country)} (2012: {cpi_score(country, 2012)})")
@@ -1,16 +1,124 @@
+import json
+from pathlib import Path
+from functools import lru_cache
+from types import SimpleNamespace
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+# Dated rate tables (units of EUR per unit of currency), e.g.
+#   {"version": 1, "base": "EUR", "tables": {"2025-04-01": {"CHF": 1.06, ...}, ...}}
+# A refresh adds a table under its date; older tables stay for as-of conversions.
+EXCHANGE_RATES_VERSION = 1
+EXCHANGE_RATES_PATH = Path(__file__).resolve().parent / "exchange_rates.json"
+
+
+@lru_cache(maxsize=None)
+def load_rate_tables(rates_path: Path = EXCHANGE_RATES_PATH) -> SimpleNamespace:
+    """
+    Loads the dated rate tables once per process.
+
+    A currency missing from a table takes the rate of the closest earlier table (or of the
+    first table quoting it, for dates before that).
+
+    Returns:
+        SimpleNamespace: dates (sorted datetime64[D] array), rates (currency -> array of rates
+        aligned with dates).
+    """
+    with open(rates_path, "r", encoding="utf-8") as rates_file:
+        data = json.load(rates_file)
+    if data.get("version") != EXCHANGE_RATES_VERSION:
+        raise ValueError(f"Exchange rates {rates_path} have version {data.get('version')}, expected {EXCHANGE_RATES_VERSION}.")
+
+    dates = sorted(data["tables"])
+    currencies = sorted({currency for table in data["tables"].values() for currency in table})
+    rates = {}
+    for currency in currencies:
+        quoted = [data["tables"][date].get(currency) for date in dates]
+        first = next(rate for rate in quoted if rate is not None)
+        filled = []
+        for rate in quoted:
+            filled.append(rate if rate is not None else (filled[-1] if filled else first))
+        rates[currency] = np.array(filled, dtype=np.float64)
+    return SimpleNamespace(dates=np.array(dates, dtype="datetime64[D]"), rates=rates)
+
+
+def _table_positions(tables: SimpleNamespace, as_of) -> np.ndarray:
+    # Latest table dated on or before each as-of date; dates before the first table use the
+    # first one, missing dates (NaT) the latest one
+    if as_of is None:
+        return np.array(len(tables.dates) - 1)
+    as_of = np.asarray(as_of, dtype="datetime64[D]")
+    positions = np.searchsorted(tables.dates, as_of, side="right") - 1
+    positions = np.where(np.isnat(as_of), len(tables.dates) - 1, positions)
+    return np.clip(positions, 0, len(tables.dates) - 1)
+
+
+def year_end_dates(years) -> np.ndarray:
+    """Maps years (NaN/None for "ongoing") to the 31st of December of each year (NaT for ongoing)."""
+    years = np.asarray(years, dtype=np.float64)
+    known = ~np.isnan(years)
+    dates = np.full(years.shape, np.datetime64("NaT"), dtype="datetime64[D]")
+    next_years = (years[known].astype(np.int64) - 1970 + 1).astype("datetime64[Y]")
+    dates[known] = next_years.astype("datetime64[D]") - np.timedelta64(1, "D")
+    return dates
+
+
+def get_exchange_rates(as_of=None, rates_path: Path = EXCHANGE_RATES_PATH) -> Dict[str, float]:
+    """
+    Returns the rates (EUR per unit of currency) of the latest table dated on or before `as_of`
+    (a date or "YYYY-MM-DD" string), the latest table if None.
+    """
+    tables = load_rate_tables(rates_path)
+    position = int(_table_positions(tables, as_of))
+    return {currency: float(rates[position]) for currency, rates in tables.rates.items()}
+
+
 def get_current_exchange_rates():
-    return {
-        "DKK": 0.13, 
-        "NOK": 0.08, 
-        "CHF": 1.06, 
-        "EUR": 1.00,
-        "GBP": 1.18,
-        "USD": 0.91,
-        "ISK": 0.0069,
-    }
+    return get_exchange_rates()
+
+
+def convert_to_eur(amounts, currencies, as_of=None, rates_path: Path = EXCHANGE_RATES_PATH) -> np.ndarray:
+    """
+    Converts a column of amounts to EUR in one pass: one rate lookup per distinct currency, then a
+    single vectorized multiplication. Unknown currencies keep a rate of 1.0, like the feature
+    functions' exchange_rates.get(currency, 1.0).
+
+    Args:
+        amounts (array-like): Amounts in their own currency.
+        currencies (array-like or str): Currency code per amount, or one code for all of them.
+        as_of (array-like, optional): Date per amount (or one date for all) whose rate table to
+            use, see get_exchange_rates; the latest table if None.
+        rates_path (Path): The dated rate tables.
+
+    Returns:
+        np.ndarray: The amounts in EUR (float64).
+    """
+    tables = load_rate_tables(rates_path)
+    amounts = np.asarray(amounts, dtype=np.float64)
+    currencies = np.broadcast_to(np.asarray(currencies, dtype=object), amounts.shape)
+    positions = np.broadcast_to(_table_positions(tables, as_of), amounts.shape)
+
+    # Hash-based factorization is much faster than sorting the currency strings
+    inverse, codes = pd.factorize(currencies.ravel(), use_na_sentinel=False)
+    unknown = np.ones(len(tables.dates), dtype=np.float64)
+    rate_matrix = np.stack([tables.rates.get(code, unknown) for code in codes]) if len(codes) else unknown[None, :]
+    return amounts * rate_matrix[inverse.reshape(amounts.shape), positions]
+
+
+def convert_historical_to_eur(amounts, currencies, years, rates_path: Path = EXCHANGE_RATES_PATH) -> np.ndarray:
+    """
+    Converts historical amounts (e.g. salaries of past positions) at the rates of their year: the
+    latest table dated in or before that year. Years of None/NaN (ongoing positions) use the
+    latest table.
+    """
+    return convert_to_eur(amounts, currencies, as_of=year_end_dates(years), rates_path=rates_path)
 
 
 if __name__ == "__main__":
     exchange_rates = get_current_exchange_rates()
     for country, rate in exchange_rates.items():
         print(f"{country}: {rate}")
+    print(convert_to_eur([1000, 1000, 1000], ["CHF", "DKK", "XXX"]))
+    print(convert_historical_to_eur([50_000, 60_000], "CHF", [2012, None]))
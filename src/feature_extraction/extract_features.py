@@ -1,16 +1,43 @@
 import os, sys
 import json
 import math
+import hashlib
+import time
 from dotenv import load_dotenv
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, Any
+from typing import Dict, Any, Optional, Type
+from functools import lru_cache
+from pydantic import BaseModel
 from openai import OpenAI
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
-from llm import SYSTEM_PROMPT, ClientFeatures, make_user_prompt
-from cpi import extract_cpi_scores_2023
-from exchange_rates import get_current_exchange_rates
+from llm import MODEL, TEMPERATURE, SYSTEM_PROMPT, ClientFeatures, make_user_prompt
+from llm import PACKED_INSTRUCTIONS, PackedClientFeatures, make_client_section, make_packed_user_prompt
+from llm import FreeTextClientFeatures, make_free_text_user_prompt
+from local_features import extract_local_features, estimate_free_text_features
+from llm_cache import LLM_CACHE_PATH, make_cache_key, get_cached_response, put_cached_response
+from cpi import CPI_CSV_PATH, cpi_score
+from exchange_rates import EXCHANGE_RATES_PATH, get_current_exchange_rates
+
+# The columnar client store lives next to the preprocessing stage that writes it
+sys.path.append(str(Path(__file__).resolve().parent.parent / "preprocessing"))
+
+from manifest import manifest_path_for, client_digest, code_version, open_manifest
+from pipeline_metrics import timed, increment, observe_llm_request
+
+# TI-CPI.csv year the country risk features are scored on
+CPI_YEAR = 2023
+
+# Documents the features are extracted from; a client is re-extracted when one of them changes
+FEATURE_DOCUMENTS = ["passport", "client_profile", "client_description", "label", "internal_score"]
+# Prompts, enrichment code and tables the feature files depend on. LLM replies are cached by
+# prompt (see llm_cache.py), so re-extracting after an enrichment-only change (e.g. a new
+# exchange rate table) does not query the API again.
+FEATURE_SOURCES = [
+    Path(__file__).resolve().parent / name
+    for name in ["extract_features.py", "llm.py", "local_features.py", "cpi.py", "exchange_rates.py"]
+] + [CPI_CSV_PATH, EXCHANGE_RATES_PATH]
 
 
 def load_and_format_client_json(json_path: Path) -> Dict[str, Any]:
@@ -20,44 +47,202 @@ def load_and_format_client_json(json_path: Path) -> Dict[str, Any]:
     return client_data
 
 
-def extract_features_from_client_json(client_json: Dict[str, Any]) -> Dict[str, Any]:
-    """Sends client text to OpenAI and returns extracted features as a dict."""
+def make_openai_client() -> OpenAI:
     # Load API key and initialize client
     env_path = Path(__file__).resolve().parent.parent / ".env"
     load_dotenv(dotenv_path=env_path)
     api_key = os.getenv("OPENAI_API_KEY")
-    client = OpenAI(api_key=api_key)
+    return OpenAI(api_key=api_key)
+
+
+@lru_cache(maxsize=None)
+def has_api_key() -> bool:
+    """Whether an OpenAI API key is configured (environment or .env)."""
+    env_path = Path(__file__).resolve().parent.parent / ".env"
+    load_dotenv(dotenv_path=env_path)
+    return bool(os.getenv("OPENAI_API_KEY"))
+
+
+def request_llm_features(user_prompt: str, response_format: Type[BaseModel], cache_path: Optional[Path] = LLM_CACHE_PATH) -> Dict[str, Any]:
+    """
+    Sends one prompt to OpenAI and returns the parsed reply as a dict.
+
+    Responses are cached by a hash of the model, temperature, prompts and response schema (see
+    llm_cache.py), so re-runs and clients with identical prompt sections skip the API call.
+    Pass cache_path=None to always query the API.
+    """
+    if cache_path is not None:
+        cache_key = make_cache_key(MODEL, TEMPERATURE, SYSTEM_PROMPT, user_prompt, response_format.model_json_schema())
+        cached = get_cached_response(cache_key, cache_path)
+        if cached is not None:
+            return cached
+
+    client = make_openai_client()
     #client_text = json.dumps(client_json, ensure_ascii=False)
 
+    start = time.perf_counter()
     try:
         response = client.beta.chat.completions.parse(
-            model="gpt-4o-mini",
-            temperature=0.2,
+            model=MODEL,
+            temperature=TEMPERATURE,
             messages=[
                 {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": make_user_prompt(client_json)}
+                {"role": "user", "content": user_prompt}
             ],
-            response_format=ClientFeatures,
+            response_format=response_format,
         )
+        observe_llm_request(time.perf_counter() - start, getattr(response, "usage", None), mode="single", outcome="ok")
 
         # Extract content
         message = response.choices[0].message.content
 
         try:
-            return json.loads(message)
+            features = json.loads(message)
         except json.JSONDecodeError:
             print("⚠️ Warning: OpenAI response is not valid JSON. Returning raw string.")
             return {"raw_response": message}
 
+        # Only valid responses are cached, failures are retried on the next run
+        if cache_path is not None:
+            put_cached_response(cache_key, features, cache_path)
+        return features
+
     except Exception as e:
+        observe_llm_request(time.perf_counter() - start, mode="single", outcome="error")
         print("❌ Error during ChatCompletion API call:")
         return {"error": str(e)}
 
 
+@timed("feature_seconds")
+def extract_features_from_client_json(client_json: Dict[str, Any], cache_path: Optional[Path] = LLM_CACHE_PATH) -> Dict[str, Any]:
+    """Sends client text to OpenAI and returns extracted features as a dict."""
+    return request_llm_features(make_user_prompt(client_json), ClientFeatures, cache_path)
+
+
+def extract_features_local(client_json: Dict[str, Any], cache_path: Optional[Path] = LLM_CACHE_PATH) -> Dict[str, Any]:
+    """
+    Computes the rule-based ClientFeatures fields locally (see local_features.py) and asks the LLM
+    only for the free-text fields, with a shorter prompt. Without an API key the free-text fields
+    are estimated offline as well, so no request is made at all.
+    """
+    features = extract_local_features(client_json)
+    if has_api_key():
+        free_text_features = request_llm_features(make_free_text_user_prompt(client_json), FreeTextClientFeatures, cache_path)
+        if "error" in free_text_features or "raw_response" in free_text_features:
+            return free_text_features
+    else:
+        free_text_features = estimate_free_text_features(client_json)
+    features.update(free_text_features)
+    # Same field order as an LLM reply
+    return {name: features[name] for name in ClientFeatures.model_fields}
+
+
+def extract_features_packed(clients, pack_size: int = 8, max_workers: int = 6,
+                            cache_path: Optional[Path] = LLM_CACHE_PATH) -> Dict[str, Dict[str, Any]]:
+    """
+    Extracts the LLM features of many clients with packed prompts: the instructions are sent once
+    per request together with the data sections of up to `pack_size` clients, which cuts input
+    tokens and requests roughly by that factor.
+
+    Replies are validated against the requested client ids; clients the model dropped (or whose
+    pack failed) fall back to single-client requests. Packed replies are cached per client by
+    the hash of its data section, independently of the clients it was packed with.
+
+    Args:
+        clients (list): (client id, client JSON) pairs.
+        pack_size (int): Clients per request.
+        max_workers (int): Packed requests in flight.
+        cache_path (Path): LLM response cache, None to always query the API.
+
+    Returns:
+        dict: Features per client id, like extract_features_from_client_json returns them.
+    """
+    response_schema = PackedClientFeatures.model_json_schema()
+    features_by_id = {}
+    cache_keys = {}
+    pending = {}
+    for client_id, client_json in clients:
+        if cache_path is not None:
+            # The key ignores the client id, so clients with identical sections share an entry
+            cache_keys[client_id] = make_cache_key(
+                MODEL, TEMPERATURE, SYSTEM_PROMPT, PACKED_INSTRUCTIONS + make_client_section("", client_json), response_schema
+            )
+            # Clients that fell back to a single request before are cached under the single-client key
+            single_key = make_cache_key(MODEL, TEMPERATURE, SYSTEM_PROMPT, make_user_prompt(client_json),
+                                        ClientFeatures.model_json_schema())
+            cached = get_cached_response(cache_keys[client_id], cache_path) or get_cached_response(single_key, cache_path)
+            if cached is not None:
+                features_by_id[client_id] = cached
+                continue
+        pending[client_id] = client_json
+
+    # The client is only needed on cache misses, so a fully cached rerun works offline
+    if not pending:
+        return features_by_id
+    try:
+        client = make_openai_client()
+    except Exception as e:
+        print(f"❌ Error creating the OpenAI client, {len(pending)} clients not extracted: {e}")
+        features_by_id.update({client_id: {"error": str(e)} for client_id in pending})
+        return features_by_id
+
+    def extract_pack(pack: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        start = time.perf_counter()
+        try:
+            response = client.beta.chat.completions.parse(
+                model=MODEL,
+                temperature=TEMPERATURE,
+                messages=[
+                    {"role": "system", "content": SYSTEM_PROMPT},
+                    {"role": "user", "content": make_packed_user_prompt(pack)}
+                ],
+                response_format=PackedClientFeatures,
+            )
+            observe_llm_request(time.perf_counter() - start, getattr(response, "usage", None), mode="packed", outcome="ok")
+            entries = json.loads(response.choices[0].message.content)["clients"]
+        except Exception as e:
+            observe_llm_request(time.perf_counter() - start, mode="packed", outcome="error")
+            print(f"⚠️ Warning: packed request for {len(pack)} clients failed, falling back to single requests: {e}")
+            entries = []
+
+        extracted = {}
+        for entry in entries:
+            client_id = entry.pop("client_id", None)
+            # Ignore ids that were not asked for and duplicates of ids already answered
+            if client_id in pack and client_id not in extracted:
+                extracted[client_id] = entry
+        if entries and len(extracted) != len(pack):
+            print(f"⚠️ Warning: packed reply covers {len(extracted)} of {len(pack)} clients, falling back for the rest.")
+
+        for client_id, client_json in pack.items():
+            if client_id in extracted:
+                if cache_path is not None:
+                    put_cached_response(cache_keys[client_id], extracted[client_id], cache_path)
+            else:
+                extracted[client_id] = extract_features_from_client_json(client_json, cache_path)
+        return extracted
+
+    pending_ids = list(pending)
+    packs = [
+        {client_id: pending[client_id] for client_id in pending_ids[start:start + pack_size]}
+        for start in range(0, len(pending_ids), pack_size)
+    ]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for extracted in executor.map(extract_pack, packs):
+            features_by_id.update(extracted)
+    return features_by_id
+
+
+def client_rate_to_eur(client_json: Dict[str, Any], exchange_rates: Dict[str, float]) -> float:
+    """Rate from the client's currency to EUR (1.0 for EUR and unknown currencies)."""
+    currency = client_json.get("client_profile", {}).get("currency", "EUR")
+    return exchange_rates.get(currency, 1.0)
+
+
+@timed("feature_seconds")
 def append_asset_values(features: Dict[str, Any], client_json: Dict[str, Any], exchange_rates: Dict[str, float]) -> None:
     """Extracts and log-scales EUR-converted asset values: savings, inheritance, real estate."""
-    currency = client_json.get("client_profile", {}).get("currency", "EUR")
-    rate = exchange_rates.get(currency, 1.0)
+    rate = client_rate_to_eur(client_json, exchange_rates)
 
     aum = client_json.get("client_profile", {}).get("aum", {})
     
@@ -70,10 +255,10 @@ def append_asset_values(features: Dict[str, Any], client_json: Dict[str, Any], e
     features["log_real_estate_value_eur"] = math.log1p(real_estate)
 
 
+@timed("feature_seconds")
 def append_salary_stats(features: Dict[str, Any], client_json: Dict[str, Any], exchange_rates: Dict[str, float]) -> None:
     """Extracts salary stats and log-scales totals/averages in EUR."""
-    currency = client_json.get("client_profile", {}).get("currency", "EUR")
-    rate = exchange_rates.get(currency, 1.0)
+    rate = client_rate_to_eur(client_json, exchange_rates)
 
     employment = client_json.get("client_profile", {}).get("employment_history", [])
     salaries = []
@@ -99,6 +284,7 @@ def append_salary_stats(features: Dict[str, Any], client_json: Dict[str, Any], e
     features["average_tenure"] = sum(tenures) / len(tenures) if tenures else 0
 
 
+@timed("feature_seconds")
 def append_age(features: Dict[str, Any], client_json: Dict[str, Any]) -> None:
     """Calculates and appends current age."""
     birth_date_str = client_json.get("client_profile", {}).get("birth_date")
@@ -108,14 +294,12 @@ def append_age(features: Dict[str, Any], client_json: Dict[str, Any]) -> None:
         age = today.year - birth_date.year - ((today.month, today.day) < (birth_date.month, birth_date.day))
         features["age"] = age
 
-def append_cpi_scores(features: Dict[str, Any], client_json: Dict[str, Any]) -> None:
+@timed("feature_seconds")
+def append_cpi_scores(features: Dict[str, Any], client_json: Dict[str, Any], year: int = CPI_YEAR) -> None:
     """
     Appends the Corruption Perceptions Index (CPI) scores for the client's passport country
     and country of domicile to the features dictionary.
     """
-    # Retrieve the CPI scores dictionary
-    cpi_scores = extract_cpi_scores_2023(Path(__file__).resolve().parent / "./TI-CPI.csv")
-
     # Extract the passport country and country of domicile from the client data
     passport_country = client_json.get("passport", {}).get("country", "").strip()
     domicile_country = client_json.get("client_profile", {}).get("country_of_domicile", "").strip()
@@ -132,10 +316,12 @@ def append_cpi_scores(features: Dict[str, Any], client_json: Dict[str, Any]) ->
             return 2  # High risk
 
     # Assign risk categories
-    features["passport_country_risk"] = get_risk_category(cpi_scores.get(passport_country))
-    features["domicile_country_risk"] = get_risk_category(cpi_scores.get(domicile_country))
+    # Countries are resolved to ISO codes by the CPI index (loaded once per process)
+    features["passport_country_risk"] = get_risk_category(cpi_score(passport_country, year))
+    features["domicile_country_risk"] = get_risk_category(cpi_score(domicile_country, year))
 
 
+@timed("feature_seconds")
 def append_one_hot_investment_profile(features: Dict[str, Any], client_json: Dict[str, Any]) -> None:
     """
     One-hot encodes investment profile attributes and appends them to the features dictionary.
@@ -164,9 +350,9 @@ def append_one_hot_investment_profile(features: Dict[str, Any], client_json: Dic
         features[key] = 1 if mandate == level else 0
 
 
+@timed("feature_seconds")
 def transform_median_salary(features: Dict[str, Any], client_json: Dict[str, Any], exchange_rates: Dict[str, float]) -> None:
-    currency = client_json.get("client_profile", {}).get("currency", "EUR")
-    rate = exchange_rates.get(currency, 1.0)
+    rate = client_rate_to_eur(client_json, exchange_rates)
 
     median_salary = features.get("median_salary", 0)
     median_salary_eur = median_salary * rate
@@ -175,6 +361,7 @@ def transform_median_salary(features: Dict[str, Any], client_json: Dict[str, Any
     features["log_median_salary_eur"] = math.log1p(median_salary_eur)
 
 
+@timed("feature_seconds")
 def append_textual_features(features: Dict[str, Any], client_json: Dict[str, Any]) -> None:
     # Nationality from passport
     passport_data = client_json.get("passport", {})
@@ -208,27 +395,37 @@ def save_json_to_file(data: dict, output_path: Path) -> None:
         json.dump(data, f, indent=2, ensure_ascii=False)
 
 
-def process_client_file(json_file: Path, exchange_rates: Dict[str, float], output_dir: Path):
+@timed("client_seconds", stage="features")
+def process_client(client_name: str, client_json: Dict[str, Any], exchange_rates: Dict[str, float], output_dir: Path,
+                   features: Optional[Dict[str, Any]] = None, local: bool = False):
+    """
+    Extracts and enriches the features of one client and writes features_<client_name>.json.
+
+    LLM features that were already extracted (e.g. by llm_async) can be passed in as `features`.
+    With `local`, the rule-based fields are computed locally (see extract_features_local).
+    """
     try:
-        output_filename = f"features_{json_file.name}"
+        output_filename = f"features_{client_name}.json"
         output_path = output_dir / output_filename
         if output_path.exists():
             return f"Already exists: {output_path}"
 
-        client_json = load_and_format_client_json(json_file)
         label = client_json.get("label", {})
         permitted = client_json.get("internal_score", {}).get("preprocessing", False)
         if not permitted:
             return f"Skipping {output_path}: filtered by preprocessing"
 
-        features = extract_features_from_client_json(client_json)
+        if features is None:
+            features = extract_features_local(client_json) if local else extract_features_from_client_json(client_json)
 
         # Check for invalid results
         if "error" in features:
-            return f"Error in LLM extraction for {json_file.name}: {features['error']}"
+            increment("clients_total", stage="features", result="error")
+            return f"Error in LLM extraction for {client_name}: {features['error']}"
 
         if "raw_response" in features:
-            return f"Unexpected raw response in {json_file.name}:\n{features['raw_response']}"
+            increment("clients_total", stage="features", result="error")
+            return f"Unexpected raw response in {client_name}:\n{features['raw_response']}"
 
         # Append all derived features
         append_asset_values(features, client_json, exchange_rates)
@@ -247,9 +444,239 @@ def process_client_file(json_file: Path, exchange_rates: Dict[str, float], outpu
 
         # Output path: features_client_X.json
         save_json_to_file(final_output, output_path)
+        increment("clients_total", stage="features", result="written")
         return str(output_path)
+    except Exception as e:
+        return f"Failed to process {client_name}: {e}"
+
+
+def features_version(local: bool = False) -> str:
+    """Version of the feature files, see manifest.code_version."""
+    return code_version(*FEATURE_SOURCES, extra={"local": local})
+
+
+def outdated_features(client_name: str, client_json: Dict[str, Any], output_dir: Path, manifest) -> bool:
+    """
+    Checks a client against the feature manifest: True if its documents (FEATURE_DOCUMENTS) or the
+    feature code changed since its feature file was written, or the file is missing. An outdated
+    file is removed, so the "already exists" checks of process_client let it be written again.
+    """
+    output_path = output_dir / f"features_{client_name}.json"
+    permitted = client_json.get("internal_score", {}).get("preprocessing", False)
+    digest = client_digest(client_json, FEATURE_DOCUMENTS)
+    if manifest.is_current(client_name, digest) and (output_path.exists() or not permitted):
+        return False
+    output_path.unlink(missing_ok=True)
+    return True
+
+
+def record_features(client_name: str, client_json: Dict[str, Any], output_dir: Path, manifest) -> None:
+    """Records a processed client in the feature manifest, unless its extraction failed."""
+    permitted = client_json.get("internal_score", {}).get("preprocessing", False)
+    if not permitted or (output_dir / f"features_{client_name}.json").exists():
+        manifest.record(client_name, client_digest(client_json, FEATURE_DOCUMENTS))
+
+
+def process_client_file(json_file: Path, exchange_rates: Dict[str, float], output_dir: Path, local: bool = False,
+                        manifest=None):
+    """
+    Extracts the features of one client file. Without a manifest (see manifest.open_manifest) an
+    existing feature file is kept; with one, it is rewritten when the client or the feature code
+    changed since it was written.
+    """
+    output_path = output_dir / f"features_{json_file.name}"
+    if manifest is None and output_path.exists():
+        return f"Already exists: {output_path}"
+
+    try:
+        client_json = load_and_format_client_json(json_file)
     except Exception as e:
         return f"Failed to process {json_file.name}: {e}"
+    if manifest is None:
+        return process_client(json_file.stem, client_json, exchange_rates, output_dir, local=local)
+
+    if not outdated_features(json_file.stem, client_json, output_dir, manifest):
+        return f"Up to date: {output_path}"
+    result = process_client(json_file.stem, client_json, exchange_rates, output_dir, local=local)
+    record_features(json_file.stem, client_json, output_dir, manifest)
+    return result
+
+
+def iter_pending_client_files(client_files, output_dir: Path, manifest=None):
+    """
+    Loads the permitted, not yet extracted clients of the given JSON files. With a manifest, clients
+    whose feature file is outdated are pending as well (see outdated_features).
+    """
+    for json_file in client_files:
+        if manifest is None and (output_dir / f"features_{json_file.name}").exists():
+            continue
+        client_json = load_and_format_client_json(json_file)
+        if manifest is not None and not outdated_features(json_file.stem, client_json, output_dir, manifest):
+            continue
+        if client_json.get("internal_score", {}).get("preprocessing", False):
+            yield json_file.stem, client_json
+        elif manifest is not None:
+            # Rejected clients have nothing to extract
+            record_features(json_file.stem, client_json, output_dir, manifest)
+
+
+def run_async_extraction(clients, exchange_rates: Dict[str, float], output_dir: Path, **kwargs) -> None:
+    """
+    Extracts the features of (client name, client JSON) pairs with the asyncio engine of
+    llm_async.py. Each client is post-processed and written as soon as its reply arrives.
+    """
+    from llm_async import extract_features_batch
+
+    names, client_jsons = zip(*clients) if clients else ((), ())
+
+    def on_result(idx, features):
+        print(f"Processed: {process_client(names[idx], client_jsons[idx], exchange_rates, output_dir, features=features)}")
+
+    extract_features_batch(list(client_jsons), on_result=on_result, **kwargs)
+
+
+def merge_batch_results(results_path: Path, clients, exchange_rates: Dict[str, float], output_dir: Path,
+                        cache_path: Optional[Path] = LLM_CACHE_PATH) -> Dict[str, str]:
+    """
+    Merges the results file of a batch job (see llm_batch.py) back into per-client feature files,
+    enriching each reply with the same append_* steps as the online modes. Successful replies are
+    also added to the LLM cache.
+
+    Args:
+        results_path (Path): Batch results file (JSONL), downloaded or written locally.
+        clients (iterable): (client name, client JSON) pairs the batch was built from.
+        exchange_rates (dict): Exchange rates to EUR.
+        output_dir (Path): Directory of the feature files.
+        cache_path (Path): LLM response cache, None to leave it untouched.
+
+    Returns:
+        dict: The process_client outcome per client name.
+    """
+    from llm_batch import read_batch_results
+
+    results = read_batch_results(results_path)
+    outcomes = {}
+    for client_name, client_json in clients:
+        features = results.get(client_name, {"error": "missing from batch results"})
+        if cache_path is not None and "error" not in features and "raw_response" not in features:
+            cache_key = make_cache_key(MODEL, TEMPERATURE, SYSTEM_PROMPT, make_user_prompt(client_json),
+                                       ClientFeatures.model_json_schema())
+            put_cached_response(cache_key, features, cache_path)
+        outcomes[client_name] = process_client(client_name, client_json, exchange_rates, output_dir, features=features)
+    return outcomes
+
+
+def _batch_job_name(clients) -> str:
+    # Job files are keyed by the clients they hold, so a batch left over by a run for other
+    # clients is never resumed or merged
+    names = "\n".join(sorted(client_name for client_name, _ in clients))
+    return f"requests_{hashlib.sha256(names.encode('utf-8')).hexdigest()[:16]}"
+
+
+def _batch_client_names(batch_path: Path) -> set:
+    # The custom_ids of a job file, i.e. the names of the clients it was written for
+    with open(batch_path, "r", encoding="utf-8") as f:
+        return {json.loads(line)["custom_id"] for line in f if line.strip()}
+
+
+def run_batch_extraction(clients, exchange_rates: Dict[str, float], output_dir: Path, batch_dir: Path,
+                         poll_seconds: float = 60.0) -> None:
+    """
+    Extracts the features of (client name, client JSON) pairs through the batch API: writes the
+    job file, submits it (or resumes polling a batch submitted earlier for the same clients),
+    waits for the results and merges them.
+
+    The job files (<job>.jsonl, its .batch_id, <job>.results.jsonl) are named after a digest of
+    the client names and removed once the results are merged or the batch ends without completing
+    (failed, expired, cancelled), so the next run submits a fresh batch.
+    """
+    from llm_batch import write_batch_file, submit_batch, wait_for_batch
+
+    batch_dir.mkdir(parents=True, exist_ok=True)
+    job_name = _batch_job_name(clients)
+    batch_path = batch_dir / f"{job_name}.jsonl"
+    results_path = batch_dir / f"{job_name}.results.jsonl"
+    batch_id_path = Path(f"{batch_path}.batch_id")
+    job_files = [batch_path, batch_id_path, results_path, Path(f"{results_path}.errors")]
+
+    def remove_job_files():
+        for path in job_files:
+            path.unlink(missing_ok=True)
+
+    client_names = {client_name for client_name, _ in clients}
+    if batch_path.exists() and _batch_client_names(batch_path) != client_names:
+        print(f"Batch job {batch_path} was written for other clients, submitting a new one")
+        remove_job_files()
+
+    if not results_path.exists():
+        if batch_id_path.exists():
+            batch_id = batch_id_path.read_text().strip()
+        else:
+            print(f"Wrote {write_batch_file(clients, batch_path)} requests to {batch_path}")
+            batch_id = submit_batch(batch_path)
+        status = wait_for_batch(batch_id, results_path, poll_seconds=poll_seconds)
+        if status != "completed":
+            print(f"Batch {batch_id} ended with status {status}")
+            remove_job_files()
+            return
+
+    for client_name, outcome in merge_batch_results(results_path, clients, exchange_rates, output_dir).items():
+        print(f"Processed: {outcome}")
+    remove_job_files()
+
+
+def run_packed_extraction(clients, exchange_rates: Dict[str, float], output_dir: Path, pack_size: int = 8) -> None:
+    """Extracts the features of (client name, client JSON) pairs with packed prompts and writes them."""
+    features_by_id = extract_features_packed(clients, pack_size=pack_size)
+    for client_name, client_json in clients:
+        print(f"Processed: {process_client(client_name, client_json, exchange_rates, output_dir, features=features_by_id[client_name])}")
+
+
+def write_numeric_features(clients, output_path: Path) -> int:
+    """
+    Writes the columns of append_asset_values, append_salary_stats, append_age and
+    append_one_hot_investment_profile for (client name, client JSON) pairs as one float32 matrix
+    (Parquet, indexed by client name) instead of per-client JSON files. The matrix is built for
+    all clients at once by batch_features.build_numeric_features and needs no LLM request.
+
+    Returns:
+        int: The number of clients written.
+    """
+    from batch_features import build_numeric_features
+
+    names, client_jsons = zip(*clients) if clients else ((), ())
+    matrix = build_numeric_features(list(client_jsons), client_ids=list(names))
+    matrix.to_parquet(output_path)
+    return len(matrix)
+
+
+def iter_store_clients(store_path: Path, output_dir: Path, manifest=None):
+    """
+    Reads the permitted, not yet extracted clients of a columnar client store in one bulk pass.
+
+    Only the documents needed for feature extraction are read; the internal_score column is read
+    first so rejected clients never have their other documents decoded. With a manifest, every
+    client is read and those whose feature file is outdated are pending as well.
+    """
+    from client_store import iter_client_store
+
+    if manifest is not None:
+        for client_id, client_json in iter_client_store(store_path, documents=FEATURE_DOCUMENTS):
+            if not outdated_features(client_id, client_json, output_dir, manifest):
+                continue
+            if client_json.get("internal_score", {}).get("preprocessing", False):
+                yield client_id, client_json
+            else:
+                record_features(client_id, client_json, output_dir, manifest)
+        return
+
+    pending = {
+        client_id
+        for client_id, client_data in iter_client_store(store_path, documents=["internal_score"])
+        if client_data.get("internal_score", {}).get("preprocessing", False)
+        and not (output_dir / f"features_{client_id}.json").exists()
+    }
+    yield from iter_client_store(store_path, documents=FEATURE_DOCUMENTS, client_ids=pending)
 
 
 if __name__ == "__main__":
@@ -259,16 +686,71 @@ if __name__ == "__main__":
 
     # Centralize exchange rates
     exchange_rates = get_current_exchange_rates()
-    client_files = list(input_dir.glob("client_*.json"))
+    backend = "json"  # "parquet" to read the columnar client store in preprocessing/client_store
+    # "async" for the rate-limit-aware asyncio engine of llm_async.py, "batch" for the batch API,
+    # "packed" for several clients per request, "local" for rule-based fields plus a short LLM prompt
+    engine = "threads"
     parallel = True
+    # "matrix" to only write the numeric features of all permitted clients as one float32 matrix
+    # (numeric_features.parquet, see write_numeric_features) instead of the per-client JSON files
+    output = "json"
+
+    if output == "matrix":
+        if backend == "parquet":
+            from client_store import iter_client_store
+            store_path = Path(__file__).resolve().parent.parent / "preprocessing" / "client_store"
+            clients = iter_client_store(store_path, documents=FEATURE_DOCUMENTS)
+        else:
+            client_files = sorted(input_dir.glob("client_*.json"), key=lambda path: int(path.stem.split("_")[1]))
+            clients = ((path.stem, load_and_format_client_json(path)) for path in client_files)
+        permitted = [(client_name, client_json) for client_name, client_json in clients
+                     if client_json.get("internal_score", {}).get("preprocessing", False)]
+        matrix_path = output_dir / "numeric_features.parquet"
+        print(f"Wrote the numeric features of {write_numeric_features(permitted, matrix_path)} clients to {matrix_path}")
+        sys.exit(0)
+
+    if not has_api_key():
+        print("No OPENAI_API_KEY configured, extracting all features offline.")
+        engine = "local"
+    local = engine == "local"
+    # Only new clients, amended clients and clients whose feature code changed are extracted
+    manifest = open_manifest(manifest_path_for(output_dir), "features", features_version(local))
+
+    if engine in ("async", "batch", "packed"):
+        if backend == "parquet":
+            store_path = Path(__file__).resolve().parent.parent / "preprocessing" / "client_store"
+            clients = list(iter_store_clients(store_path, output_dir, manifest))
+        else:
+            clients = list(iter_pending_client_files(input_dir.glob("client_*.json"), output_dir, manifest))
+        if engine == "async":
+            run_async_extraction(clients, exchange_rates, output_dir)
+        elif engine == "packed":
+            run_packed_extraction(clients, exchange_rates, output_dir)
+        else:
+            run_batch_extraction(clients, exchange_rates, output_dir, Path(__file__).resolve().parent / "batch")
+        for client_name, client_json in clients:
+            record_features(client_name, client_json, output_dir, manifest)
+        manifest.save()
+        sys.exit(0)
+
+    pending = []
+    if backend == "parquet":
+        store_path = Path(__file__).resolve().parent.parent / "preprocessing" / "client_store"
+        pending = list(iter_store_clients(store_path, output_dir, manifest))
+        tasks = [(process_client, (client_id, client_json, exchange_rates, output_dir, None, local))
+                 for client_id, client_json in pending]
+    else:
+        client_files = list(input_dir.glob("client_*.json"))
+        tasks = [(process_client_file, (path, exchange_rates, output_dir, local, manifest)) for path in client_files]
 
     if not parallel:
-        result = process_client_file(client_files[0], exchange_rates, output_dir)
+        fn, args = tasks[0]
+        result = fn(*args)
         print(result)
         sys.exit(1)
 
     with ThreadPoolExecutor(max_workers=6) as executor:  # Tune number based on your API rate limit
-        futures = [executor.submit(process_client_file, path, exchange_rates, output_dir) for path in client_files]
+        futures = [executor.submit(fn, *args) for fn, args in tasks]
         try:
             for future in as_completed(futures):
                 result = future.result()
@@ -277,4 +759,9 @@ if __name__ == "__main__":
         except KeyboardInterrupt:
             print("\nInterrupted by user. Shutting down...")
             executor.shutdown(cancel_futures=True)
-            sys.exit(1)
\ No newline at end of file
+            manifest.save()
+            sys.exit(1)
+    for client_name, client_json in pending:
+        record_features(client_name, client_json, output_dir, manifest)
+    manifest.save()
+    print(f"{manifest.stats['recomputed']} clients extracted or updated")
@@ -0,0 +1,267 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Dict, Any, List, Optional, Callable
+from dotenv import load_dotenv
+
+from llm import MODEL, TEMPERATURE, SYSTEM_PROMPT, ClientFeatures, make_user_prompt
+from llm_cache import LLM_CACHE_PATH, make_cache_key, get_cached_response, put_cached_response
+
+# The metrics module is shared with the preprocessing stage
+sys.path.append(str(Path(__file__).resolve().parent.parent / "preprocessing"))
+
+from pipeline_metrics import observe_llm_request
+
+# Budgets of the API account; requests are spread so neither is exceeded
+REQUESTS_PER_MINUTE = 500
+TOKENS_PER_MINUTE = 200_000
+
+# Adaptive concurrency window: grows by one per window of successes, halves on a 429
+INITIAL_CONCURRENCY = 4
+MAX_CONCURRENCY = 64
+
+MAX_ATTEMPTS = 6
+BASE_BACKOFF_SECONDS = 1.0
+MAX_BACKOFF_SECONDS = 60.0
+
+# Rough completion size of a ClientFeatures reply, reserved up front and settled with the real usage
+ESTIMATED_COMPLETION_TOKENS = 300
+
+
+def make_async_client():
+    """Creates the one pooled AsyncOpenAI client of a run. Retries are left to the engine."""
+    from openai import AsyncOpenAI
+
+    env_path = Path(__file__).resolve().parent.parent / ".env"
+    load_dotenv(dotenv_path=env_path)
+    return AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token), good enough for budgeting."""
+    return len(text) // 4 + 1
+
+
+def is_retryable(error: Exception) -> bool:
+    status_code = getattr(error, "status_code", None)
+    if status_code is None:
+        # Connection errors and timeouts carry no status code
+        return type(error).__name__ in ("APIConnectionError", "APITimeoutError")
+    return status_code == 429 or status_code >= 500
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+async def extract_features_async(
+    client_jsons: List[Dict[str, Any]],
+    client=None,
+    requests_per_minute: int = REQUESTS_PER_MINUTE,
+    tokens_per_minute: int = TOKENS_PER_MINUTE,
+    max_concurrency: int = MAX_CONCURRENCY,
+    cache_path: Optional[Path] = LLM_CACHE_PATH,
+    on_result: Optional[Callable[[int, Dict[str, Any]], None]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Extracts the LLM features of many clients concurrently, staying within the API rate limits.
+
+    Requests draw from a token bucket per budget (requests and tokens per minute), run inside an
+    adaptive concurrency window, and are retried with jittered exponential backoff on 429, 5xx
+    and connection errors. Cached responses (see llm_cache.py) are returned without a request.
+    The cache lookups and on_result run in worker threads, so their I/O never blocks the event
+    loop while other requests are in flight.
+
+    Args:
+        client_jsons (list): Client data dicts.
+        client: Async OpenAI-compatible client, a pooled AsyncOpenAI client if None.
+        requests_per_minute (int): Request budget.
+        tokens_per_minute (int): Token budget (prompt and completion).
+        max_concurrency (int): Upper bound of the concurrency window.
+        cache_path (Path): LLM response cache, None to always query the API.
+        on_result (callable): Called with (index, features) as soon as each client is done, from a
+            worker thread (calls for different clients may overlap).
+
+    Returns:
+        list: Per client, in input order, the features dict like extract_features_from_client_json
+        returns it (or a dict with "error" / "raw_response").
+    """
+    client = client or make_async_client()
+    response_schema = ClientFeatures.model_json_schema()
+
+    bucket = {"requests": float(requests_per_minute), "tokens": float(tokens_per_minute), "updated": time.monotonic()}
+    bucket_lock = asyncio.Lock()
+    window = {"size": float(min(INITIAL_CONCURRENCY, max_concurrency)), "in_flight": 0}
+    window_changed = asyncio.Condition()
+
+    async def take(tokens):
+        # Both budgets refill continuously at their per-minute rate
+        tokens = min(tokens, tokens_per_minute)
+        while True:
+            async with bucket_lock:
+                now = time.monotonic()
+                elapsed = now - bucket["updated"]
+                bucket["updated"] = now
+                bucket["requests"] = min(requests_per_minute, bucket["requests"] + elapsed * requests_per_minute / 60)
+                bucket["tokens"] = min(tokens_per_minute, bucket["tokens"] + elapsed * tokens_per_minute / 60)
+                if bucket["requests"] >= 1 and bucket["tokens"] >= tokens:
+                    bucket["requests"] -= 1
+                    bucket["tokens"] -= tokens
+                    return
+                wait = max(
+                    (1 - bucket["requests"]) * 60 / requests_per_minute,
+                    (tokens - bucket["tokens"]) * 60 / tokens_per_minute,
+                )
+            await asyncio.sleep(wait)
+
+    async def settle(estimated, response):
+        # Charge the actual usage instead of the estimate (may go negative and throttle later requests)
+        usage = getattr(response, "usage", None)
+        if usage is not None and getattr(usage, "total_tokens", None):
+            async with bucket_lock:
+                bucket["tokens"] -= usage.total_tokens - estimated
+
+    async def enter():
+        async with window_changed:
+            await window_changed.wait_for(lambda: window["in_flight"] < int(window["size"]))
+            window["in_flight"] += 1
+
+    async def leave(throttled):
+        async with window_changed:
+            window["in_flight"] -= 1
+            if throttled:
+                window["size"] = max(1.0, window["size"] / 2)
+            else:
+                window["size"] = min(float(max_concurrency), window["size"] + 1 / window["size"])
+            window_changed.notify_all()
+
+    async def extract(client_json):
+        user_prompt = make_user_prompt(client_json)
+        cache_key = None
+        if cache_path is not None:
+            cache_key = make_cache_key(MODEL, TEMPERATURE, SYSTEM_PROMPT, user_prompt, response_schema)
+            cached = await asyncio.to_thread(get_cached_response, cache_key, cache_path)
+            if cached is not None:
+                return cached
+
+        estimated = estimate_tokens(SYSTEM_PROMPT + user_prompt) + ESTIMATED_COMPLETION_TOKENS
+        for attempt in range(MAX_ATTEMPTS):
+            await take(estimated)
+            await enter()
+            error = None
+            start = time.perf_counter()
+            try:
+                response = await client.beta.chat.completions.parse(
+                    model=MODEL,
+                    temperature=TEMPERATURE,
+                    messages=[
+                        {"role": "system", "content": SYSTEM_PROMPT},
+                        {"role": "user", "content": user_prompt}
+                    ],
+                    response_format=ClientFeatures,
+                )
+            except Exception as e:
+                error = e
+            finally:
+                await leave(throttled=getattr(error, "status_code", None) == 429)
+            observe_llm_request(time.perf_counter() - start, None if error else getattr(response, "usage", None),
+                                mode="async", outcome="error" if error else "ok")
+
+            if error is not None:
+                if not is_retryable(error) or attempt == MAX_ATTEMPTS - 1:
+                    return {"error": str(error)}
+                # Full jitter spreads out the retries of requests that were throttled together
+                backoff = random.uniform(0, min(MAX_BACKOFF_SECONDS, BASE_BACKOFF_SECONDS * 2 ** attempt))
+                await asyncio.sleep((retry_after_seconds(error) or 0) + backoff)
+                continue
+
+            await settle(estimated, response)
+            message = response.choices[0].message.content
+            try:
+                features = json.loads(message)
+            except json.JSONDecodeError:
+                return {"raw_response": message}
+            if cache_key is not None:
+                await asyncio.to_thread(put_cached_response, cache_key, features, cache_path)
+            return features
+
+    results = [None] * len(client_jsons)
+
+    async def run(idx, client_json):
+        results[idx] = await extract(client_json)
+        if on_result is not None:
+            await asyncio.to_thread(on_result, idx, results[idx])
+
+    await asyncio.gather(*(run(idx, client_json) for idx, client_json in enumerate(client_jsons)))
+    return results
+
+
+def extract_features_batch(client_jsons: List[Dict[str, Any]], **kwargs) -> List[Dict[str, Any]]:
+    """Synchronous entry point of extract_features_async, see there for the arguments."""
+    return asyncio.run(extract_features_async(client_jsons, **kwargs))
+
+
+def make_mock_client(max_in_flight: int = 16, latency: float = 0.05, server_error_rate: float = 0.0, seed: int = 0):
+    """
+    Local stand-in for AsyncOpenAI to exercise the engine without network access. It answers
+    every request with an all-zero ClientFeatures reply after `latency` seconds, rejects requests
+    beyond `max_in_flight` concurrent ones with a 429 and fails a fraction with a 503.
+
+    Returns:
+        SimpleNamespace: The client; client.stats counts requests, 429s and 503s.
+    """
+    rng = random.Random(seed)
+    stats = {"requests": 0, "rate_limited": 0, "server_errors": 0, "in_flight": 0, "max_in_flight": 0}
+    reply = json.dumps({name: 0 for name in ClientFeatures.model_fields})
+
+    def status_error(status_code):
+        error = Exception(f"Error code: {status_code}")
+        error.status_code = status_code
+        return error
+
+    async def parse(model, temperature, messages, response_format):
+        stats["requests"] += 1
+        if stats["in_flight"] >= max_in_flight:
+            stats["rate_limited"] += 1
+            raise status_error(429)
+        stats["in_flight"] += 1
+        stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+        try:
+            await asyncio.sleep(latency)
+        finally:
+            stats["in_flight"] -= 1
+        if rng.random() < server_error_rate:
+            stats["server_errors"] += 1
+            raise status_error(503)
+        prompt_tokens = sum(estimate_tokens(message["content"]) for message in messages)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=reply))],
+            usage=SimpleNamespace(total_tokens=prompt_tokens + estimate_tokens(reply)),
+        )
+
+    completions = SimpleNamespace(parse=parse)
+    return SimpleNamespace(beta=SimpleNamespace(chat=SimpleNamespace(completions=completions)), stats=stats)
+
+
+if __name__ == "__main__":
+    client_dir = Path(__file__).resolve().parent.parent / "preprocessing" / "all_clients"
+    client_jsons = []
+    for path in sorted(client_dir.glob("client_*.json"))[:200]:
+        with open(path, "r", encoding="utf-8") as f:
+            client_jsons.append(json.load(f))
+
+    mock_client = make_mock_client(max_in_flight=16, server_error_rate=0.02)
+    start = time.perf_counter()
+    # The mock does not enforce token budgets, so only its concurrency limit applies
+    results = extract_features_batch(client_jsons, client=mock_client, cache_path=None, tokens_per_minute=10**9)
+    print(f"{len(results)} clients in {time.perf_counter() - start:.2f}s, errors: {sum('error' in r for r in results)}, "
+          f"mock stats: {mock_client.stats}")
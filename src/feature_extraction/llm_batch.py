@@ -0,0 +1,160 @@
+import os
+import json
+import time
+from pathlib import Path
+from typing import Dict, Any, Iterable, Tuple
+from dotenv import load_dotenv
+
+from llm import MODEL, TEMPERATURE, SYSTEM_PROMPT, ClientFeatures, make_user_prompt
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_COMPLETION_WINDOW = "24h"
+BATCH_FINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+def make_client():
+    from openai import OpenAI
+
+    env_path = Path(__file__).resolve().parent.parent / ".env"
+    load_dotenv(dotenv_path=env_path)
+    return OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+
+def client_features_response_format() -> Dict[str, Any]:
+    """Structured-output response format of ClientFeatures, as the batch request body needs it."""
+    schema = ClientFeatures.model_json_schema()
+    schema["additionalProperties"] = False
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": "ClientFeatures", "schema": schema, "strict": True},
+    }
+
+
+def build_batch_request(custom_id: str, client_json: Dict[str, Any]) -> Dict[str, Any]:
+    """One line of a batch job file: the same request extract_features_from_client_json sends."""
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": BATCH_ENDPOINT,
+        "body": {
+            "model": MODEL,
+            "temperature": TEMPERATURE,
+            "messages": [
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": make_user_prompt(client_json)}
+            ],
+            "response_format": client_features_response_format(),
+        },
+    }
+
+
+def write_batch_file(clients: Iterable[Tuple[str, Dict[str, Any]]], batch_path: Path) -> int:
+    """
+    Writes the batch job file (JSONL) for (client name, client JSON) pairs. The client name is
+    the custom_id of its request, so results can be matched back to the client.
+
+    Returns:
+        int: The number of requests written.
+    """
+    count = 0
+    with open(batch_path, "w", encoding="utf-8") as f:
+        for client_name, client_json in clients:
+            f.write(json.dumps(build_batch_request(client_name, client_json), ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+
+def submit_batch(batch_path: Path, client=None) -> str:
+    """
+    Uploads a batch job file and starts the batch. The batch ID is also stored next to the job
+    file (<batch_path>.batch_id), so a later run can resume polling.
+
+    Returns:
+        str: The batch ID.
+    """
+    client = client or make_client()
+    with open(batch_path, "rb") as f:
+        input_file = client.files.create(file=f, purpose="batch")
+    batch = client.batches.create(
+        input_file_id=input_file.id,
+        endpoint=BATCH_ENDPOINT,
+        completion_window=BATCH_COMPLETION_WINDOW,
+    )
+    Path(f"{batch_path}.batch_id").write_text(batch.id)
+    return batch.id
+
+
+def wait_for_batch(batch_id: str, results_path: Path, client=None, poll_seconds: float = 60.0) -> str:
+    """
+    Polls a batch until it reaches a final status and downloads its results file (and the
+    error file, as <results_path>.errors, if some requests failed).
+
+    Returns:
+        str: The final status of the batch, e.g. "completed".
+    """
+    client = client or make_client()
+    while True:
+        batch = client.batches.retrieve(batch_id)
+        if batch.status in BATCH_FINAL_STATUSES:
+            break
+        counts = batch.request_counts
+        print(f"Batch {batch_id} is {batch.status}" + (f" ({counts.completed}/{counts.total})" if counts else ""))
+        time.sleep(poll_seconds)
+
+    if batch.output_file_id:
+        Path(results_path).write_bytes(client.files.content(batch.output_file_id).content)
+    if batch.error_file_id:
+        Path(f"{results_path}.errors").write_bytes(client.files.content(batch.error_file_id).content)
+    return batch.status
+
+
+def read_batch_results(results_path: Path) -> Dict[str, Dict[str, Any]]:
+    """
+    Parses a batch results file into the features of each request, keyed by custom_id. Failed
+    requests map to {"error": ...} and unparseable replies to {"raw_response": ...}, like
+    extract_features_from_client_json returns them.
+    """
+    results = {}
+    with open(results_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            result = json.loads(line)
+            response = result.get("response") or {}
+            if result.get("error") or response.get("status_code") != 200:
+                results[result["custom_id"]] = {"error": str(result.get("error") or response.get("body"))}
+                continue
+
+            message = response["body"]["choices"][0]["message"]["content"]
+            try:
+                results[result["custom_id"]] = json.loads(message)
+            except json.JSONDecodeError:
+                results[result["custom_id"]] = {"raw_response": message}
+    return results
+
+
+def write_local_results(batch_path: Path, results_path: Path) -> int:
+    """
+    Writes a results file for a batch job file without calling the API, answering every request
+    with an all-zero ClientFeatures reply. Used to exercise the merge step offline.
+
+    Returns:
+        int: The number of results written.
+    """
+    reply = json.dumps({name: 0 for name in ClientFeatures.model_fields})
+    count = 0
+    with open(batch_path, "r", encoding="utf-8") as batch_file, open(results_path, "w", encoding="utf-8") as results_file:
+        for line in batch_file:
+            request = json.loads(line)
+            result = {
+                "id": f"batch_req_{count}",
+                "custom_id": request["custom_id"],
+                "response": {
+                    "status_code": 200,
+                    "body": {"model": request["body"]["model"], "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}}]},
+                },
+                "error": None,
+            }
+            results_file.write(json.dumps(result) + "\n")
+            count += 1
+    return count
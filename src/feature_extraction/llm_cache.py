@@ -0,0 +1,92 @@
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+from pathlib import Path
+from typing import Dict, Any, Optional
+
+# The metrics module is shared with the preprocessing stage
+sys.path.append(str(Path(__file__).resolve().parent.parent / "preprocessing"))
+
+from pipeline_metrics import increment
+
+LLM_CACHE_PATH = Path(__file__).resolve().parent / "llm_cache.sqlite"
+# Least recently used entries beyond this are evicted
+LLM_CACHE_MAX_ENTRIES = 100_000
+
+
+def make_cache_key(model: str, temperature: float, system_prompt: str, user_prompt: str, response_schema: Dict[str, Any]) -> str:
+    """
+    Content address of an LLM request: the SHA-256 of everything that determines the response.
+
+    Editing the system prompt, the response schema, the model or the temperature changes every
+    key; a changed client section only changes the keys of the clients whose prompt it affects.
+    """
+    payload = json.dumps(
+        [model, temperature, system_prompt, user_prompt, response_schema],
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _connect(cache_path: Path) -> sqlite3.Connection:
+    # One short-lived connection per call, so the cache is safe to use from worker threads
+    connection = sqlite3.connect(cache_path, timeout=30)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS llm_cache ("
+        "key TEXT PRIMARY KEY, response TEXT NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL)"
+    )
+    connection.execute("CREATE INDEX IF NOT EXISTS llm_cache_last_used ON llm_cache (last_used)")
+    return connection
+
+
+def get_cached_response(key: str, cache_path: Path = LLM_CACHE_PATH) -> Optional[Dict[str, Any]]:
+    """Returns the cached response for a key (marking it as recently used), None on a miss."""
+    connection = _connect(cache_path)
+    try:
+        with connection:
+            row = connection.execute("SELECT response FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            increment("cache_requests_total", cache="llm", result="miss" if row is None else "hit")
+            if row is None:
+                return None
+            connection.execute("UPDATE llm_cache SET last_used = ? WHERE key = ?", (time.time(), key))
+        return json.loads(row[0])
+    finally:
+        connection.close()
+
+
+def put_cached_response(key: str, response: Dict[str, Any], cache_path: Path = LLM_CACHE_PATH,
+                        max_entries: int = LLM_CACHE_MAX_ENTRIES) -> None:
+    """Stores a response and evicts the least recently used entries beyond max_entries."""
+    now = time.time()
+    connection = _connect(cache_path)
+    try:
+        with connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, response, created, last_used) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(response, ensure_ascii=False), now, now),
+            )
+            connection.execute(
+                "DELETE FROM llm_cache WHERE key IN "
+                "(SELECT key FROM llm_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (max_entries,),
+            )
+    finally:
+        connection.close()
+
+
+def cache_stats(cache_path: Path = LLM_CACHE_PATH) -> Dict[str, Any]:
+    """Returns the number of entries and the size of the cache file in bytes."""
+    connection = _connect(cache_path)
+    try:
+        entries = connection.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+    finally:
+        connection.close()
+    return {"entries": entries, "bytes": Path(cache_path).stat().st_size}
+
+
+if __name__ == "__main__":
+    print(cache_stats())
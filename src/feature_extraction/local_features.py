@@ -0,0 +1,176 @@
+import re
+from datetime import datetime
+from typing import Dict, Any, List
+
+# Seniority scale of the LLM prompt: Junior=1, Senior=2, Manager=3, Director=4, C-level=5, Chairman=6.
+# Title keywords (regex fragments) are matched as whole words, from the highest rank down.
+SENIORITY_KEYWORDS = [
+    (6, ["chairman", "chairwoman", "chair"]),
+    (5, ["ceo", "cfo", "coo", "cto", "cio", "cro", "cmo", "chief", r"(?<!vice )president", "owner", "founder",
+         "entrepreneur", "partner", "executive"]),
+    (4, ["director", "vp", "vice president", "head"]),
+    (3, ["manager"]),
+    (2, ["senior", "lead", "principal"]),
+    (1, ["junior", "assistant", "intern", "trainee", "analyst"]),
+]
+# Titles without a rank keyword (e.g. "Research Scientist") are experienced individual contributors
+DEFAULT_SENIORITY = 2
+
+# Age at graduation the LLM prompt accepts as consistent
+MIN_GRADUATION_AGE = 20
+MAX_GRADUATION_AGE = 35
+
+MARITAL_STATUSES = ["single", "married", "divorced", "widowed"]
+NUMBER_WORDS = {"one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10}
+
+# Fields the LLM is still asked for, because they need free text or general knowledge
+FREE_TEXT_FIELDS = [
+    "max_degree_prestige",
+    "founded_company",
+    "company_sold",
+    "marital_status_single",
+    "marital_status_married",
+    "marital_status_divorced",
+    "marital_status_widowed",
+    "num_children",
+    "consistency_employment",
+    "median_salary",
+]
+
+_SENIORITY_PATTERNS = [
+    (rank, re.compile(r"\b(" + "|".join(keywords) + r")\b", re.IGNORECASE))
+    for rank, keywords in SENIORITY_KEYWORDS
+]
+_CHILDREN_PATTERN = re.compile(r"\b(\d+|" + "|".join(NUMBER_WORDS) + r") (?:\w+ )?(?:children|child|kids|sons|daughters)\b", re.IGNORECASE)
+_NAMED_CHILDREN_PATTERN = re.compile(r"\b(?:child|children) (?:is|are) +named ([^.]+)", re.IGNORECASE)
+_NO_CHILDREN_PATTERN = re.compile(r"\b(?:no|not have any|don't have any|do not have any) children\b", re.IGNORECASE)
+
+
+def title_seniority(title: str) -> int:
+    """Maps a position or profession title to the seniority scale, 0 if there is no title."""
+    if not title or not title.strip():
+        return 0
+    for rank, pattern in _SENIORITY_PATTERNS:
+        if pattern.search(title):
+            return rank
+    return DEFAULT_SENIORITY
+
+
+def _birth_year(client_json: Dict[str, Any]):
+    birth_date = client_json.get("passport", {}).get("birth_date") or client_json.get("client_profile", {}).get("birth_date")
+    try:
+        return datetime.strptime(birth_date, "%Y-%m-%d").year
+    except (TypeError, ValueError):
+        return None
+
+
+def _jobs_by_start(employment: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return sorted(employment, key=lambda job: job.get("start_year") or 0)
+
+
+def extract_local_features(client_json: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Computes the ClientFeatures fields that follow from the structured client data alone:
+    degree one-hots, seniority of the client and the testator, consistency_education and
+    employment_progress.
+    """
+    client_profile = client_json.get("client_profile", {})
+    higher_education = client_profile.get("higher_education") or []
+    employment = client_profile.get("employment_history") or []
+    inheritance = client_profile.get("inheritance_details") or {}
+
+    # Degrees by count, as the prompt instructs: a single degree is a Bachelor's, each further
+    # degree is the next one up
+    degree_count = len(higher_education)
+    features = {
+        "degree_bachelor": int(degree_count >= 1),
+        "degree_other": 0,
+        "degree_master": int(degree_count >= 2),
+        "degree_phd": int(degree_count >= 3),
+        "degree_postdoc": int(degree_count >= 4),
+        "seniority": max((title_seniority(job.get("position", "")) for job in employment), default=0),
+        "testator_seniority": title_seniority(inheritance.get("profession", "")),
+    }
+
+    birth_year = _birth_year(client_json)
+    graduation_years = [degree.get("graduation_year") for degree in higher_education]
+    features["consistency_education"] = all(
+        isinstance(year, int) and birth_year is not None and MIN_GRADUATION_AGE <= year - birth_year <= MAX_GRADUATION_AGE
+        for year in graduation_years
+    )
+
+    # Salaries generally increase over time: more raises than cuts and ending above the start
+    salaries = [job.get("salary", 0) for job in _jobs_by_start(employment)]
+    raises = sum(later > earlier for earlier, later in zip(salaries, salaries[1:]))
+    cuts = sum(later < earlier for earlier, later in zip(salaries, salaries[1:]))
+    features["employment_progress"] = len(salaries) >= 2 and raises > cuts and salaries[-1] > salaries[0]
+    return features
+
+
+def estimate_free_text_features(client_json: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Offline estimates of FREE_TEXT_FIELDS, used when no LLM is available. They are cruder than the
+    LLM answers but keep the feature set complete.
+    """
+    client_profile = client_json.get("client_profile", {})
+    employment = client_profile.get("employment_history") or []
+    description = client_json.get("client_description", {})
+    description_text = " ".join(str(text) for text in description.values()) if isinstance(description, dict) else str(description)
+    current_year = datetime.now().year
+
+    # Prestige needs knowledge of the universities; the middle of the scale is the neutral guess
+    features = {"max_degree_prestige": 3 if client_profile.get("higher_education") else 0}
+
+    positions = " ".join(job.get("position", "") for job in employment)
+    features["founded_company"] = bool(
+        re.search(r"\b(founder|founded|co-founded)\b", positions + " " + description_text, re.IGNORECASE)
+    )
+    features["company_sold"] = 0
+
+    marital_status = str(client_profile.get("marital_status", "")).lower()
+    for status in MARITAL_STATUSES:
+        features[f"marital_status_{status}"] = int(marital_status == status)
+
+    family_text = description.get("Family Background", description_text) if isinstance(description, dict) else description_text
+    children = _CHILDREN_PATTERN.search(family_text)
+    named_children = _NAMED_CHILDREN_PATTERN.search(family_text)
+    if _NO_CHILDREN_PATTERN.search(family_text):
+        features["num_children"] = 0
+    elif children:
+        count = children.group(1).lower()
+        features["num_children"] = int(count) if count.isdigit() else NUMBER_WORDS[count]
+    elif named_children:
+        # "Their children are named A, B and C"
+        features["num_children"] = len([name for name in re.split(r",| and ", named_children.group(1)) if name.strip()])
+    else:
+        features["num_children"] = 0
+
+    # The employment checks of the prompt: no unexplained gaps over 3 years, nothing ending in the
+    # future, no six-figure salaries in junior roles
+    jobs = _jobs_by_start(employment)
+    gaps = [
+        (later.get("start_year") or 0) - (earlier.get("end_year") or current_year)
+        for earlier, later in zip(jobs, jobs[1:])
+    ]
+    features["consistency_employment"] = (
+        all(gap <= 3 for gap in gaps)
+        and all((job.get("end_year") or current_year) <= current_year for job in jobs)
+        and not any(title_seniority(job.get("position", "")) == 1 and job.get("salary", 0) > 100_000 for job in jobs)
+    )
+
+    # The reported salary of the most recent position stands in for the market median
+    current_jobs = [job for job in employment if job.get("end_year") is None]
+    latest_job = current_jobs[0] if current_jobs else max(employment, key=lambda job: job.get("end_year") or 0, default={})
+    features["median_salary"] = int(latest_job.get("salary", 0) or 0)
+    return features
+
+
+if __name__ == "__main__":
+    import json
+    from pathlib import Path
+
+    client_path = Path(__file__).resolve().parent.parent / "preprocessing" / "all_clients" / "client_4.json"
+    with open(client_path, "r", encoding="utf-8") as f:
+        client_json = json.load(f)
+    print(extract_local_features(client_json))
+    print(estimate_free_text_features(client_json))
@@ -1,7 +1,14 @@
 import os
+import sys
 import zipfile
 import json
 import pandas as pd
+import pyarrow as pa
+
+# The metrics module is shared with the preprocessing stage
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "preprocessing"))
+
+from pipeline_metrics import stage
 
 def extract_and_merge_jsons_2_list(input_folder):
     """
@@ -90,7 +97,7 @@ def try_convert_str2float(col: pd.Series, threshold: float = 1.0) -> pd.Series:
 
     if conversion_rate >= threshold:
         # Check if all non-null converted values are integers.
-        if converted.dropna().apply(lambda x: float(x).is_integer()).all():
+        if (converted.dropna() % 1 == 0).all():
             # Convert to pandas nullable integer type.
             return converted.astype('Int64')
         else:
@@ -105,50 +112,252 @@ def try_mixed_convert_str2float(df):
     return df
 # df now has its text columns converted to numeric types (int or float) when possible.
 
+# Column dtypes of the frame the predictor was trained on (see the feature types in the fit log
+# of autogluon_from_raw_min_v1.ipynb): these four are integers, every other field of the client
+# documents is text. Declaring them keeps the dtypes the same for every batch, where probing
+# depended on the values of the batch (e.g. a postal code column of a few clients that happen
+# to be all digits).
+INT_COLUMNS = [
+    "client_profile.secondary_school.graduation_year",
+    "client_profile.aum.savings",
+    "client_profile.aum.inheritance",
+    "client_profile.aum.real_estate_value",
+]
+STRING_COLUMN_PREFIXES = ("passport.", "client_profile.", "account_form.", "client_description.")
+STRING_DTYPE = pd.StringDtype("pyarrow")
+
+# dtypes probed for columns outside the declared schema (e.g. label.label), by column name, so
+# only the first batch that contains a column pays for the probing
+_inferred_dtypes = {}
+
+
+def infer_column_dtype(col: pd.Series) -> str:
+    """The dtype the probing of convert_dtype and try_convert_str2float gives a column."""
+    if col.dtype != object and not isinstance(col.dtype, pd.StringDtype):
+        return str(col.dtype)
+    return str(try_convert_str2float(col.astype(STRING_DTYPE), threshold=1.0).dtype)
+
+
+def column_dtype(column: str, col: pd.Series) -> str:
+    if column in INT_COLUMNS:
+        return "int64"
+    if column.startswith(STRING_COLUMN_PREFIXES):
+        return "string"
+    if column not in _inferred_dtypes:
+        _inferred_dtypes[column] = infer_column_dtype(col)
+    return _inferred_dtypes[column]
+
+
+def cast_column(col: pd.Series, dtype: str) -> pd.Series:
+    """
+    Parses a column straight into its dtype. Values a numeric column cannot hold become missing,
+    and integer columns with missing values fall back to float64, as json_normalize gives them.
+    """
+    if dtype in ("string", "str"):
+        return col.astype(STRING_DTYPE)
+    if dtype not in ("int64", "Int64", "float64"):
+        return col.astype(dtype)
+
+    converted = pd.to_numeric(col, errors="coerce")
+    integral = (converted.dropna() % 1 == 0).all()
+    if dtype == "float64" or not integral or (dtype == "int64" and converted.isna().any()):
+        return converted.astype("float64")
+    return converted.astype(dtype)
+
+
 # turn list of json into pandas dataframe
 def list_json_2_df(list_json):
     df = pd.json_normalize(list_json)
-    
-    
+
     #df = df.rename(columns = {'label.label':'label'})
     #df['label'] = df['label'].replace({'Accept':1, 'Reject':0})
-    
 
-    df = try_mixed_convert_str2float(convert_dtype(df))
+    return pd.DataFrame(
+        {column: cast_column(df[column], column_dtype(column, df[column])) for column in df.columns},
+        index=df.index,
+    )
+
+
+# Nested lists of the client documents, kept as Arrow list columns by list_json_2_compact_df
+# instead of their text form
+LIST_COLUMNS = [
+    "passport.passport_mrz",
+    "client_profile.higher_education",
+    "client_profile.employment_history",
+    "client_profile.real_estate_details",
+    "client_profile.preferred_markets",
+]
+# Text columns with at most this share of distinct values are dictionary-encoded (category)
+CATEGORY_MAX_RATIO = 0.5
+
+
+def _arrow_list_column(col: pd.Series):
+    # None for lists whose values Arrow cannot type consistently (the column then stays text)
+    values = [value if isinstance(value, list) else None for value in col]
+    if any(value is None and not pd.isna(original) for value, original in zip(values, col)):
+        return None
+    try:
+        return pd.Series(pd.arrays.ArrowExtensionArray(pa.array(values)), index=col.index)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return None
+
+
+def list_json_2_compact_df(list_json, category_max_ratio=CATEGORY_MAX_RATIO):
+    """
+    Memory-optimized counterpart of list_json_2_df: the same columns, but low-cardinality text
+    columns (country, nationality, currency, risk profile, mandate, address parts, ...) are
+    dictionary-encoded and the nested lists of LIST_COLUMNS are Arrow list columns (e.g.
+    list<struct<start_year, end_year, company, position, salary>>) instead of their text.
 
-    return df
+    Use expand_compact_df to get the frame the predictor expects.
+    """
+    df = pd.json_normalize(list_json)
+    columns = {}
+    for column in df.columns:
+        if column in LIST_COLUMNS:
+            list_column = _arrow_list_column(df[column])
+            if list_column is not None:
+                columns[column] = list_column
+                continue
+        columns[column] = cast_column(df[column], column_dtype(column, df[column]))
+        if isinstance(columns[column].dtype, pd.StringDtype):
+            if columns[column].nunique() <= category_max_ratio * len(df):
+                columns[column] = columns[column].astype("category")
+    return pd.DataFrame(columns, index=df.index)
+
+
+def expand_compact_df(df):
+    """Turns a list_json_2_compact_df frame back into the list_json_2_df frame."""
+    columns = {}
+    for column in df.columns:
+        col = df[column]
+        if isinstance(col.dtype, pd.CategoricalDtype):
+            col = col.astype(STRING_DTYPE)
+        elif isinstance(col.dtype, pd.ArrowDtype) and pa.types.is_list(col.dtype.pyarrow_dtype):
+            col = pd.Series([None if value is None else str(value) for value in col.array._pa_array.to_pylist()],
+                            index=col.index, dtype=STRING_DTYPE)
+        columns[column] = col
+    return pd.DataFrame(columns, index=df.index)
+
+
+def frame_memory_report(list_json):
+    """
+    Memory of the list_json_2_df frame against the list_json_2_compact_df frame of the same clients.
 
-def create_data():
+    Returns:
+        pd.DataFrame: Bytes per column (before, after) and the dtype after, largest savings first.
+        The attrs hold the totals ("before", "after").
+    """
+    before = list_json_2_df(list_json)
+    after = list_json_2_compact_df(list_json)
+    report = pd.DataFrame({
+        "before": before.memory_usage(index=False, deep=True),
+        "after": after.memory_usage(index=False, deep=True),
+        "dtype_after": after.dtypes.astype(str),
+    })
+    report = report.assign(saved=report["before"] - report["after"]).sort_values("saved", ascending=False)
+    report.attrs = {"before": int(report["before"].sum()), "after": int(report["after"].sum())}
+    return report
+
+def create_data(client_ids=None):
+    """
+    Builds the frame of the input clients, indexed by the client IDs of read.extract_and_merge_jsons
+    (both number the clients in the same zip order).
+
+    Args:
+        client_ids (set): Only build the rows of these clients, all clients if None.
+    """
     # todo!!!
     input_folder_path = "input"
 
-    df = list_json_2_df(extract_and_merge_jsons_2_list(input_folder_path))
+    list_json = extract_and_merge_jsons_2_list(input_folder_path)
+    all_client_ids = [f"client_{idx}" for idx in range(len(list_json))]
+    selected = [idx for idx, client_id in enumerate(all_client_ids) if client_ids is None or client_id in client_ids]
+    df = list_json_2_df([list_json[idx] for idx in selected])
+    df.index = pd.Index([all_client_ids[idx] for idx in selected], name="client_id")
     print(df.head(2))
     return df
 
 
+def prediction_frame(df, predictor):
+    """
+    The frame to predict on: the columns the predictor was trained on (predictor.features()), in
+    its order. Columns json_normalize gave no client of the frame (e.g. the
+    client_profile.inheritance_details.* fields when no client has an inheritance) are added as
+    missing values of their declared dtype; the label and columns the predictor does not know are
+    dropped.
+    """
+    columns = {}
+    for column in predictor.features():
+        if column in df.columns:
+            columns[column] = df[column]
+        else:
+            missing = pd.Series(None, index=df.index, dtype=object)
+            columns[column] = cast_column(missing, column_dtype(column, missing))
+    return pd.DataFrame(columns, index=df.index)
+
+
+
+
 
+# Trained AutoGluon predictor, relative to the src folder. Override with the environment
+# variables ML_PREDICTOR_PATH (e.g. the deployment predictor of prune_predictor.py) and
+# ML_PREDICTOR_MODEL (a model of that predictor, instead of its best one).
+PREDICTOR_PATH = "ml/ag-20250406_022427"
 
+# Outcomes of ml/intermediate.csv: a prediction of the predictor, or no prediction because the
+# static analysis already rejected the client
+PREDICTED = "predicted"
+RULE_REJECT = "rule-reject"
 
-# import autogluon
-from autogluon.tabular import TabularPredictor
 
+def load_predictor(predictor_path=None):
+    """Loads the trained predictor. AutoGluon is only imported here, so the data helpers work without it."""
+    from autogluon.tabular import TabularPredictor
 
-def ml_stage():
+    with stage("predictor_load"):
+        predictor = TabularPredictor.load(predictor_path or os.getenv("ML_PREDICTOR_PATH", PREDICTOR_PATH),
+                                          require_py_version_match=False)
+    model = os.getenv("ML_PREDICTOR_MODEL")
+    if model:
+        predictor.set_model_best(model)
+    return predictor
 
-    ds = create_data()
 
-    # todo !!! test_ds specify, no label column!!!!!
+def ml_stage(preprocessing_scores=None):
+    """
+    Predicts the input clients and writes ml/intermediate.csv (client_id, label, outcome).
 
-    test_ds = ds.drop(columns=["label"], errors="ignore")
-    # todo!!! specify directory!!!
-    #print(test_ds)
-    predictor = TabularPredictor.load(f"ml/ag-20250406_022427", require_py_version_match=False)
-    y_pred = predictor.predict(test_ds)
+    Args:
+        preprocessing_scores (dict): internal_score.preprocessing per client_id. Only the clients
+            the static analysis permitted are predicted; the others get an empty label and the
+            outcome "rule-reject", as the decision rejects them anyway. All clients are predicted
+            if None.
+    """
+    permitted = None if preprocessing_scores is None else {client_id for client_id, score in preprocessing_scores.items() if score}
+    rule_rejected = [] if preprocessing_scores is None else [client_id for client_id, score in preprocessing_scores.items() if not score]
+
+    if permitted is None or permitted:
+        with stage("ml_frame"):
+            ds = create_data(permitted)
+
+        # todo!!! specify directory!!!
+        predictor = load_predictor()
+        test_ds = prediction_frame(ds, predictor)
+        #print(test_ds)
+        with stage("predict"):
+            y_pred = predictor.predict(test_ds)
+        predicted = pd.DataFrame({"client_id": ds.index, "label": y_pred.to_numpy(), "outcome": PREDICTED})
+    else:
+        predicted = pd.DataFrame({"client_id": [], "label": [], "outcome": []})
 
     #print(y_pred)
-    # Write y_pred into a CSV file
+    # Write y_pred into a CSV file, keyed by client_id and in client order, so the assembly
+    # merge-joins on it
     output_path = "ml/intermediate.csv"
-    y_pred.to_csv(output_path, index=False)
+    predictions = pd.concat([predicted, pd.DataFrame({"client_id": rule_rejected, "label": pd.NA, "outcome": RULE_REJECT})])
+    predictions = predictions.sort_values("client_id", key=lambda client_ids: client_ids.str.rsplit("_", n=1).str[1].astype(int))
+    predictions.to_csv(output_path, index=False)
+    print(f"{len(predicted)} clients predicted, {len(rule_rejected)} rejected by the static analysis")
     print(f"Predictions saved to {output_path}")
     # output is y_pred, pandas.series
\ No newline at end of file
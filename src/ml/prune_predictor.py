@@ -0,0 +1,147 @@
+import os
+import sys
+import time
+import shutil
+
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from final_eval_v1 import PREDICTOR_PATH, extract_and_merge_jsons_2_list, list_json_2_df, load_predictor
+
+# Deployment predictor written by prune_predictor; select it for ml_stage with
+#   ML_PREDICTOR_PATH=ml/ag-deploy
+DEPLOY_PATH = "ml/ag-deploy"
+# Scratch copy the pruned ensembles are fitted into, so the trained artifact stays untouched
+WORK_PATH = "ml/ag-prune-work"
+REPORT_FILE_NAME = "prune_report.csv"
+
+# Largest holdout accuracy the deployment predictor may lose against the full ensemble
+MAX_ACCURACY_LOSS = 0.01
+# Timed predict calls per model; the fastest one counts
+TIMING_REPEATS = 3
+
+ENSEMBLE_PREFIX = "WeightedEnsemble"
+
+
+def make_labelled_frame(clients):
+    """
+    Builds the frame the predictor was trained on: the flattened clients of list_json_2_df with
+    the label as a 0/1 column named "label".
+    """
+    df = list_json_2_df(clients)
+    df = df.rename(columns={"label.label": "label"})
+    df["label"] = df["label"].replace({"Accept": 1, "Reject": 0}).astype(int)
+    return df
+
+
+def _time_predict(predictor, features, model, repeats=TIMING_REPEATS):
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        y_pred = predictor.predict(features, model=model)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return y_pred, best
+
+
+def measure_models(predictor, holdout, reference_model=None):
+    """
+    Measures every model of a predictor on a labelled holdout: accuracy and predict latency
+    (including the base models an ensemble depends on), plus, for each base model, its
+    contribution to the ensemble: the accuracy the reference ensemble loses when it is refitted
+    without that model.
+
+    The leave-one-out ensembles are added to the predictor (see fit_weighted_ensemble), so pass
+    a clone rather than the trained artifact.
+
+    Args:
+        predictor: Loaded TabularPredictor.
+        holdout (pd.DataFrame): Labelled frame (see make_labelled_frame) the models were not trained on.
+        reference_model (str): Model the others are compared against, the predictor's best if None.
+
+    Returns:
+        pd.DataFrame: One row per model with kind, accuracy, accuracy_lost, latency_s, rows_per_s,
+        speedup and contribution, sorted by throughput.
+    """
+    reference_model = reference_model or predictor.model_best
+    features = holdout.drop(columns=["label"])
+    base_models = [model for model in predictor.model_names() if not model.startswith(ENSEMBLE_PREFIX)]
+
+    # Ensembles without each base model in turn, weighted on the same validation predictions
+    left_out = {}
+    for model in base_models:
+        others = [other for other in base_models if other != model]
+        if others:
+            for name in predictor.fit_weighted_ensemble(base_models=others, name_suffix=f"_no_{model}"):
+                left_out[name] = model
+
+    rows = []
+    for model in predictor.model_names():
+        y_pred, latency = _time_predict(predictor, features, model)
+        rows.append({
+            "model": model,
+            "kind": "pruned ensemble" if model in left_out else ("ensemble" if model.startswith(ENSEMBLE_PREFIX) else "base"),
+            "left_out": left_out.get(model),
+            "accuracy": float((y_pred.to_numpy() == holdout["label"].to_numpy()).mean()),
+            "latency_s": latency,
+            "rows_per_s": len(features) / latency,
+        })
+
+    report = pd.DataFrame(rows).set_index("model")
+    reference = report.loc[reference_model]
+    report["accuracy_lost"] = reference["accuracy"] - report["accuracy"]
+    report["speedup"] = report["rows_per_s"] / reference["rows_per_s"]
+    # Accuracy the reference ensemble loses without a base model
+    contribution = report[report["kind"] == "pruned ensemble"].set_index("left_out")["accuracy_lost"]
+    report["contribution"] = report.index.map(contribution)
+    return report.sort_values("rows_per_s", ascending=False)
+
+
+def choose_deployment_model(report, max_accuracy_loss=MAX_ACCURACY_LOSS):
+    """Picks the fastest model within max_accuracy_loss of the reference accuracy."""
+    # Accuracies are fractions of the same holdout, so allow for float rounding at the limit
+    eligible = report[report["accuracy_lost"] <= max_accuracy_loss + 1e-9]
+    return eligible["rows_per_s"].idxmax()
+
+
+def prune_predictor(holdout, predictor_path=PREDICTOR_PATH, deploy_path=DEPLOY_PATH, work_path=WORK_PATH,
+                    max_accuracy_loss=MAX_ACCURACY_LOSS):
+    """
+    Measures the models of a trained predictor and writes a deployment predictor holding only the
+    fastest model (and the base models it needs) within max_accuracy_loss of the full ensemble,
+    together with the report (prune_report.csv) of accuracy lost against throughput gained.
+
+    Args:
+        holdout (pd.DataFrame): Labelled frame, see make_labelled_frame.
+        predictor_path (str): The trained predictor.
+        deploy_path (str): Where to write the deployment predictor. Replaced if it exists.
+        work_path (str): Scratch copy of the trained predictor, removed afterwards.
+        max_accuracy_loss (float): Largest accuracy loss accepted for the deployment model.
+
+    Returns:
+        tuple: (report DataFrame, name of the deployed model).
+    """
+    shutil.rmtree(work_path, ignore_errors=True)
+    working_copy = load_predictor(predictor_path).clone(path=work_path, return_clone=True)
+    try:
+        report = measure_models(working_copy, holdout)
+        model = choose_deployment_model(report, max_accuracy_loss)
+
+        shutil.rmtree(deploy_path, ignore_errors=True)
+        working_copy.clone_for_deployment(path=deploy_path, model=model)
+        report.to_csv(os.path.join(deploy_path, REPORT_FILE_NAME))
+    finally:
+        shutil.rmtree(work_path, ignore_errors=True)
+    return report, model
+
+
+# Example usage
+if __name__ == "__main__":
+    # Labelled clients that were not used for training
+    holdout = make_labelled_frame(extract_and_merge_jsons_2_list("ml/holdout"))
+    report, model = prune_predictor(holdout)
+    print(report[["kind", "accuracy", "accuracy_lost", "rows_per_s", "speedup", "contribution"]].to_string())
+    deployed = report.loc[model]
+    print(f"Deployed {model} to {DEPLOY_PATH}: {deployed['accuracy_lost']:+.2%} accuracy lost, "
+          f"{deployed['speedup']:.1f}x throughput. Select it with ML_PREDICTOR_PATH={DEPLOY_PATH}")
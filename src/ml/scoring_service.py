@@ -0,0 +1,217 @@
+import os
+import sys
+import json
+import time
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Future
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from types import SimpleNamespace
+from urllib.request import Request, urlopen
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from final_eval_v1 import list_json_2_df, prediction_frame, load_predictor
+
+HOST = "127.0.0.1"
+PORT = 8765
+
+# A batch is sent to the predictor once it holds MAX_BATCH_CLIENTS clients or its oldest request
+# has waited MAX_WAIT_MS, whichever comes first
+MAX_BATCH_CLIENTS = 256
+MAX_WAIT_MS = 5
+
+# Latencies kept for the percentiles of /stats
+LATENCY_WINDOW = 10_000
+# Pending connections the listening socket accepts (http.server's default of 5 resets bursts)
+REQUEST_QUEUE_SIZE = 1024
+
+
+def _to_json(result, kind):
+    if kind == "predict_proba":
+        return [{str(label): float(p) for label, p in row.items()} for row in result.to_dict("records")]
+    return [value.item() if isinstance(value, np.generic) else value for value in list(result)]
+
+
+def make_batcher(predictor, max_batch_clients=MAX_BATCH_CLIENTS, max_wait_ms=MAX_WAIT_MS):
+    """
+    Starts the micro-batching thread in front of a loaded predictor. Concurrent requests are
+    collected into one feature frame (the same one ml_stage predicts on, see prediction_frame), so
+    the predictor runs once per batch instead of once per request.
+
+    Args:
+        predictor: Loaded predictor with predict / predict_proba methods.
+        max_batch_clients (int): Most clients per predictor call.
+        max_wait_ms (float): Longest time a request waits for others to join its batch.
+
+    Returns:
+        SimpleNamespace: submit(clients, kind) -> Future of the per-client results, stop(), and
+        stats (batches and clients scored).
+    """
+    requests = queue.Queue()
+    stats = {"batches": 0, "clients": 0}
+    stopped = threading.Event()
+
+    def run_batch(batch):
+        for kind in ("predict", "predict_proba"):
+            pending = [(clients, future) for clients, batch_kind, future in batch if batch_kind == kind]
+            if not pending:
+                continue
+            try:
+                # A batch of a few clients lacks the columns none of them has, e.g. inheritance details
+                features = prediction_frame(list_json_2_df([client for clients, _ in pending for client in clients]), predictor)
+                result = getattr(predictor, kind)(features)
+                values = _to_json(result, kind)
+            except Exception as e:
+                for _, future in pending:
+                    future.set_exception(e)
+                continue
+            stats["batches"] += 1
+            stats["clients"] += len(values)
+            start = 0
+            for clients, future in pending:
+                future.set_result(values[start:start + len(clients)])
+                start += len(clients)
+
+    def loop():
+        while not stopped.is_set():
+            try:
+                first = requests.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            batch = [first]
+            size = len(first[0])
+            deadline = time.monotonic() + max_wait_ms / 1000
+            while size < max_batch_clients:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = requests.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(item)
+                size += len(item[0])
+            run_batch(batch)
+
+    def submit(clients, kind="predict"):
+        if kind not in ("predict", "predict_proba"):
+            raise ValueError(f"Unknown prediction kind {kind}.")
+        future = Future()
+        if not clients:
+            future.set_result([])
+        else:
+            requests.put((list(clients), kind, future))
+        return future
+
+    thread = threading.Thread(target=loop, name="scoring-batcher", daemon=True)
+    thread.start()
+    return SimpleNamespace(submit=submit, stop=stopped.set, stats=stats)
+
+
+def make_scoring_server(predictor, host=HOST, port=PORT, **batcher_kwargs):
+    """
+    Creates the local HTTP scoring service around a loaded predictor.
+
+    Endpoints:
+        POST /predict, POST /predict_proba: body {"clients": [client data dicts]}, answered with
+            {"predictions": [...], "latency_ms": ...}, one prediction per client in order.
+        GET /stats: requests served, batches and latency percentiles in milliseconds.
+
+    Returns:
+        ThreadingHTTPServer: The server; call serve_forever() to run it.
+    """
+    batcher = make_batcher(predictor, **batcher_kwargs)
+    latencies = deque(maxlen=LATENCY_WINDOW)
+    counters = {"requests": 0, "errors": 0}
+    counters_lock = threading.Lock()
+
+    def latency_stats():
+        with counters_lock:
+            values = np.array(latencies) if latencies else np.zeros(1)
+        return {
+            **counters,
+            **batcher.stats,
+            "latency_ms": {f"p{q}": round(float(np.percentile(values, q)), 3) for q in (50, 95, 99)},
+        }
+
+    class ScoringHandler(BaseHTTPRequestHandler):
+        def _reply(self, status, body):
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            if self.path == "/stats":
+                self._reply(200, latency_stats())
+            else:
+                self._reply(404, {"error": f"Unknown endpoint {self.path}"})
+
+        def do_POST(self):
+            start = time.perf_counter()
+            kind = self.path.strip("/")
+            if kind not in ("predict", "predict_proba"):
+                self._reply(404, {"error": f"Unknown endpoint {self.path}"})
+                return
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                predictions = batcher.submit(body["clients"], kind).result()
+            except Exception as e:
+                with counters_lock:
+                    counters["errors"] += 1
+                self._reply(400, {"error": str(e)})
+                return
+            latency_ms = (time.perf_counter() - start) * 1000
+            with counters_lock:
+                latencies.append(latency_ms)
+                counters["requests"] += 1
+            self._reply(200, {"predictions": predictions, "latency_ms": round(latency_ms, 3)})
+
+        def log_message(self, format, *args):
+            # Per-request access logs would dominate the latency of small requests
+            pass
+
+    server = ThreadingHTTPServer((host, port), ScoringHandler, bind_and_activate=False)
+    server.request_queue_size = REQUEST_QUEUE_SIZE
+    server.daemon_threads = True
+    try:
+        server.server_bind()
+        server.server_activate()
+    except Exception:
+        server.server_close()
+        raise
+    server.batcher = batcher
+    return server
+
+
+def score_clients(clients, kind="predict", url=f"http://{HOST}:{PORT}"):
+    """
+    Scores client data dicts with a running scoring service.
+
+    Returns:
+        dict: {"predictions": [...], "latency_ms": ...} as returned by the service.
+    """
+    request = Request(f"{url}/{kind}", data=json.dumps({"clients": clients}).encode("utf-8"),
+                      headers={"Content-Type": "application/json"}, method="POST")
+    with urlopen(request) as response:
+        return json.loads(response.read())
+
+
+# Example usage
+if __name__ == "__main__":
+    start = time.perf_counter()
+    predictor = load_predictor()
+    print(f"Predictor loaded in {time.perf_counter() - start:.1f}s")
+    server = make_scoring_server(predictor)
+    print(f"Scoring service listening on http://{HOST}:{PORT}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.batcher.stop()
+        server.server_close()
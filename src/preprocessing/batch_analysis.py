@@ -0,0 +1,403 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from types import SimpleNamespace
+from mrz import (TD3_LINE_LENGTH, SIMPLIFIED_MIN_LENGTH, FILLER, CHECK_WEIGHTS, CHAR_VALUES, CHECK_DIGITS, TD3_FIELDS,
+                 SIMPLIFIED_FIELDS, check_mrz, mrz_name_fields)
+from fuzzy_matching import full_name, names_equivalent, addresses_equivalent, address_text, text_similarity
+
+# Column-wise modes of the MRZ check (mrz.py) and of the cross-document name and address matching
+# (fuzzy_matching.py) over whole client frames. The static analysis itself runs the compiled
+# rules per client (rules.py): building a client frame from the client dicts costs about as much.
+
+# Documents whose fields become separate columns of the client frame
+DOCUMENTS = ["passport", "client_profile", "account_form"]
+
+# mrz.CHAR_VALUES as a lookup table by character code, -1 for characters an MRZ may not contain
+_CHAR_VALUE_TABLE = np.full(256, -1, dtype=np.int64)
+for _char, _value in CHAR_VALUES.items():
+    _CHAR_VALUE_TABLE[ord(_char)] = _value
+_MRZ_WEIGHTS = np.resize(np.array(CHECK_WEIGHTS, dtype=np.int64), TD3_LINE_LENGTH)
+
+
+def clients_to_frame(clients):
+    """
+    Builds the frame the batch checks run on: one row per client, one object column per
+    document field (e.g. "passport.birth_date", "client_profile.address").
+
+    Unlike pd.json_normalize, every column is kept as object dtype, so a field that is present
+    but null (None) stays distinguishable from an absent field (NaN). The static analysis treats
+    the two differently (e.g. middle_name defaults to "" only when absent).
+
+    Args:
+        clients (list): Client data dicts.
+
+    Returns:
+        pd.DataFrame: The client frame.
+    """
+    columns = {}
+    top_level_keys = dict.fromkeys(key for client_data in clients for key in client_data)
+    for key in top_level_keys:
+        values = [client_data.get(key, np.nan) for client_data in clients]
+        if key not in DOCUMENTS:
+            columns[key] = values
+            continue
+
+        documents = [value if isinstance(value, dict) else {} for value in values]
+        for field in dict.fromkeys(field for document in documents for field in document):
+            columns[f"{key}.{field}"] = [document.get(field, np.nan) for document in documents]
+        # Keep non-dict documents (e.g. a null passport) as they are
+        if any(not isinstance(value, dict) for value in values):
+            columns[key] = [np.nan if isinstance(value, dict) else value for value in values]
+
+    # Explicit object dtype: string inference would turn None (present but null) into NaN (absent)
+    return pd.DataFrame({column: _object_array(values) for column, values in columns.items()}, dtype=object)
+
+
+def _object_array(items):
+    values = np.empty(len(items), dtype=object)
+    values[:] = items
+    return values
+
+
+def _absent(values):
+    # NaN / pd.NA / NaT mark a missing field, an explicit None is a present null value
+    return pd.isna(values) & ~np.equal(values, None).astype(bool)
+
+
+def _field(df, column, default=None):
+    """
+    Extracts one field as an object array, like dict.get(key, default) on every client.
+
+    The field is taken from its own column if there is one, otherwise from the dict-valued
+    parent column (e.g. "client_profile.aum.inheritance" from "client_profile.aum"). Frames
+    flattened by pd.json_normalize without max_level (e.g. final_eval_v1.list_json_2_df) split
+    dict fields into sub-columns, which are regrouped into dicts.
+    """
+    values = np.full(len(df), np.nan, dtype=object)
+    parent, _, key = column.rpartition(".")
+    prefix = column + "."
+    sub_columns = [c for c in df.columns if c.startswith(prefix)]
+
+    if column in df.columns:
+        values[:] = df[column].to_numpy(dtype=object)
+    elif parent in df.columns:
+        values[:] = [
+            parent_value.get(key, np.nan) if isinstance(parent_value, dict) else np.nan
+            for parent_value in df[parent].to_numpy(dtype=object)
+        ]
+    elif sub_columns:
+        present = ~np.column_stack([_absent(df[c].to_numpy(dtype=object)) for c in sub_columns])
+        for row in np.flatnonzero(present.any(axis=1)):
+            values[row] = {
+                c[len(prefix):]: df[c].iat[row] for c, keep in zip(sub_columns, present[row]) if keep
+            }
+
+    for row in np.flatnonzero(_absent(values)):
+        values[row] = default
+    return values
+
+
+_is_str = np.frompyfunc(lambda value: isinstance(value, str), 1, 1)
+_is_dict = np.frompyfunc(lambda value: isinstance(value, dict), 1, 1)
+_truthy = np.frompyfunc(bool, 1, 1)
+
+
+def _mask(ufunc, values):
+    return ufunc(values).astype(bool) if len(values) else np.zeros(0, dtype=bool)
+
+
+def _full_names(first_names, middle_names, last_names):
+    return _object_array([full_name(*names) for names in zip(first_names, middle_names, last_names)])
+
+
+def _fuzzy_differs(left, right, rows, equivalent=names_equivalent):
+    """
+    Column-wise `not equivalent(left, right)` over two object arrays, on the given rows
+    (a mask). Rows whose values are equal are matched without folding, the rest through the
+    cached equivalent.
+    """
+    result = rows & np.not_equal(left, right).astype(bool)
+    for row in np.flatnonzero(result):
+        result[row] = not equivalent(left[row], right[row])
+    return result
+
+
+def _similarities(left, right, rows):
+    """
+    text_similarity over two object arrays of text, on the given rows (a mask); equal texts
+    score 1.0 and 0 edits without folding. The other rows are NaN.
+
+    Returns:
+        tuple: (similarity array, Levenshtein distance array).
+    """
+    similarity = np.full(len(left), np.nan)
+    distance = np.full(len(left), np.nan)
+    same = rows & np.equal(left, right).astype(bool)
+    similarity[same], distance[same] = 1.0, 0
+    for row in np.flatnonzero(rows & ~same):
+        similarity[row], distance[row] = text_similarity(left[row], right[row])
+    return similarity, distance
+
+
+def _arrow_text(values):
+    # Empty text is skipped like a missing field, and so is anything but text
+    try:
+        strings = pa.array(values, type=pa.string(), from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        strings = pa.array([value if isinstance(value, str) else None for value in values], type=pa.string())
+    return pc.if_else(pc.equal(strings, ""), pa.scalar(None, pa.string()), strings)
+
+
+def _arrow_lines(mrz):
+    # The MRZ values as a list<string> column, null where a value is no list of text (Arrow
+    # would read a string as a list of characters)
+    try:
+        return pa.array([value if isinstance(value, (list, tuple)) else None for value in mrz], type=pa.list_(pa.string()))
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return pa.array([
+            value if isinstance(value, (list, tuple)) and all(isinstance(line, str) for line in value) else None
+            for value in mrz
+        ], type=pa.list_(pa.string()))
+
+
+def _true(mask):
+    return pc.fill_null(mask, False).to_numpy(zero_copy_only=False)
+
+
+def _slice(strings, start, end):
+    return pc.utf8_slice_codeunits(strings, start, end)
+
+
+def _known_differs(left, right):
+    # True where both sides are known and differ
+    return pc.fill_null(pc.not_equal(left, right), False).to_numpy(zero_copy_only=False)
+
+
+def _yymmdd_column(dates):
+    iso = pc.fill_null(pc.match_substring_regex(dates, r"^[0-9]{4}-[0-9]{2}-[0-9]{2}$"), False)
+    yymmdd = pc.binary_join_element_wise(_slice(dates, 2, 4), _slice(dates, 5, 7), _slice(dates, 8, 10), "")
+    return pc.if_else(iso, yymmdd, pa.scalar(None, pa.string()))
+
+
+def _failed_check_digits_matrix(line2s):
+    """TD3 check digits of equally long ASCII lines at once: a (lines, CHECK_DIGITS) mask of failures."""
+    chars = np.frombuffer("".join(line2s).encode("ascii"), dtype=np.uint8).reshape(len(line2s), -1)
+    values = _CHAR_VALUE_TABLE[chars]
+    digits = chars.astype(np.int64) - ord("0")
+    is_digit = (digits >= 0) & (digits <= 9)
+    failed = np.zeros((len(line2s), len(CHECK_DIGITS)), dtype=bool)
+    for idx, (name, (ranges, position)) in enumerate(CHECK_DIGITS.items()):
+        checked = np.concatenate([values[:, start:end] for start, end in ranges], axis=1)
+        computed = (checked * _MRZ_WEIGHTS[:checked.shape[1]]).sum(axis=1) % 10
+        failed[:, idx] = (checked < 0).any(axis=1) | ~is_digit[:, position] | (computed != digits[:, position])
+        if name == "personal number":
+            failed[:, idx] &= ~((chars[:, position] == ord(FILLER))
+                                & (chars[:, ranges[0][0]:ranges[0][1]] == ord(FILLER)).all(axis=1))
+    return failed
+
+
+def check_mrz_batch(mrz, passport_number, country_code, birth_date, expiry_date, gender, last_name, first_name, middle_name):
+    """
+    check_mrz over columns of passports. Two lines of text are checked column-wise (the check
+    digits with CHAR_VALUES as a lookup table, the fields as Arrow string columns, the names
+    through the cached mrz_name_fields); anything else goes through check_mrz.
+
+    Args:
+        mrz (array): The passport_mrz value of every passport.
+        passport_number, country_code, birth_date, expiry_date, gender, last_name, first_name,
+        middle_name (array): The passport fields, None (or any non-text value) where missing.
+
+    Returns:
+        SimpleNamespace: readable (bool array), failed_check_digits and mismatches (object arrays
+        of tuples of names), like check_mrz per passport.
+    """
+    n = len(mrz)
+    readable = np.zeros(n, dtype=bool)
+    failed = np.empty(n, dtype=object)
+    failed[:] = [()] * n
+    mismatches = np.empty(n, dtype=object)
+    mismatches[:] = [()] * n
+
+    # Two lines of text, readable by parse_mrz, with an ASCII line 2: checked column-wise
+    lines = _arrow_lines(mrz)
+    if n:
+        two_lines = _true(pc.equal(pc.list_value_length(lines), 2))
+        lines = pc.if_else(pa.array(two_lines), lines, pa.scalar(None, lines.type))
+        line1, line2 = pc.list_element(lines, 0), pc.list_element(lines, 1)
+        line2_length = pc.utf8_length(line2)
+        # _is_td3: a digit at position 9 and none at 10 to 12
+        td3 = _true(pc.match_substring_regex(line2, r"(?s)^.{9}[0-9][^0-9]{3}"))
+        regular = (two_lines & _true(pc.starts_with(line1, "P")) & _true(pc.greater_equal(pc.utf8_length(line1), 6))
+                   & _true(pc.greater_equal(line2_length, SIMPLIFIED_MIN_LENGTH)) & _true(pc.string_is_ascii(line2))
+                   & (_true(pc.greater_equal(line2_length, TD3_LINE_LENGTH)) | ~td3))
+    else:
+        regular = np.zeros(n, dtype=bool)
+    for row in np.flatnonzero(~regular):
+        passport = {
+            "passport_number": passport_number[row], "country_code": country_code[row], "birth_date": birth_date[row],
+            "passport_expiry_date": expiry_date[row], "gender": gender[row], "last_name": last_name[row],
+            "first_name": first_name[row], "middle_name": middle_name[row],
+        }
+        readable[row], failed[row], mismatches[row] = check_mrz(mrz[row], passport)
+
+    rows = np.flatnonzero(regular)
+    if not len(rows):
+        return SimpleNamespace(readable=readable, failed_check_digits=failed, mismatches=mismatches)
+    readable[rows] = True
+    keep = pa.array(regular)
+    line1, line2, td3 = pc.filter(line1, keep), pc.filter(line2, keep), td3[rows]
+
+    # Check digits, TD3 only
+    td3_rows = np.flatnonzero(td3)
+    if len(td3_rows):
+        td3_lines = _slice(pc.take(line2, pa.array(td3_rows)), 0, TD3_LINE_LENGTH).to_pylist()
+        failed_digits = _failed_check_digits_matrix(td3_lines)
+        names = list(CHECK_DIGITS)
+        for idx, failed_row in zip(td3_rows, failed_digits):
+            if failed_row.any():
+                failed[rows[idx]] = tuple(name for name, fails in zip(names, failed_row) if fails)
+
+    # Fields of line 2 at the positions of each layout, sliced as bytes (line 2 is ASCII here)
+    is_td3 = pa.array(td3)
+    line2_bytes = line2.cast(pa.binary())
+
+    def line2_field(name, strip=False):
+        def at(start, end):
+            return pc.binary_slice(line2_bytes, start, end).cast(pa.string())
+        if td3.all() or name not in SIMPLIFIED_FIELDS:
+            values = at(*TD3_FIELDS[name])
+        elif not td3.any():
+            values = at(*SIMPLIFIED_FIELDS[name])
+        else:
+            values = pc.if_else(is_td3, at(*TD3_FIELDS[name]), at(*SIMPLIFIED_FIELDS[name]))
+        return pc.utf8_rtrim(values, FILLER) if strip else values
+
+    def column(values):
+        return _arrow_text(values[rows])
+
+    country_codes = column(country_code)
+    problems = {
+        "passport number": _known_differs(line2_field("number", strip=True), _slice(column(passport_number), 0, 9)),
+        "country code": _known_differs(pc.utf8_rtrim(_slice(line1, 2, 5), FILLER), country_codes)
+                        | _known_differs(line2_field("nationality", strip=True), country_codes),
+        "birth date": _known_differs(line2_field("birth_date"), _yymmdd_column(column(birth_date))),
+    }
+    if td3.any():
+        sex = line2_field("sex")
+        problems["expiry date"] = td3 & _known_differs(line2_field("expiry_date"), _yymmdd_column(column(expiry_date)))
+        problems["gender"] = (td3 & _known_differs(sex, pc.utf8_upper(_slice(column(gender), 0, 1)))
+                              & _true(pc.not_equal(sex, FILLER)))
+
+    # Names: ASCII names written as in the MRZ (the first candidate of mrz_name_fields) match
+    # column-wise, the others go through the cached mrz_name_fields
+    last, first, middle = column(last_name), column(first_name), column(middle_name)
+    name_field = _slice(line1, 5, None)
+    has_names = _true(pc.and_(pc.is_valid(last), pc.is_valid(first)))
+    ascii_names = _true(pc.and_(pc.and_(pc.string_is_ascii(last), pc.string_is_ascii(first)),
+                                pc.fill_null(pc.string_is_ascii(middle), True)))
+    written = pc.binary_join_element_wise(
+        pc.utf8_upper(last), FILLER * 2, pc.utf8_upper(first),
+        pc.if_else(pc.is_valid(middle), pc.binary_join_element_wise(FILLER, pc.utf8_upper(middle), ""), ""), "")
+    fits = _true(pc.less_equal(pc.utf8_length(written), pc.utf8_length(name_field)))
+    width = max(pc.max(pc.utf8_length(name_field)).as_py() or 0, 1)
+    as_written = _true(pc.equal(pc.utf8_rpad(written, width, FILLER), pc.utf8_rpad(name_field, width, FILLER)))
+    name_mismatch = np.zeros(len(rows), dtype=bool)
+    unresolved = np.flatnonzero(has_names & ~(ascii_names & fits & as_written))
+    if len(unresolved):
+        unresolved_rows = pa.array(unresolved)
+        for idx, name_text, last_text, first_text, middle_text in zip(
+                unresolved, pc.take(name_field, unresolved_rows).to_pylist(), pc.take(last, unresolved_rows).to_pylist(),
+                pc.take(first, unresolved_rows).to_pylist(), pc.take(middle, unresolved_rows).to_pylist()):
+            name_mismatch[idx] = name_text not in mrz_name_fields(last_text, first_text, middle_text or "", len(name_text))
+    problems["name"] = name_mismatch
+
+    any_problem = np.zeros(len(rows), dtype=bool)
+    for mask in problems.values():
+        any_problem |= mask
+    for idx in np.flatnonzero(any_problem):
+        mismatches[rows[idx]] = tuple(name for name, mask in problems.items() if mask[idx])
+    return SimpleNamespace(readable=readable, failed_check_digits=failed, mismatches=mismatches)
+
+
+def cross_document_matches(df):
+    """
+    Batch mode of fuzzy_matching.py: compares the names of passport (first, middle and last
+    name), client profile and account form (name, and its first, middle and last name) and the
+    addresses of client profile and account form for a whole client frame.
+
+    Only pairs where both sides are present are compared, and only the pairs that differ are
+    folded and scored; both go through caches, so repeated names cost one lookup.
+
+    Args:
+        df (pd.DataFrame): Client frame (see clients_to_frame).
+
+    Returns:
+        pd.DataFrame: Per pair (e.g. "name.passport_account", "address.profile_account") the
+        columns <pair>.equivalent (equal after folding, as the static analysis checks it),
+        <pair>.similarity (Jaro-Winkler, 0.0 to 1.0) and <pair>.edits (Levenshtein distance);
+        similarity and edits are NaN where a side is missing.
+    """
+    passport_name = _full_names(_field(df, "passport.first_name"), _field(df, "passport.middle_name"),
+                                _field(df, "passport.last_name"))
+    account_parts_name = _full_names(_field(df, "account_form.first_name"), _field(df, "account_form.middle_name"),
+                                     _field(df, "account_form.last_name"))
+    name_profile = _field(df, "client_profile.name")
+    account_name = _field(df, "account_form.name")
+    names = {
+        "passport": np.where(_mask(_truthy, passport_name), passport_name, None),
+        "profile": np.where(_mask(_is_str, name_profile) & _mask(_truthy, name_profile), name_profile, None),
+        "account": np.where(_mask(_is_str, account_name) & _mask(_truthy, account_name), account_name, None),
+    }
+    pairs = [
+        ("name.passport_profile", names["passport"], names["profile"]),
+        ("name.passport_account", names["passport"], np.where(_mask(_truthy, account_parts_name), account_parts_name, None)),
+        ("name.profile_account", names["profile"], names["account"]),
+    ]
+
+    address_profile = _field(df, "client_profile.address")
+    address_account = _field(df, "account_form.address")
+    addresses = [(values, _mask(_is_dict, values) & _mask(_truthy, values)) for values in (address_profile, address_account)]
+    compared = addresses[0][1] & addresses[1][1]
+    address_equal = ~_fuzzy_differs(address_profile, address_account, compared, addresses_equivalent)
+    address_texts = [_object_array([address_text(value) if ok else None for value, ok in zip(values, is_address)])
+                     for values, is_address in addresses]
+
+    columns = {}
+    for pair, left, right in pairs:
+        rows = np.not_equal(left, None).astype(bool) & np.not_equal(right, None).astype(bool)
+        columns[f"{pair}.equivalent"] = rows & ~_fuzzy_differs(left, right, rows)
+        columns[f"{pair}.similarity"], columns[f"{pair}.edits"] = _similarities(left, right, rows)
+    columns["address.profile_account.equivalent"] = compared & address_equal
+    columns["address.profile_account.similarity"], columns["address.profile_account.edits"] = _similarities(
+        address_texts[0], address_texts[1], compared)
+    return pd.DataFrame(columns, index=df.index)
+
+
+# Example usage
+if __name__ == "__main__":
+    import os
+    import json
+
+    clients_json_path = "preprocessing/all_clients"
+    file_names = sorted(os.listdir(clients_json_path), key=lambda name: int(name.split("_")[1].split(".")[0]))
+    clients = []
+    for file_name in file_names:
+        with open(os.path.join(clients_json_path, file_name), "r") as file:
+            clients.append(json.load(file))
+    df = clients_to_frame(clients)
+
+    # The column-wise MRZ check must agree with check_mrz on every passport
+    passport_fields = ["passport_number", "country_code", "birth_date", "passport_expiry_date", "gender", "last_name",
+                       "first_name", "middle_name"]
+    mrz = check_mrz_batch(_field(df, "passport.passport_mrz"), *(_field(df, f"passport.{name}") for name in passport_fields))
+    differing = [
+        idx for idx, client_data in enumerate(clients)
+        if check_mrz(client_data["passport"].get("passport_mrz"), client_data["passport"])
+        != (mrz.readable[idx], mrz.failed_check_digits[idx], mrz.mismatches[idx])
+    ]
+    print(f"MRZ: {int(mrz.readable.sum())} readable, {len(differing)} passports differ from check_mrz {differing[:10]}")
+
+    matches = cross_document_matches(df)
+    print(matches[[column for column in matches.columns if column.endswith(".equivalent")]].sum())
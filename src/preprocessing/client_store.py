@@ -0,0 +1,191 @@
+import os
+import json
+import shutil
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Documents of a client, stored as one column each. Every document is kept as its exact JSON
+# text: Arrow structs cannot round-trip empty objects (e.g. inheritance_details == {}) or
+# leaves with mixed types (e.g. an address "street number" that is sometimes a string), and
+# the static analysis depends on both.
+DOCUMENT_COLUMNS = [
+    "passport",
+    "client_profile",
+    "account_form",
+    "client_description",
+    "label",
+    "internal_score",
+]
+
+PART_FILE_PREFIX = "part-"
+PART_FILE_SUFFIX = ".parquet"
+
+
+def is_client_store(path):
+    """
+    Checks whether a path points to a columnar client store.
+
+    Args:
+        path (str): Path to check.
+
+    Returns:
+        bool: True if the path is a directory containing client store part files.
+    """
+    return os.path.isdir(path) and any(
+        name.startswith(PART_FILE_PREFIX) and name.endswith(PART_FILE_SUFFIX) for name in os.listdir(path)
+    )
+
+
+def _part_files(store_path):
+    if not os.path.exists(store_path):
+        raise FileNotFoundError(f"The client store {store_path} does not exist.")
+    return [
+        os.path.join(store_path, name)
+        for name in sorted(os.listdir(store_path))
+        if name.startswith(PART_FILE_PREFIX) and name.endswith(PART_FILE_SUFFIX)
+    ]
+
+
+def _write_part(store_path, part_idx, client_ids, documents):
+    columns = {"client_id": pa.array(client_ids, pa.string())}
+    for document in DOCUMENT_COLUMNS:
+        columns[document] = pa.array(
+            [None if doc is None else json.dumps(doc, ensure_ascii=False) for doc in documents[document]],
+            pa.string(),
+        )
+    part_path = os.path.join(store_path, f"{PART_FILE_PREFIX}{part_idx:05d}{PART_FILE_SUFFIX}")
+    pq.write_table(pa.table(columns), part_path, compression="zstd")
+
+
+def write_client_store(clients, store_path, partition_size=10000):
+    """
+    Writes clients into a columnar store, one Parquet part file per `partition_size` clients.
+
+    Clients are consumed as a stream, so at most one partition is held in memory. Client IDs are
+    assigned as "client_{idx}" in iteration order, matching the JSON file layout. The parts are
+    written to a temporary directory next to the store, which replaces the store only once every
+    client is written; if the stream fails, the previous store stays as it was.
+
+    Args:
+        clients (iterable): Client data dicts, e.g. from read.iter_client_jsons.
+        store_path (str): Directory of the store. An existing store is replaced.
+        partition_size (int): Number of clients per part file.
+
+    Returns:
+        int: The number of clients written.
+    """
+    store_path = os.path.normpath(store_path)
+    tmp_path = f"{store_path}.tmp"
+    old_path = f"{store_path}.old"
+    for path in (tmp_path, old_path):
+        shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    client_ids = []
+    documents = {document: [] for document in DOCUMENT_COLUMNS}
+    part_idx = 0
+    client_count = 0
+
+    try:
+        for client_data in clients:
+            client_ids.append(f"client_{client_count}")
+            for document in DOCUMENT_COLUMNS:
+                documents[document].append(client_data.get(document))
+            client_count += 1
+
+            if len(client_ids) == partition_size:
+                _write_part(tmp_path, part_idx, client_ids, documents)
+                part_idx += 1
+                client_ids = []
+                documents = {document: [] for document in DOCUMENT_COLUMNS}
+
+        if client_ids:
+            _write_part(tmp_path, part_idx, client_ids, documents)
+    except BaseException:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+
+    # Swap the complete store in
+    if os.path.exists(store_path):
+        os.rename(store_path, old_path)
+    os.rename(tmp_path, store_path)
+    shutil.rmtree(old_path, ignore_errors=True)
+    return client_count
+
+
+def iter_client_store(store_path, documents=None, client_ids=None):
+    """
+    Streams clients from a columnar store, reading only the requested documents.
+
+    Args:
+        store_path (str): Directory of the store.
+        documents (list): Document columns to read, all of DOCUMENT_COLUMNS if None.
+        client_ids (set): Only decode and yield these clients, all clients if None.
+
+    Yields:
+        tuple: (client_id, client data dict). Documents that were never written are omitted.
+    """
+    documents = DOCUMENT_COLUMNS if documents is None else list(documents)
+    selected = None if client_ids is None else set(client_ids)
+    for part_path in _part_files(store_path):
+        table = pq.read_table(part_path, columns=["client_id"] + documents)
+        part_client_ids = table.column("client_id").to_pylist()
+        columns = [(document, table.column(document).to_pylist()) for document in documents]
+        for row, client_id in enumerate(part_client_ids):
+            if selected is not None and client_id not in selected:
+                continue
+            client_data = {}
+            for document, values in columns:
+                if values[row] is not None:
+                    client_data[document] = json.loads(values[row])
+            yield client_id, client_data
+
+
+def read_client_store(store_path, documents=None):
+    """
+    Reads the requested documents of every client in a columnar store.
+
+    Args:
+        store_path (str): Directory of the store.
+        documents (list): Document columns to read, all of DOCUMENT_COLUMNS if None.
+
+    Returns:
+        dict: Client data dicts keyed by client ID, in store order.
+    """
+    return dict(iter_client_store(store_path, documents))
+
+
+def update_client_store(store_path, document, values):
+    """
+    Replaces one document column for the given clients, leaving every other column untouched.
+
+    Args:
+        store_path (str): Directory of the store.
+        document (str): Document column to update, e.g. "internal_score".
+        values (dict): New documents keyed by client ID. Clients not in the dict keep their value.
+    """
+    if document not in DOCUMENT_COLUMNS:
+        raise ValueError(f"Unknown document column {document}.")
+
+    for part_path in _part_files(store_path):
+        table = pq.read_table(part_path)
+        client_ids = table.column("client_id").to_pylist()
+        if not any(client_id in values for client_id in client_ids):
+            continue
+
+        column = table.column(document).to_pylist()
+        for row, client_id in enumerate(client_ids):
+            if client_id in values:
+                column[row] = json.dumps(values[client_id], ensure_ascii=False)
+
+        table = table.set_column(table.schema.get_field_index(document), document, pa.array(column, pa.string()))
+        tmp_path = part_path + ".tmp"
+        pq.write_table(table, tmp_path, compression="zstd")
+        os.replace(tmp_path, part_path)
+
+
+# Example usage
+if __name__ == "__main__":
+    store_path = "preprocessing/client_store"
+    for client_id, client_data in iter_client_store(store_path, documents=["internal_score"]):
+        print(client_id, client_data.get("internal_score"))
@@ -1,26 +1,96 @@
-import pycountry
-from countryinfo import CountryInfo
+import os
+import json
 from functools import lru_cache
 
-@lru_cache(maxsize=None)
+# Prebuilt lookup table, generated from pycountry and countryinfo by build_country_table().
+# Bump the version whenever the table layout changes, and regenerate it with
+#   python preprocessing/country_conversion_helper.py
+COUNTRY_TABLE_VERSION = 1
+COUNTRY_TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "country_table.json")
+
+
 def get_country_info(country_name):
+    from countryinfo import CountryInfo
+
     try:
         return CountryInfo(country_name).info()
     except Exception:
         return {}
 
+
+def build_country_table(table_path=COUNTRY_TABLE_PATH):
+    """
+    Generates the country lookup table from pycountry and countryinfo. Only needed when either
+    library is updated; the analysis itself only reads the generated file.
+
+    Args:
+        table_path (str): Path of the JSON table to write.
+
+    Returns:
+        dict: The table that was written.
+    """
+    import pycountry
+    from importlib.metadata import version
+
+    names = {}
+    demonyms = {}
+    for country in pycountry.countries:
+        # Keys are lowercase, matching pycountry's case-insensitive lookup
+        names[country.alpha_3.lower()] = country.name
+        names[country.alpha_2.lower()] = country.name
+        demonyms[country.alpha_3.lower()] = get_country_info(country.name).get("demonym", "Unknown")
+
+    table = {
+        "version": COUNTRY_TABLE_VERSION,
+        "sources": {"pycountry": version("pycountry"), "countryinfo": version("countryinfo")},
+        "names": names,
+        "demonyms": demonyms,
+    }
+    with open(table_path, "w", encoding="utf-8") as table_file:
+        json.dump(table, table_file, ensure_ascii=False, separators=(",", ":"), sort_keys=True)
+    return table
+
+
+@lru_cache(maxsize=None)
+def load_country_table(table_path=COUNTRY_TABLE_PATH):
+    """
+    Loads the prebuilt country lookup table once per process.
+
+    Returns:
+        tuple: (country name by lowercase alpha-2/alpha-3 code, demonym by lowercase alpha-3 code).
+    """
+    with open(table_path, "r", encoding="utf-8") as table_file:
+        table = json.load(table_file)
+    if table.get("version") != COUNTRY_TABLE_VERSION:
+        raise ValueError(
+            f"Country table {table_path} has version {table.get('version')}, expected {COUNTRY_TABLE_VERSION}. "
+            "Regenerate it with build_country_table()."
+        )
+    return table["names"], table["demonyms"]
+
+
+def get_country_name(country_code):
+    """
+    Resolves an alpha-3 or alpha-2 country code (case-insensitive) to its country name, like
+    pycountry.countries.get(alpha_3=...) or pycountry.countries.get(alpha_2=...).
+
+    Returns:
+        str: The country name, None if the code is unknown.
+    """
+    names, _ = load_country_table()
+    return names.get(country_code.lower())
+
+
 def get_nationality_from_alpha3(alpha3_code):
+    _, demonyms = load_country_table()
     try:
-        country = pycountry.countries.get(alpha_3=alpha3_code.upper())
-        if not country:
-            return "Unknown"
-        
-        country_info = get_country_info(country.name)
-        demonyms = country_info.get("demonym", "Unknown")
-        return demonyms
+        return demonyms.get(alpha3_code.lower(), "Unknown")
     except Exception as e:
         return f"Error: {e}"
 
-# Examples
-for i in range(0, 1000):
-    get_nationality_from_alpha3("USA")
\ No newline at end of file
+
+# Example usage
+if __name__ == "__main__":
+    table = build_country_table()
+    print(f"Country table written to {COUNTRY_TABLE_PATH} ({len(table['names'])} codes, sources {table['sources']})")
+    print(get_country_name("CHE"), get_nationality_from_alpha3("USA"))
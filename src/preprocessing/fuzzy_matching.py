@@ -0,0 +1,160 @@
+import re
+import unicodedata
+from functools import lru_cache
+
+# Normalization and similarity of names and addresses across the client documents.
+#
+# Two texts are equivalent if they agree after folding: case, accents, ICAO transliteration
+# (Müller / Mueller / Muller), apostrophes, hyphens, dots and whitespace. The static analysis
+# only relaxes its exact comparisons to this equivalence; one letter off or names in another
+# order stay inconsistencies. The similarity scores (Jaro-Winkler on the token-sorted folded
+# text, Levenshtein distance) grade how far apart two inconsistent texts are. The column-wise
+# comparison of whole client frames is batch_analysis.cross_document_matches.
+
+# Letters NFKD does not decompose, folded in every variant
+BASE_FOLDING = {"ł": "l", "đ": "d", "ð": "d", "ı": "i", "ħ": "h"}
+# Transliterations of ICAO 9303 part 3 (after casefold, which already turns ß into ss)
+TRANSLITERATION = {"ä": "ae", "ö": "oe", "ü": "ue", "å": "aa", "æ": "ae", "ø": "oe", "œ": "oe", "þ": "th"}
+JARO_WINKLER_PREFIX_WEIGHT = 0.1
+JARO_WINKLER_MAX_PREFIX = 4
+# Address fields in the order address_text joins them
+ADDRESS_FIELDS = ["street name", "street number", "postal code", "city"]
+
+_SEPARATORS = re.compile(r"[\W_]+")
+_APOSTROPHES = str.maketrans("", "", "'’`´")
+
+
+def _strip_accents(text):
+    return "".join(char for char in unicodedata.normalize("NFKD", text) if not unicodedata.combining(char))
+
+
+@lru_cache(maxsize=200_000)
+def fold_variants(text):
+    """
+    Folded forms of a text: case-folded, without accents, apostrophes and punctuation, words
+    separated by single spaces; once with accents dropped (ü -> u) and once transliterated
+    (ü -> ue). E.g. "Jean-Luc  Müller" -> ("jean luc muller", "jean luc mueller").
+    """
+    text = unicodedata.normalize("NFKC", text).casefold().translate(_APOSTROPHES)
+    text = "".join(BASE_FOLDING.get(char, char) for char in text)
+    variants = []
+    for folded in (_strip_accents(text), _strip_accents("".join(TRANSLITERATION.get(char, char) for char in text))):
+        folded = _SEPARATORS.sub(" ", folded).strip()
+        if folded not in variants:
+            variants.append(folded)
+    return tuple(variants)
+
+
+def fold(text):
+    """The canonical folded form of a text (accents dropped), see fold_variants."""
+    return fold_variants(text)[0]
+
+
+def token_sort(text):
+    """The words of a folded text in alphabetical order, e.g. "weber anna" -> "anna weber"."""
+    return " ".join(sorted(text.split()))
+
+
+@lru_cache(maxsize=200_000)
+def names_equivalent(left, right):
+    """Whether two names agree after folding (see fold_variants). The word order counts."""
+    if left == right:
+        return True
+    return not set(fold_variants(left)).isdisjoint(fold_variants(right))
+
+
+def levenshtein(left, right):
+    """Number of single-character insertions, deletions and substitutions between two texts."""
+    if len(left) < len(right):
+        left, right = right, left
+    previous = list(range(len(right) + 1))
+    for idx, left_char in enumerate(left, 1):
+        current = [idx]
+        for jdx, right_char in enumerate(right, 1):
+            current.append(min(previous[jdx] + 1, current[jdx - 1] + 1, previous[jdx - 1] + (left_char != right_char)))
+        previous = current
+    return previous[-1]
+
+
+def jaro_winkler(left, right):
+    """Jaro-Winkler similarity of two texts, 1.0 for equal texts and 0.0 for nothing in common."""
+    if left == right:
+        return 1.0
+    if not left or not right:
+        return 0.0
+    window = max(max(len(left), len(right)) // 2 - 1, 0)
+    left_matched = [False] * len(left)
+    right_matched = [False] * len(right)
+    matches = 0
+    for idx, char in enumerate(left):
+        for jdx in range(max(0, idx - window), min(len(right), idx + window + 1)):
+            if not right_matched[jdx] and right[jdx] == char:
+                left_matched[idx] = right_matched[jdx] = True
+                matches += 1
+                break
+    if not matches:
+        return 0.0
+
+    left_chars = [char for char, matched in zip(left, left_matched) if matched]
+    right_chars = [char for char, matched in zip(right, right_matched) if matched]
+    transpositions = sum(a != b for a, b in zip(left_chars, right_chars)) / 2
+    jaro = (matches / len(left) + matches / len(right) + (matches - transpositions) / matches) / 3
+
+    prefix = 0
+    for a, b in zip(left[:JARO_WINKLER_MAX_PREFIX], right[:JARO_WINKLER_MAX_PREFIX]):
+        if a != b:
+            break
+        prefix += 1
+    return jaro + prefix * JARO_WINKLER_PREFIX_WEIGHT * (1 - jaro)
+
+
+@lru_cache(maxsize=200_000)
+def text_similarity(left, right):
+    """
+    Similarity of two names or addresses: the best Jaro-Winkler score of their token-sorted
+    folded variants, and the fewest edits between their folded variants (word order counts).
+
+    Returns:
+        tuple: (similarity between 0.0 and 1.0, Levenshtein distance).
+    """
+    pairs = [(a, b) for a in fold_variants(left) for b in fold_variants(right)]
+    return (max(jaro_winkler(token_sort(a), token_sort(b)) for a, b in pairs),
+            min(levenshtein(a, b) for a, b in pairs))
+
+
+def full_name(*names):
+    """The non-empty string name parts joined by spaces, e.g. full_name("Anna", "", "Weber") -> "Anna Weber"."""
+    return " ".join(name for name in names if isinstance(name, str) and name)
+
+
+def _address_value(value):
+    return value if isinstance(value, str) else "" if value is None else str(value)
+
+
+def addresses_equivalent(left, right):
+    """
+    Whether two address dicts hold the same fields with values that agree after folding (e.g.
+    "Bahnhofstraße" and "Bahnhofstrasse", 95 and "95"). Anything but two dicts is compared as is.
+    """
+    if left == right:
+        return True
+    if not isinstance(left, dict) or not isinstance(right, dict) or left.keys() != right.keys():
+        return False
+    return all(names_equivalent(_address_value(left[key]), _address_value(right[key])) for key in left)
+
+
+def address_text(address):
+    """An address dict as one line, e.g. "Gertrudstrasse 95 6870 St. Gallen", for the similarity."""
+    if not isinstance(address, dict):
+        return ""
+    keys = [key for key in ADDRESS_FIELDS if key in address] + [key for key in address if key not in ADDRESS_FIELDS]
+    return " ".join(_address_value(address[key]) for key in keys)
+
+
+# Example usage
+if __name__ == "__main__":
+    for left, right in [("Jean-Luc Müller", "jean luc mueller"), ("Bahnhofstraße", "Bahnhofstrasse"),
+                        ("Aada Koskinen", "Apda Koskinen"), ("Anna Katharina Weber", "Weber Katharina Anna")]:
+        similarity, distance = text_similarity(left, right)
+        print(f"{left!r} vs {right!r}: equivalent {names_equivalent(left, right)}, "
+              f"similarity {similarity:.3f}, {distance} edits")
@@ -0,0 +1,21 @@
+from read import extract_and_merge_jsons
+from inconsistency_analysis import load_process_all
+
+
+def preprocessing_stage(input_path, output_path, backend="json"):
+    """
+    Runs the preprocessing stage: unpacks the client zips and runs the static analysis on them.
+
+    Args:
+        input_path (str): Path to the folder containing the client zip files.
+        output_path (str): Path to the folder of client JSON files, or of the columnar client
+            store if backend is "parquet".
+        backend (str): "json" for one file per client, "parquet" for a columnar client store.
+    """
+    extract_and_merge_jsons(input_path, output_path, backend=backend)
+    load_process_all(output_path, backend=backend)
+
+
+# Example usage
+if __name__ == "__main__":
+    preprocessing_stage("input", "preprocessing/all_clients")
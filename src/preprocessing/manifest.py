@@ -0,0 +1,110 @@
+import os
+import json
+import hashlib
+import threading
+from datetime import datetime
+from types import SimpleNamespace
+
+# Per-client record of what each pipeline stage last computed, e.g.
+#   {"version": 1, "stages": {"static_analysis": {"client_0": ["<input digest>", "<stage version>"], ...}}}
+# A client is recomputed by a stage only when the digest of the documents the stage reads or the
+# version of the stage code changed since its entry was recorded. Results that depend on the date
+# as well carry a third element, the time they expire at (e.g. "2027-03-01T00:00:00", when a
+# passport runs out), from which on the client is recomputed too.
+MANIFEST_VERSION = 1
+MANIFEST_SUFFIX = ".manifest.json"
+
+
+def manifest_path_for(data_path):
+    """
+    Manifest of a client folder or client store, kept next to it (e.g. all_clients.manifest.json)
+    so the folder itself only holds client files.
+    """
+    return os.path.normpath(data_path) + MANIFEST_SUFFIX
+
+
+def client_digest(client_data, documents=None):
+    """
+    SHA-256 of the given documents of a client (all of them if None), independent of key order
+    and formatting. Missing documents count as null.
+    """
+    documents = sorted(client_data) if documents is None else documents
+    payload = json.dumps({document: client_data.get(document) for document in documents},
+                         ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def code_version(*paths, extra=None):
+    """
+    Version of a stage: the SHA-256 of the source files and data tables its results depend on,
+    plus any settings (extra) that change them. Missing files are part of the version as well.
+    """
+    sha = hashlib.sha256()
+    for path in paths:
+        sha.update(os.path.basename(path).encode("utf-8"))
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                sha.update(hashlib.sha256(f.read()).digest())
+        else:
+            sha.update(b"missing")
+    sha.update(json.dumps(extra, sort_keys=True, default=str).encode("utf-8"))
+    return sha.hexdigest()
+
+
+def _read_manifest(manifest_path):
+    if not os.path.exists(manifest_path):
+        return {"version": MANIFEST_VERSION, "stages": {}}
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("version") != MANIFEST_VERSION:
+        # An unknown layout is treated as empty, so every client is recomputed once
+        return {"version": MANIFEST_VERSION, "stages": {}}
+    return manifest
+
+
+def open_manifest(manifest_path, stage, version):
+    """
+    Opens the entries of one stage in a manifest file.
+
+    Args:
+        manifest_path (str): The manifest file, created on the first save.
+        stage (str): Stage name, e.g. "static_analysis".
+        version (str): Current version of the stage, see code_version.
+
+    Returns:
+        SimpleNamespace:
+            is_current(client_id, digest, now=None): whether the stage result of the client is up
+                to date, and not expired at now (datetime, default the current time).
+            record(client_id, digest, expires=None): marks the client as computed, with the
+                datetime its result expires at, if any (thread-safe).
+            save(): writes the stage entries back, keeping the other stages of the file.
+            stats: clients recorded in this run ("recomputed").
+    """
+    entries = dict(_read_manifest(manifest_path)["stages"].get(stage, {}))
+    stats = {"recomputed": 0}
+    lock = threading.Lock()
+
+    def is_current(client_id, digest, now=None):
+        entry = entries.get(client_id)
+        if entry is None or entry[:2] != [digest, version]:
+            return False
+        expires = entry[2] if len(entry) > 2 else None
+        return expires is None or (now or datetime.now()).isoformat() < expires
+
+    def record(client_id, digest, expires=None):
+        with lock:
+            entries[client_id] = [digest, version] if expires is None else [digest, version, expires.isoformat()]
+            stats["recomputed"] += 1
+
+    def save():
+        with lock:
+            # Re-read the file so entries other stages saved in the meantime are kept
+            manifest = _read_manifest(manifest_path)
+            manifest["stages"][stage] = entries
+            os.makedirs(os.path.dirname(os.path.abspath(manifest_path)), exist_ok=True)
+            tmp_path = f"{manifest_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(manifest, f, separators=(",", ":"))
+            os.replace(tmp_path, manifest_path)
+
+    return SimpleNamespace(is_current=is_current, record=record, save=save, stats=stats)
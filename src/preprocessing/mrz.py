@@ -0,0 +1,211 @@
+import re
+import unicodedata
+from functools import lru_cache
+from types import SimpleNamespace
+
+# Machine readable zone of a passport, two lines. Two layouts are read:
+#   TD3 (ICAO 9303, 44 characters per line), with check digits:
+#     line 1: P<ISSUER<SURNAME<<GIVEN<NAMES<<<...
+#     line 2: number(9) check nationality(3) birth(YYMMDD) check sex expiry(YYMMDD) check
+#             personal number(14) check composite-check
+#   the simplified layout of the datathon passports (45 characters, no check digits):
+#     line 1: as TD3
+#     line 2: number(9) nationality(3) birth(YYMMDD), padded with "<"
+# They are told apart by line 2: TD3 has a check digit at position 9 followed by the letters (or
+# fillers) of the nationality, the simplified layout a letter of the nationality at position 9.
+TD3_LINE_LENGTH = 44
+SIMPLIFIED_MIN_LENGTH = 18
+FILLER = "<"
+DIGITS = "0123456789"
+
+# Value of every character in the 7-3-1 check digit (0-9, A-Z as 10-35, filler 0). The column-wise
+# check lives in batch_analysis.check_mrz_batch, so importing the rules does not load numpy or pyarrow.
+CHECK_WEIGHTS = (7, 3, 1)
+CHAR_VALUES = {**{str(digit): digit for digit in range(10)},
+               **{chr(ord("A") + idx): 10 + idx for idx in range(26)}, FILLER: 0}
+
+# TD3 check digits of line 2: name -> (ranges of the checked characters, position of the digit)
+CHECK_DIGITS = {
+    "passport number": (((0, 9),), 9),
+    "birth date": (((13, 19),), 19),
+    "expiry date": (((21, 27),), 27),
+    "personal number": (((28, 42),), 42),
+    "composite": (((0, 10), (13, 20), (21, 43)), 43),
+}
+
+# Field positions of line 2 per layout, e.g. the nationality code
+TD3_FIELDS = {"number": (0, 9), "nationality": (10, 13), "birth_date": (13, 19), "sex": (20, 21), "expiry_date": (21, 27)}
+SIMPLIFIED_FIELDS = {"number": (0, 9), "nationality": (9, 12), "birth_date": (12, 18)}
+
+# Transliterations of ICAO 9303 part 3 for letters that do not just lose their accent
+ICAO_TRANSLITERATION = {"Ä": "AE", "Ö": "OE", "Ü": "UE", "ß": "SS", "Å": "AA", "Æ": "AE", "Ø": "OE", "Þ": "TH", "Œ": "OE"}
+ISO_DATE = re.compile(r"[0-9]{4}-[0-9]{2}-[0-9]{2}")
+
+
+def check_digit(text):
+    """ICAO 9303 check digit of text, None if it holds a character an MRZ may not contain."""
+    total = 0
+    for idx, char in enumerate(text):
+        value = CHAR_VALUES.get(char)
+        if value is None:
+            return None
+        total += value * CHECK_WEIGHTS[idx % 3]
+    return total % 10
+
+
+def _is_td3(line2):
+    return len(line2) > 12 and line2[9] in DIGITS and not any(char in DIGITS for char in line2[10:13])
+
+
+def parse_mrz(mrz):
+    """
+    Decodes the two MRZ lines of a passport.
+
+    Args:
+        mrz (list): The lines, as in passport["passport_mrz"].
+
+    Returns:
+        SimpleNamespace: layout ("td3" or "simplified"), issuing_state, name_field (line 1 after
+        the issuing state), surname, given_names, number, nationality, birth_date and (TD3 only,
+        None otherwise) sex and expiry_date as raw YYMMDD/filler text. None if the lines cannot
+        be read.
+    """
+    if not isinstance(mrz, (list, tuple)) or len(mrz) != 2 or not all(isinstance(line, str) for line in mrz):
+        return None
+    line1, line2 = mrz
+    if not line1.startswith("P") or len(line1) < 6 or len(line2) < SIMPLIFIED_MIN_LENGTH:
+        return None
+    td3 = _is_td3(line2)
+    if td3 and len(line2) < TD3_LINE_LENGTH:
+        return None
+
+    fields = TD3_FIELDS if td3 else SIMPLIFIED_FIELDS
+    surname, _, given_names = line1[5:].rstrip(FILLER).partition(FILLER * 2)
+    return SimpleNamespace(
+        layout="td3" if td3 else "simplified",
+        issuing_state=line1[2:5].rstrip(FILLER),
+        name_field=line1[5:],
+        surname=surname.replace(FILLER, " "),
+        given_names=given_names.replace(FILLER, " ").strip(),
+        line2=line2,
+        **{name: line2[start:end].rstrip(FILLER) if name in ("number", "nationality") else line2[start:end]
+           for name, (start, end) in fields.items()},
+        **({} if td3 else {"sex": None, "expiry_date": None}),
+    )
+
+
+def failed_check_digits(parsed):
+    """Names of the TD3 check digits (see CHECK_DIGITS) that do not match, empty for the simplified layout."""
+    if parsed is None or parsed.layout != "td3":
+        return ()
+    line2 = parsed.line2
+    failed = []
+    for name, (ranges, position) in CHECK_DIGITS.items():
+        text = "".join(line2[start:end] for start, end in ranges)
+        digit = line2[position]
+        if name == "personal number" and digit == FILLER and text == FILLER * len(text):
+            # An empty personal number may have a filler as check digit
+            continue
+        if digit not in DIGITS or check_digit(text) != int(digit):
+            failed.append(name)
+    return tuple(failed)
+
+
+def _yymmdd(date_str):
+    # YYMMDD of an ISO date, None for anything the date checks of the static analysis reject
+    if not isinstance(date_str, str) or not ISO_DATE.fullmatch(date_str):
+        return None
+    return date_str[2:4] + date_str[5:7] + date_str[8:10]
+
+
+def _mrz_text(name, transliterate):
+    name = name.upper()
+    if transliterate:
+        name = "".join(ICAO_TRANSLITERATION.get(char, char) for char in name)
+    # Drop the accents of the remaining letters, e.g. É -> E
+    name = "".join(char for char in unicodedata.normalize("NFKD", name) if not unicodedata.combining(char))
+    return re.sub(r"[^A-Z0-9]+", FILLER, name.replace("'", "")).strip(FILLER)
+
+
+@lru_cache(maxsize=100_000)
+def mrz_name_fields(last_name, first_name, middle_name, width):
+    """
+    The name fields of line 1 a passport holder may have, padded or truncated to width: the
+    names in upper case as written (the datathon passports keep accents and spaces), with
+    spaces and hyphens as fillers, with the accents dropped, and transliterated per ICAO
+    (e.g. Ü -> UE).
+    """
+    raw = f"{last_name.upper()}{FILLER * 2}{first_name.upper()}" + (f"{FILLER}{middle_name.upper()}" if middle_name else "")
+    candidates = {raw, raw.replace(" ", FILLER).replace("-", FILLER)}
+    for transliterate in (False, True):
+        given = " ".join(name for name in (first_name, middle_name) if name)
+        candidates.add(f"{_mrz_text(last_name, transliterate)}{FILLER * 2}{_mrz_text(given, transliterate)}")
+    return frozenset(candidate.ljust(width, FILLER)[:width] for candidate in candidates)
+
+
+def mrz_mismatches(parsed, passport):
+    """
+    Passport fields the MRZ disagrees with: "passport number", "country code" (issuing state or
+    nationality), "birth date", "expiry date" and "gender" (TD3 only), "name". Fields that are
+    missing or not text are skipped, the other rules report them.
+
+    Args:
+        parsed (SimpleNamespace): See parse_mrz.
+        passport (dict): The passport document.
+
+    Returns:
+        tuple: Names of the mismatching fields.
+    """
+    if parsed is None:
+        return ()
+
+    def text(key):
+        value = passport.get(key)
+        return value if isinstance(value, str) else None
+
+    mismatches = []
+    passport_number = text("passport_number")
+    if passport_number and parsed.number != passport_number[:9]:
+        mismatches.append("passport number")
+    country_code = text("country_code")
+    if country_code and (parsed.issuing_state != country_code or parsed.nationality != country_code):
+        mismatches.append("country code")
+    birth_date = _yymmdd(passport.get("birth_date"))
+    if birth_date and parsed.birth_date != birth_date:
+        mismatches.append("birth date")
+    if parsed.layout == "td3":
+        expiry_date = _yymmdd(passport.get("passport_expiry_date"))
+        if expiry_date and parsed.expiry_date != expiry_date:
+            mismatches.append("expiry date")
+        gender = text("gender")
+        if gender and parsed.sex != FILLER and parsed.sex != gender[:1].upper():
+            mismatches.append("gender")
+    last_name, first_name, middle_name = text("last_name"), text("first_name"), text("middle_name")
+    if last_name and first_name and parsed.name_field not in mrz_name_fields(last_name, first_name, middle_name or "", len(parsed.name_field)):
+        mismatches.append("name")
+    return tuple(mismatches)
+
+
+def check_mrz(mrz, passport):
+    """
+    Checks the MRZ of one passport.
+
+    Returns:
+        tuple: (readable, names of the failed check digits, names of the mismatching fields).
+    """
+    parsed = parse_mrz(mrz)
+    return parsed is not None, failed_check_digits(parsed), mrz_mismatches(parsed, passport)
+
+
+# Example usage
+if __name__ == "__main__":
+    # Specimen of ICAO 9303 part 4
+    specimen = ["P<UTOERIKSSON<<ANNA<MARIA<<<<<<<<<<<<<<<<<<<", "L898902C36UTO7408122F1204159ZE184226B<<<<<10"]
+    parsed = parse_mrz(specimen)
+    print(parsed)
+    print("Failed check digits:", failed_check_digits(parsed))
+    print("Mismatches:", mrz_mismatches(parsed, {
+        "passport_number": "L898902C3", "country_code": "UTO", "birth_date": "1974-08-12",
+        "passport_expiry_date": "2012-04-15", "gender": "F", "last_name": "Eriksson", "first_name": "Anna",
+        "middle_name": "Maria",
+    }))
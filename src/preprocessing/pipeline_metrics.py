@@ -0,0 +1,296 @@
+import os
+import json
+import time
+import atexit
+import cProfile
+import threading
+from functools import wraps
+from contextlib import contextmanager
+
+# Instrumentation of the pipeline stages: timers (count, total and slowest seconds), counters and
+# histograms, each keyed by a name and labels (e.g. stage_seconds{stage="static_analysis"}).
+#
+# Collection is off unless PIPELINE_METRICS names the export file, e.g.
+#   PIPELINE_METRICS=metrics.prom python assemble_solution.py   (Prometheus text format)
+#   PIPELINE_METRICS=metrics.json python assemble_solution.py   (JSON)
+# which writes the file when the process exits. Disabled, a timed call costs one flag check.
+#
+# PIPELINE_PROFILE=<folder> additionally runs every stage under cProfile and writes
+# <folder>/<stage>.prof (open with pstats or snakeviz). Sampling profilers need no hook:
+#   py-spy record -o profile.svg -- python assemble_solution.py
+# shows the same stage functions.
+METRICS_PATH_ENV = "PIPELINE_METRICS"
+PROFILE_DIR_ENV = "PIPELINE_PROFILE"
+METRIC_PREFIX = "pipeline_"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+
+_state = {"enabled": False, "profile_dir": None, "profiling": False, "export_path": None}
+_lock = threading.Lock()
+_timers = {}
+_counters = {}
+_histograms = {}
+
+
+def enable_metrics(export_path=None, profile_dir=None):
+    """
+    Turns collection on. With an export_path, the metrics are written there when the process exits
+    (see export_metrics); with a profile_dir, stages are profiled as well (see stage).
+    """
+    _state["enabled"] = True
+    if profile_dir:
+        os.makedirs(profile_dir, exist_ok=True)
+        _state["profile_dir"] = profile_dir
+    if export_path and _state["export_path"] is None:
+        atexit.register(lambda: export_metrics(_state["export_path"]))
+    if export_path:
+        _state["export_path"] = export_path
+
+
+def disable_metrics():
+    _state["enabled"] = False
+    _state["profile_dir"] = None
+
+
+def metrics_enabled():
+    return _state["enabled"]
+
+
+def reset_metrics():
+    with _lock:
+        _timers.clear()
+        _counters.clear()
+        _histograms.clear()
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def record_time(name, seconds, **labels):
+    """Adds one timed call of `seconds` to a timer."""
+    if not _state["enabled"]:
+        return
+    key = _key(name, labels)
+    with _lock:
+        timer = _timers.get(key)
+        if timer is None:
+            _timers[key] = [1, seconds, seconds]
+        else:
+            timer[0] += 1
+            timer[1] += seconds
+            timer[2] = max(timer[2], seconds)
+
+
+def increment(name, value=1, **labels):
+    """Adds value to a counter."""
+    if not _state["enabled"]:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, value, buckets=LATENCY_BUCKETS, **labels):
+    """Adds one observation to a histogram. The buckets are fixed by the first observation."""
+    if not _state["enabled"]:
+        return
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = {"buckets": tuple(buckets), "counts": [0] * len(buckets), "count": 0, "sum": 0.0}
+        for idx, bound in enumerate(histogram["buckets"]):
+            if value <= bound:
+                histogram["counts"][idx] += 1
+                break
+        histogram["count"] += 1
+        histogram["sum"] += value
+
+
+@contextmanager
+def timer(name, **labels):
+    """Times the enclosed block into a timer."""
+    if not _state["enabled"]:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_time(name, time.perf_counter() - start, **labels)
+
+
+def timed(name, **labels):
+    """
+    Decorator that times every call of a function into a timer, labelled with the function name
+    unless labels are given. Cheap enough for per-client functions when collection is off.
+    """
+    def decorate(function):
+        function_labels = labels or {"function": function.__name__}
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _state["enabled"]:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record_time(name, time.perf_counter() - start, **function_labels)
+        return wrapper
+    return decorate
+
+
+@contextmanager
+def stage(name):
+    """
+    Times a pipeline stage into stage_seconds{stage=name}. Also usable as a decorator. With a
+    profile folder, the outermost running stage is profiled with cProfile into <folder>/<name>.prof
+    (nested stages are part of it).
+    """
+    if not _state["enabled"]:
+        yield
+        return
+    profiler = None
+    if _state["profile_dir"] and not _state["profiling"]:
+        _state["profiling"] = True
+        profiler = cProfile.Profile()
+        profiler.enable()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_time("stage_seconds", time.perf_counter() - start, stage=name)
+        if profiler is not None:
+            profiler.disable()
+            _state["profiling"] = False
+            profiler.dump_stats(os.path.join(_state["profile_dir"], f"{name}.prof"))
+
+
+def observe_llm_request(seconds, usage=None, **labels):
+    """
+    Records one LLM API request: llm_latency_seconds, llm_requests_total and, if the reply reports
+    its usage, the llm_tokens histograms and llm_tokens_total counters of prompt and completion.
+    """
+    if not _state["enabled"]:
+        return
+    observe("llm_latency_seconds", seconds, **labels)
+    increment("llm_requests_total", **labels)
+    for kind in ("prompt_tokens", "completion_tokens"):
+        tokens = getattr(usage, kind, None)
+        if tokens is not None:
+            observe("llm_tokens", tokens, TOKEN_BUCKETS, kind=kind, **labels)
+            increment("llm_tokens_total", tokens, kind=kind, **labels)
+
+
+def cache_hit_rates():
+    """Hit rate per cache, from the cache_requests_total{cache, result="hit"|"miss"} counters."""
+    requests = {}
+    for (name, labels), value in list(_counters.items()):
+        labels = dict(labels)
+        if name == "cache_requests_total" and "cache" in labels:
+            hits_total = requests.setdefault(labels["cache"], [0, 0])
+            hits_total[1] += value
+            if labels.get("result") == "hit":
+                hits_total[0] += value
+    return {cache: hits / total for cache, (hits, total) in requests.items() if total}
+
+
+def metrics_snapshot():
+    """Returns every metric collected so far as JSON-serializable dicts."""
+    with _lock:
+        return {
+            "timers": [
+                {"name": name, "labels": dict(labels), "count": count, "seconds": total, "max_seconds": slowest}
+                for (name, labels), (count, total, slowest) in sorted(_timers.items())
+            ],
+            "counters": [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(_counters.items())
+            ],
+            "histograms": [
+                {"name": name, "labels": dict(labels), "buckets": list(histogram["buckets"]),
+                 "counts": list(histogram["counts"]), "count": histogram["count"], "sum": histogram["sum"]}
+                for (name, labels), histogram in sorted(_histograms.items())
+            ],
+            "cache_hit_rates": cache_hit_rates(),
+        }
+
+
+def _prometheus_labels(labels, **extra):
+    labels = {**labels, **extra}
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in labels.values())
+    return "{" + ",".join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + "}"
+
+
+def format_prometheus(snapshot):
+    """Renders a metrics_snapshot in the Prometheus text exposition format."""
+    lines = []
+    families = {}
+    for kind in ("timers", "counters", "histograms"):
+        for metric in snapshot[kind]:
+            families.setdefault((kind, metric["name"]), []).append(metric)
+
+    for (kind, name), metrics in families.items():
+        name = METRIC_PREFIX + name
+        if kind == "counters":
+            lines.append(f"# TYPE {name} counter")
+            lines.extend(f"{name}{_prometheus_labels(m['labels'])} {m['value']}" for m in metrics)
+        elif kind == "timers":
+            lines.append(f"# TYPE {name} summary")
+            for m in metrics:
+                lines.append(f"{name}_count{_prometheus_labels(m['labels'])} {m['count']}")
+                lines.append(f"{name}_sum{_prometheus_labels(m['labels'])} {m['seconds']}")
+            lines.append(f"# TYPE {name}_max gauge")
+            lines.extend(f"{name}_max{_prometheus_labels(m['labels'])} {m['max_seconds']}" for m in metrics)
+        else:
+            lines.append(f"# TYPE {name} histogram")
+            for m in metrics:
+                cumulative = 0
+                for bound, count in zip(m["buckets"], m["counts"]):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_prometheus_labels(m['labels'], le=bound)} {cumulative}")
+                lines.append(f"{name}_bucket{_prometheus_labels(m['labels'], le='+Inf')} {m['count']}")
+                lines.append(f"{name}_sum{_prometheus_labels(m['labels'])} {m['sum']}")
+                lines.append(f"{name}_count{_prometheus_labels(m['labels'])} {m['count']}")
+
+    if snapshot["cache_hit_rates"]:
+        lines.append(f"# TYPE {METRIC_PREFIX}cache_hit_rate gauge")
+        lines.extend(f"{METRIC_PREFIX}cache_hit_rate{_prometheus_labels({'cache': cache})} {rate}"
+                     for cache, rate in snapshot["cache_hit_rates"].items())
+    return "\n".join(lines) + "\n"
+
+
+def export_metrics(path):
+    """Writes the collected metrics to path: JSON for a .json file, Prometheus text otherwise."""
+    snapshot = metrics_snapshot()
+    content = json.dumps(snapshot, indent=2) if str(path).endswith(".json") else format_prometheus(snapshot)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+
+
+if os.getenv(METRICS_PATH_ENV) or os.getenv(PROFILE_DIR_ENV):
+    enable_metrics(os.getenv(METRICS_PATH_ENV), os.getenv(PROFILE_DIR_ENV))
+
+
+# Example usage
+if __name__ == "__main__":
+    enable_metrics()
+
+    @timed("feature_seconds")
+    def square(x):
+        return x * x
+
+    with stage("example"):
+        for x in range(1000):
+            square(x)
+            increment("clients_total", stage="example")
+        observe("llm_latency_seconds", 0.42)
+        increment("cache_requests_total", cache="llm", result="hit")
+        increment("cache_requests_total", cache="llm", result="miss")
+    print(format_prometheus(metrics_snapshot()))
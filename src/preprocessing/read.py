@@ -1,63 +1,207 @@
 import zipfile
 import os
 import json
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
-def extract_and_merge_jsons(input_folder, output_folder):
+from manifest import manifest_path_for, client_digest, code_version, open_manifest
+from pipeline_metrics import stage, increment
+
+EXPECTED_JSON_FILES = {
+    "passport.json",
+    "client_profile.json",
+    "client_description.json",
+    "account_form.json",
+    "label.json",
+}
+
+
+def _read_client_zip(client_zip_file, client_zip_name):
+    """
+    Reads the expected JSON documents of a single (inner) client zip.
+
+    Args:
+        client_zip_file (file-like): Open handle of the client zip.
+        client_zip_name (str): Name of the client zip inside the outer zip, used for logging.
+
+    Returns:
+        dict: The client data keyed by document name (e.g. "passport"), empty if nothing was found.
+    """
+    client_data = {}
+    found_files = set()
+
+    with zipfile.ZipFile(client_zip_file) as client_zip:
+        for json_file_name in client_zip.namelist():
+            base_name = os.path.basename(json_file_name)
+            if base_name in EXPECTED_JSON_FILES:
+                with client_zip.open(json_file_name) as json_file:
+                    json_data = json.load(json_file)
+                    key = os.path.splitext(base_name)[0]
+                    client_data[key] = json_data
+                    found_files.add(base_name)
+
+    if client_data:
+        missing = EXPECTED_JSON_FILES - found_files
+        if missing:
+            print(f"[INFO] {client_zip_name} is missing: {missing}")
+    return client_data
+
+
+def _list_client_zips(input_folder):
+    """
+    Lists the client zips of every outer zip in the input folder, in processing order.
+
+    Args:
+        input_folder (str): Path to the folder containing zip files.
+
+    Returns:
+        list: (outer zip path, sorted list of client zip names) tuples.
+    """
+    outer_zips = []
+    for zip_file_name in sorted(os.listdir(input_folder)):
+        zip_file_path = os.path.join(input_folder, zip_file_name)
+
+        if zipfile.is_zipfile(zip_file_path):
+            with zipfile.ZipFile(zip_file_path, 'r') as outer_zip:
+                client_zip_names = [name for name in sorted(outer_zip.namelist()) if name.endswith('.zip')]
+            outer_zips.append((zip_file_path, client_zip_names))
+    return outer_zips
+
+
+def _read_client_shard(shard):
+    """
+    Worker entry point: reads a contiguous run of client zips from one outer zip.
+
+    Args:
+        shard (tuple): (outer zip path, list of client zip names).
+
+    Returns:
+        list: The non-empty client data dicts, in the order of the given names.
+    """
+    zip_file_path, client_zip_names = shard
+    clients = []
+    with zipfile.ZipFile(zip_file_path, 'r') as outer_zip:
+        for client_zip_name in client_zip_names:
+            with outer_zip.open(client_zip_name) as client_zip_file:
+                client_data = _read_client_zip(client_zip_file, client_zip_name)
+            if client_data:
+                clients.append(client_data)
+    return clients
+
+
+def iter_client_jsons(input_folder, num_workers=1, shard_size=256):
+    """
+    Streams the merged client data of nested zip files, one client dict at a time.
+
+    Clients are yielded in the same order in both modes (outer zips sorted by name, client
+    zips sorted by name), so enumerating the generator gives deterministic client indices.
+
+    Args:
+        input_folder (str): Path to the folder containing zip files.
+        num_workers (int): Number of worker processes. 1 reads sequentially in this process.
+        shard_size (int): Number of client zips handed to a worker at once (parallel mode only).
+
+    Yields:
+        dict: The client data keyed by document name.
+    """
+    if not os.path.exists(input_folder):
+        raise FileNotFoundError(f"The folder {input_folder} does not exist.")
+
+    if num_workers <= 1:
+        for zip_file_path, client_zip_names in _list_client_zips(input_folder):
+            with zipfile.ZipFile(zip_file_path, 'r') as outer_zip:
+                for client_zip_name in client_zip_names:
+                    with outer_zip.open(client_zip_name) as client_zip_file:
+                        client_data = _read_client_zip(client_zip_file, client_zip_name)
+                    if client_data:
+                        yield client_data
+        return
+
+    shards = [
+        (zip_file_path, client_zip_names[start:start + shard_size])
+        for zip_file_path, client_zip_names in _list_client_zips(input_folder)
+        for start in range(0, len(client_zip_names), shard_size)
+    ]
+
+    # Keep a bounded window of shards in flight and consume them in submission order,
+    # so memory stays proportional to the window and the numbering stays deterministic.
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        pending = deque()
+        shard_iter = iter(shards)
+        for shard in shard_iter:
+            pending.append(executor.submit(_read_client_shard, shard))
+            if len(pending) >= 2 * num_workers:
+                break
+        while pending:
+            clients = pending.popleft().result()
+            next_shard = next(shard_iter, None)
+            if next_shard is not None:
+                pending.append(executor.submit(_read_client_shard, next_shard))
+            yield from clients
+
+
+@stage("extract_and_merge_jsons")
+def extract_and_merge_jsons(input_folder, output_folder, num_workers=1, indent=4, backend="json"):
     """
     Extracts and merges JSON files from nested zip files in the input folder.
 
+    Clients are streamed from the zips and written as they are read, so memory use does not
+    grow with the number of clients. Clients whose documents are unchanged since the last run
+    (see manifest.py) keep their file, including the internal_score of the static analysis.
+
     Args:
         input_folder (str): Path to the folder containing zip files.
         output_folder (str): Path to the output JSON files where merged data will be stored.
+        num_workers (int): Number of worker processes used to unpack the client zips.
+        indent (int): Indentation of the written JSON files, None for compact output.
+        backend (str): "json" for one file per client, "parquet" for a columnar client store
+            (see client_store.py) at output_folder.
     """
     if not os.path.exists(input_folder):
         raise FileNotFoundError(f"The folder {input_folder} does not exist.")
-    
-    merged_data = []
 
-    expected_json_files = {
-        "passport.json",
-        "client_profile.json",
-        "client_description.json",
-        "account_form.json",
-        "label.json",
-    }
+    ingest = open_manifest(manifest_path_for(output_folder), "ingest", code_version(__file__))
 
-    for zip_file_name in sorted(os.listdir(input_folder)):
-        zip_file_path = os.path.join(input_folder, zip_file_name)
-        
-        if zipfile.is_zipfile(zip_file_path):
-            with zipfile.ZipFile(zip_file_path, 'r') as outer_zip:
-                for client_zip_name in sorted(outer_zip.namelist()):
-                    if client_zip_name.endswith('.zip'):
-                        with outer_zip.open(client_zip_name) as client_zip_file:
-                            with zipfile.ZipFile(client_zip_file) as client_zip:
-                                client_data = {}
-                                found_files = set()
-
-                                for json_file_name in client_zip.namelist():
-                                    base_name = os.path.basename(json_file_name)
-                                    if base_name in expected_json_files:
-                                        with client_zip.open(json_file_name) as json_file:
-                                            json_data = json.load(json_file)
-                                            key = os.path.splitext(base_name)[0]
-                                            client_data[key] = json_data
-                                            found_files.add(base_name)
-
-                                if client_data:
-                                    missing = expected_json_files - found_files
-                                    if missing:
-                                        print(f"[INFO] {client_zip_name} is missing: {missing}")
-                                    merged_data.append(client_data)
+    if backend == "parquet":
+        from client_store import is_client_store, iter_client_store, write_client_store
+
+        # The store is rewritten as a whole, so carry the internal_score of unchanged clients over
+        previous = dict(iter_client_store(output_folder, documents=["internal_score"])) if is_client_store(output_folder) else {}
+
+        def keep_unchanged_scores(clients):
+            for idx, client_data in enumerate(clients):
+                client_id = f"client_{idx}"
+                digest = client_digest(client_data)
+                if ingest.is_current(client_id, digest) and "internal_score" in previous.get(client_id, {}):
+                    client_data["internal_score"] = previous[client_id]["internal_score"]
+                else:
+                    ingest.record(client_id, digest)
+                yield client_data
+
+        client_count = write_client_store(keep_unchanged_scores(iter_client_jsons(input_folder, num_workers=num_workers)), output_folder)
+        ingest.save()
+        increment("clients_total", client_count, stage="extract_and_merge_jsons")
+        print(f"Merged client store written to {output_folder}")
+        print(f"Total number of clients processed: {client_count}, new or changed: {ingest.stats['recomputed']}")
+        return
 
     os.makedirs(output_folder, exist_ok=True)
-    for idx, client_data in enumerate(merged_data):
-        client_file_path = os.path.join(output_folder, f"client_{idx}.json")
+    client_count = 0
+    for idx, client_data in enumerate(iter_client_jsons(input_folder, num_workers=num_workers)):
+        client_id = f"client_{idx}"
+        client_file_path = os.path.join(output_folder, f"{client_id}.json")
+        client_count += 1
+        digest = client_digest(client_data)
+        if ingest.is_current(client_id, digest) and os.path.exists(client_file_path):
+            continue
         with open(client_file_path, 'w') as client_file:
-            json.dump(client_data, client_file, indent=4)
+            json.dump(client_data, client_file, indent=indent)
+        ingest.record(client_id, digest)
+    ingest.save()
+    increment("clients_total", client_count, stage="extract_and_merge_jsons")
 
     print(f"Merged JSON data written to {output_folder}")
-    print(f"Total number of clients processed: {len(merged_data)}")
+    print(f"Total number of clients processed: {client_count}, new or changed: {ingest.stats['recomputed']}")
 
 
 # Example usage